@@ -18,6 +18,7 @@ __all__ = [  # noqa: F405
     'mime',
     'maturity_model_parser',
     'namespace',
+    'ntriples',
     'persona_parser',
     's3',
     'sparql',
@@ -43,6 +44,7 @@ from .main import *  # noqa: F405 F403
 from .mime import *  # noqa: F405 F403
 from .maturity_model_parser import *  # noqa: F405 F403
 from .namespace import *  # noqa: F405 F403
+from .ntriples import *
 from .persona_parser import *  # noqa: F405 F403
 from .s3 import *  # noqa: F405 F403
 from .sparql import *  # noqa: F405 F403
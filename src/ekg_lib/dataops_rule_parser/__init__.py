@@ -1 +1,10 @@
-from .parse import DataopsRuleParser, add_dataops_rule_namespaces  # noqa: F401
+from .closure import OntologyClosure, ontology_closure
+from .parse import DataopsRuleParser, add_dataops_rule_namespaces, set_cli_params
+
+__all__ = [
+    'DataopsRuleParser',
+    'OntologyClosure',
+    'add_dataops_rule_namespaces',
+    'ontology_closure',
+    'set_cli_params',
+]
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+import threading
+from importlib.metadata import version
+from pathlib import Path
+from typing import Any
+
+from rdflib import Graph, URIRef
+
+from ..kgiri import namespace as kgiri_namespace
+from ..log import log_item, warning
+from ..main import load_rdf_file_into_graph
+from ..main.inference import (
+    DEFAULT_RULES,
+    RULE_THING,
+    RuleInference,
+    owlrl_closure,
+)
+
+Triple = tuple[Any, Any, Any]
+
+DEFAULT_CACHE_DIR = Path.home() / '.cache' / 'ekg_lib' / 'ontology-closure'
+
+_closures: dict[str, OntologyClosure] = {}
+_closures_lock = threading.Lock()
+
+
+def ontology_closure(
+    ontology_files: list[Path], cache_dir: Path | None = None
+) -> OntologyClosure:
+    """
+    Return the closure of the given ontology files, computing it only if it's not in
+    memory yet and not in the cache directory either.
+    """
+    key = OntologyClosure.cache_key(ontology_files)
+    with _closures_lock:
+        closure = _closures.get(key)
+        if closure is None:
+            closure = _closures[key] = OntologyClosure(key, ontology_files, cache_dir)
+    return closure
+
+
+class OntologyClosure:
+    """
+    The OWL-RL closure of a set of ontologies (the TBox), computed once and then used to
+    infer the ABox facts of any number of rule files without running the reasoner again.
+
+    Running the full reasoner over a rule file plus the ontologies mostly re-derives the
+    same ontology facts over and over. Since rule files only contain individuals, the only
+    things that are left to infer for them are the types and property values that follow
+    from the (already closed) class and property hierarchies, domains, ranges and inverses
+    in the ontology, which `infer()` does with a `RuleInference`.
+
+    The closure is persisted in the cache directory, keyed by a hash of the ontology files,
+    the RDFLib and OWL-RL versions and the KGIRI settings. It's pickled rather than
+    serialized as RDF because OWL-RL also produces triples with literals as subject.
+    """
+
+    def __init__(
+        self, key: str, ontology_files: list[Path], cache_dir: Path | None = None
+    ) -> None:
+        self.key = key
+        self.graph = Graph()
+        self.bindings: list[tuple[str, URIRef]] = []
+        cache_file = cache_dir / f'{key}.pickle' if cache_dir else None
+        if not (cache_file and self.load(cache_file)):
+            for ontology_file in ontology_files:
+                self.load_ontology(ontology_file)
+            owlrl_closure(self.graph)
+            if cache_file:
+                self.save(cache_file)
+        self.triples: list[Triple] = list(self.graph)
+        self._index()
+
+    def load(self, cache_file: Path) -> bool:
+        if not cache_file.exists():
+            return False
+        try:
+            with cache_file.open('rb') as f:
+                content = pickle.load(f)
+            bindings = content['bindings']
+            triples = content['triples']
+        except (OSError, EOFError, pickle.UnpicklingError, KeyError, TypeError) as err:
+            warning(f'Ignoring unreadable ontology closure cache {cache_file}: {err}')
+            return False
+        log_item('Ontology closure', cache_file)
+        self.bindings = bindings
+        self.graph.addN((s, p, o, self.graph) for s, p, o in triples)
+        return True
+
+    def load_ontology(self, ontology_file: Path) -> None:
+        log_item('Loading Ontology', ontology_file)
+        # parse into a graph without any bindings so that we know the prefixes of the file
+        ontology = Graph(bind_namespaces='none')
+        load_rdf_file_into_graph(ontology, ontology_file)
+        self.bindings.extend(ontology.namespaces())
+        self.graph.addN((s, p, o, self.graph) for s, p, o in ontology)
+
+    def bind(self, g: Graph) -> None:
+        """Bind the prefixes of the ontology files in g, like parsing them into g would"""
+        for prefix, namespace in self.bindings:
+            g.bind(prefix, namespace)
+
+    @staticmethod
+    def cache_key(ontology_files: list[Path]) -> str:
+        digest = hashlib.sha256()
+        for item in (
+            version('rdflib'),
+            version('owlrl'),
+            str(kgiri_namespace.kgiri_base),
+            str(kgiri_namespace.kgiri_base_replace),
+        ):
+            digest.update(item.encode('utf-8'))
+            digest.update(b'\0')
+        for ontology_file in ontology_files:
+            digest.update(ontology_file.read_bytes())
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def save(self, cache_file: Path) -> None:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        # write to a temporary file first, other processes may be reading the cache
+        tmp_file = cache_file.with_suffix(f'.{os.getpid()}.tmp')
+        with tmp_file.open('wb') as f:
+            pickle.dump(
+                {'bindings': self.bindings, 'triples': list(self.graph)},
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        tmp_file.replace(cache_file)
+        log_item('Saved ontology closure', cache_file)
+
+    def _index(self) -> None:
+        self.inference = RuleInference(self.graph, (*DEFAULT_RULES, RULE_THING))
+
+    def infer(self, g: Graph) -> None:
+        """Add the facts about the individuals in g that follow from the ontology"""
+        self.inference.expand(g, exclude=set(self.triples))
@@ -4,7 +4,6 @@ from itertools import chain
 from pathlib import Path
 from typing import Any
 
-import owlrl
 import rdflib
 from rdflib import OWL, RDF, RDFS, XSD, Graph, Literal, URIRef
 
@@ -19,6 +18,7 @@ from ..kgiri import set_cli_params as kgiri_set_cli_params
 from ..log import error, log_error, log_iri, log_item, log_list, warning
 from ..main import load_rdf_file_into_graph
 from ..namespace import DATAOPS, DATASET, PROV, RAW, RULE
+from .closure import DEFAULT_CACHE_DIR, OntologyClosure, ontology_closure
 
 OWL._fail = (
     False  # workaround for this issue: https://github.com/RDFLib/OWL-RL/issues/53
@@ -36,6 +36,15 @@ def check_ontologies(ontologies_root: Path) -> Path:
     return ontologies_root
 
 
+def set_cli_params(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        '--ontology-cache-dir',
+        help='The directory where the inferred closure of the ontologies is cached, '
+        'can also be set with env var EKG_ONTOLOGY_CACHE_DIR',
+        default=os.getenv('EKG_ONTOLOGY_CACHE_DIR', str(DEFAULT_CACHE_DIR)),
+    )
+
+
 def add_dataops_rule_namespaces(rule_graph: Graph) -> None:
     rule_graph.base = EKG_NS['KGIRI']
     rule_graph.bind('kgiri', EKG_NS['KGIRI'])
@@ -54,9 +63,13 @@ class DataopsRuleParser:
     This is driven by the presence of the approprate triple e.g rule a rule:TransformationRule
     Each of these `.sparql_endpoint` files is then imported (its contents) into a new version of
     the `rule.ttl` file
+
+    The closure of the ontologies is only computed once (and cached in `--ontology-cache-dir`),
+    per rule file only the facts about the rules themselves are inferred.
     """
 
     g: rdflib.Graph
+    closure: OntologyClosure
 
     def __init__(
         self,
@@ -78,6 +91,10 @@ class DataopsRuleParser:
         if self.args.ontologies_root is None:
             error(' Rule Parser requires --ontologies-root to be specified')
         self.ontologies_root = check_ontologies(Path(self.args.ontologies_root))
+        ontology_cache_dir = getattr(args, 'ontology_cache_dir', None)
+        self.ontology_cache_dir = (
+            Path(ontology_cache_dir) if ontology_cache_dir else None
+        )
 
     def check(self) -> int:
         self.g = self.read_rule_file()
@@ -99,26 +116,16 @@ class DataopsRuleParser:
         # exit(1)
         return 0
 
-    def load_ontology(self, ontology_file_name: Path) -> None:
-        log_item('Loading Ontology', ontology_file_name)
-        load_rdf_file_into_graph(self.g, ontology_file_name)
-
     def load_ontologies(self) -> None:
-        for ontology_file_name in ontology_file_names:
-            self.load_ontology(self.ontologies_root / ontology_file_name)
+        self.closure = ontology_closure(
+            [self.ontologies_root / name for name in ontology_file_names],
+            self.ontology_cache_dir,
+        )
+        self.closure.bind(self.g)
+        self.g.addN((s, p, o, self.g) for s, p, o in self.closure.triples)
 
     def rdfs_infer(self) -> None:
-        owlrl.RDFSClosure.RDFS_Semantics(self.g, True, True, True)
-        closure_class = owlrl.return_closure_class(
-            owl_closure=True, rdfs_closure=True, owl_extras=True, trimming=True
-        )
-        owlrl.DeductiveClosure(
-            closure_class,
-            improved_datatypes=False,
-            rdfs_closure=True,
-            axiomatic_triples=False,
-            datatype_axioms=False,
-        ).expand(self.g)
+        self.closure.infer(self.g)
 
     def rdfs_remove_tbox_stuff(self) -> None:
         """
@@ -303,6 +310,7 @@ def main() -> int:
     parser.add_argument(
         '--ontologies-root', help='The root directory where ontologies can be found'
     )
+    set_cli_params(parser)
     kgiri_set_cli_params(parser)
     data_source_set_cli_params(parser)
     args = parser.parse_args()
@@ -1,4 +1,6 @@
 import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import Any
 
@@ -8,22 +10,45 @@ from rdflib import Graph, URIRef
 from rdflib.namespace import RDF
 
 from ..data_source import set_cli_params as data_source_set_cli_params
-from ..dataops_rule_parser import (  # type: ignore[attr-defined]
-    DataopsRuleParser,
-    add_dataops_rule_namespaces,
-)
+from ..dataops_rule_parser import DataopsRuleParser, add_dataops_rule_namespaces
+from ..dataops_rule_parser import set_cli_params as rule_parser_set_cli_params
 from ..dataset.various import export_graph
 from ..git import set_cli_params as git_set_cli_params
 from ..kgiri import EKG_NS, set_kgiri_base, set_kgiri_base_replace
+from ..kgiri import namespace as kgiri_namespace
 from ..kgiri import set_cli_params as kgiri_set_cli_params
 from ..log import error, log, log_error, log_iri, log_item, warning
 from ..namespace import RAW
 from ..s3 import S3ObjectStore
 from ..s3 import set_cli_params as s3_set_cli_params
 
+Triple = tuple[Any, Any, Any]
+
+
+def _init_worker(kgiri_base: str | None, kgiri_base_replace: str | None) -> None:
+    """Worker processes don't inherit the KGIRI settings of the parent, set them again"""
+    if kgiri_base:
+        set_kgiri_base(kgiri_base)
+    set_kgiri_base_replace(kgiri_base_replace)
+
+
+def parse_rule_file(args: Any, rule_file: Path, rule_file_iri: URIRef) -> list[Triple]:
+    """Parse (and infer) one rule file and return the resulting triples"""
+    processor = DataopsRuleParser(
+        args, input_file_name=str(rule_file), rule_file_iri=rule_file_iri
+    )
+    processor.check()
+    return list(processor.g)
+
 
 class DataopsRulesCapture:
-    """Captures all rule files from a given directory and uploads the resulting file to S3"""
+    """
+    Captures all rule files from a given directory and uploads the resulting file to S3
+
+    Parsing a rule file includes running the OWL-RL reasoner over it, which is CPU bound,
+    so with `--max-workers` greater than 1 the rule files are parsed in a pool of worker
+    processes. The results are merged in the same (sorted) order as a sequential run.
+    """
 
     g: rdflib.Graph
 
@@ -38,6 +63,8 @@ class DataopsRulesCapture:
             if not Path(root_dir).exists():
                 error(f'The provided rules root directory does not exist: {root_dir}')
         log_item('Git Branch', self.args.git_branch)
+        self.max_workers = getattr(args, 'max_workers', None) or 1
+        self.rule_files: list[tuple[Path, URIRef]] = []
         self.g = Graph()
         add_dataops_rule_namespaces(self.g)
 
@@ -47,6 +74,7 @@ class DataopsRulesCapture:
             log_item('Rules Directory', directory.stem)
         for directory in rules_directories:
             self.capture_rules_directory(directory)
+        self.parse_rule_files()
         log('Finished Capture Phase')
 
     def rules_directories_to_capture(self) -> list[Path]:
@@ -99,12 +127,39 @@ class DataopsRulesCapture:
         rule_file_iri = EKG_NS['KGIRI'].term('dataops-rule-file')
         self.g.add((rule_file_iri, RDF.type, RAW.term('DataopsRuleFile')))
         self.g.add((rule_file_iri, RAW.term('inRuleDirectory'), rule_directory_iri))
-        processor = DataopsRuleParser(
-            self.args, input_file_name=str(rule_file), rule_file_iri=rule_file_iri
-        )
-        processor.check()
-        for triple in processor.g:
-            self.g.add(triple)
+        self.rule_files.append((rule_file, rule_file_iri))
+
+    def parse_rule_files(self) -> None:
+        """Parse all rule files collected by capture_rule_file and merge them into self.g"""
+        rule_files = self.rule_files
+        self.rule_files = []
+        max_workers = min(self.max_workers, len(rule_files))
+        log_item('Rule files', len(rule_files))
+        log_item('Max workers', max_workers)
+        if max_workers <= 1:
+            for rule_file, rule_file_iri in rule_files:
+                self.merge(parse_rule_file(self.args, rule_file, rule_file_iri))
+            return
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(
+                kgiri_namespace.kgiri_base,
+                kgiri_namespace.kgiri_base_replace,
+            ),
+        ) as pool:
+            # map() returns the results in the order of rule_files, whatever the order
+            # in which the workers finish
+            for triples in pool.map(
+                parse_rule_file,
+                [self.args] * len(rule_files),
+                [rule_file for rule_file, _ in rule_files],
+                [rule_file_iri for _, rule_file_iri in rule_files],
+            ):
+                self.merge(triples)
+
+    def merge(self, triples: list[Triple]) -> None:
+        self.g.addN((s, p, o, self.g) for s, p, o in triples)
 
     def s3_file_name(self) -> str:
         return f'raw-data-dataops-rules-{self.data_source_code}.ttl.gz'
@@ -147,6 +202,14 @@ def main() -> int:
         help='The root directory where ontologies can be found',
         required=True,
     )
+    parser.add_argument(
+        '--max-workers',
+        help='Maximum number of processes that parse rule files concurrently, '
+        'can also be set with env var EKG_CAPTURE_MAX_WORKERS',
+        type=int,
+        default=int(os.getenv('EKG_CAPTURE_MAX_WORKERS', '1')),
+    )
+    rule_parser_set_cli_params(parser)
     git_set_cli_params(parser)
     data_source_set_cli_params(parser)
     kgiri_set_cli_params(parser)
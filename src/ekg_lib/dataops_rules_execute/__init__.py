@@ -1 +1,2 @@
+from .dag import RuleDag  # noqa: F401
 from .execute import DataopsRulesExecute, main  # noqa: F401
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import threading
+from collections.abc import Iterable
+from pathlib import Path
+
+from rdflib import Graph, URIRef
+
+from ..log import log_item, warning
+from ..namespace import RULE
+
+
+def rule_hash(graph: Graph, rule_iri: URIRef) -> str:
+    """Return a hash of everything that determines what the given rule does"""
+    digest = hashlib.sha256()
+    for predicate in (RULE.sparqlQueryType, RULE.hasSPARQLRule):
+        for value in sorted(str(o) for o in graph.objects(rule_iri, predicate)):
+            digest.update(value.encode('utf-8'))
+            digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class RuleCache:
+    """
+    Local cache file that allows DataopsRulesExecute to skip rules that have not changed.
+
+    For each rule the cache records the hash of its SPARQL and for each dataset the
+    fingerprint of the content of all its graphs (including the raw input graphs the rules
+    read) at the end of the last successful run. A rule is skipped when its hash is
+    unchanged, the dataset still has that fingerprint (so nothing else touched it in the
+    meantime) and none of the rules it depends on had to be executed.
+    """
+
+    def __init__(
+        self, path: Path, graph_iri: str, fingerprint: str | None, force: bool = False
+    ) -> None:
+        self.path = path
+        self.graph_iri = graph_iri
+        self.fingerprint = fingerprint
+        self.force = force
+        self.graphs: dict[str, str] = {}
+        self.rules: dict[str, str] = {}
+        self.executed: set[URIRef] = set()
+        self.skipped: set[URIRef] = set()
+        self._lock = threading.Lock()
+        if path.exists():
+            try:
+                content = json.loads(path.read_text(encoding='utf-8'))
+                self.graphs = content.get('graphs', {})
+                self.rules = content.get('rules', {})
+            except (ValueError, OSError) as err:
+                warning(f'Ignoring unreadable rule cache {path}: {err}')
+        self.graph_unchanged = (
+            fingerprint is not None and self.graphs.get(graph_iri) == fingerprint
+        )
+        log_item('Rule cache', path)
+        log_item('Graph fingerprint', fingerprint)
+        log_item('Graph unchanged', self.graph_unchanged)
+
+    def start(self, rule_iris: Iterable[URIRef]) -> dict[URIRef, str]:
+        """
+        Take the rules of this run out of the cache, they are put back once they have been
+        executed successfully (or skipped) so that an interrupted run never leaves rules
+        behind that look up to date while they are not.
+        """
+        previous = {}
+        with self._lock:
+            for rule_iri in rule_iris:
+                cached = self.rules.pop(str(rule_iri), None)
+                if cached is not None:
+                    previous[rule_iri] = cached
+        return previous
+
+    def should_skip(
+        self,
+        rule_iri: URIRef,
+        current_hash: str,
+        previous_hash: str | None,
+        dependencies: Iterable[URIRef],
+    ) -> bool:
+        with self._lock:
+            skip = (
+                not self.force
+                and self.graph_unchanged
+                and previous_hash == current_hash
+                and not any(dependency in self.executed for dependency in dependencies)
+            )
+            if skip:
+                self.skipped.add(rule_iri)
+            else:
+                self.executed.add(rule_iri)
+        return skip
+
+    def record(self, rule_iri: URIRef, current_hash: str) -> None:
+        with self._lock:
+            self.rules[str(rule_iri)] = current_hash
+
+    def save(self, fingerprint: str | None) -> None:
+        with self._lock:
+            if fingerprint is None:
+                self.graphs.pop(self.graph_iri, None)
+            else:
+                self.graphs[self.graph_iri] = fingerprint
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_text(
+                json.dumps(
+                    {'graphs': self.graphs, 'rules': self.rules},
+                    indent=2,
+                    sort_keys=True,
+                ),
+                encoding='utf-8',
+            )
+
+    def report(self) -> None:
+        log_item('Executed rules', len(self.executed))
+        log_item('Skipped rules', len(self.skipped))
+        for rule_iri in sorted(self.skipped):
+            log_item('Skipped', rule_iri)
@@ -0,0 +1,109 @@
+import heapq
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from rdflib import URIRef
+
+from ..log.various import value_error
+
+
+class RuleDag:
+    """
+    The rules of one execution run and their dependencies on each other.
+
+    Rules are executed in sort key order as far as their dependencies allow, so with one
+    worker the execution order is deterministic and with more workers independent rules
+    run concurrently while a rule never starts before all the rules it depends on have
+    finished.
+    """
+
+    def __init__(self) -> None:
+        self.sort_keys: dict[URIRef, str] = {}
+        self.depends_on: dict[URIRef, set[URIRef]] = {}
+
+    def __len__(self) -> int:
+        return len(self.sort_keys)
+
+    def add_rule(self, rule_iri: URIRef, sort_key: str) -> None:
+        self.sort_keys[rule_iri] = sort_key
+        self.depends_on.setdefault(rule_iri, set())
+
+    def add_dependency(self, rule_iri: URIRef, dependency: URIRef) -> None:
+        self.depends_on[rule_iri].add(dependency)
+
+    def _ready_entry(self, rule_iri: URIRef) -> tuple[str, str, URIRef]:
+        return self.sort_keys[rule_iri], str(rule_iri), rule_iri
+
+    def _start(
+        self,
+    ) -> tuple[
+        dict[URIRef, set[URIRef]],
+        dict[URIRef, list[URIRef]],
+        list[tuple[str, str, URIRef]],
+    ]:
+        waiting_for = {rule: set(deps) for rule, deps in self.depends_on.items()}
+        dependents: dict[URIRef, list[URIRef]] = {rule: [] for rule in waiting_for}
+        for rule, deps in waiting_for.items():
+            for dependency in deps:
+                dependents[dependency].append(rule)
+        ready = [
+            self._ready_entry(rule) for rule, deps in waiting_for.items() if not deps
+        ]
+        heapq.heapify(ready)
+        return waiting_for, dependents, ready
+
+    def _finish(
+        self,
+        rule_iri: URIRef,
+        waiting_for: dict[URIRef, set[URIRef]],
+        dependents: dict[URIRef, list[URIRef]],
+        ready: list[tuple[str, str, URIRef]],
+    ) -> None:
+        for dependent in dependents[rule_iri]:
+            waiting_for[dependent].discard(rule_iri)
+            if not waiting_for[dependent]:
+                heapq.heappush(ready, self._ready_entry(dependent))
+
+    def order(self) -> list[URIRef]:
+        """Return the rules in the order in which a single worker executes them"""
+        waiting_for, dependents, ready = self._start()
+        result: list[URIRef] = []
+        while ready:
+            _, _, rule_iri = heapq.heappop(ready)
+            result.append(rule_iri)
+            self._finish(rule_iri, waiting_for, dependents, ready)
+        if len(result) != len(self.sort_keys):
+            cycle = sorted(str(rule) for rule, deps in waiting_for.items() if deps)
+            raise value_error('Cycle in rule dependencies between {}', ', '.join(cycle))
+        return result
+
+    def execute(
+        self, execute_rule: Callable[[URIRef, int], int], max_workers: int = 1
+    ) -> int:
+        """
+        Call execute_rule(rule_iri, index) for each rule, with at most max_workers
+        rules running at the same time, and return the sum of the return codes.
+        """
+        order = self.order()  # also checks for cycles
+        if max_workers <= 1:
+            return sum(
+                execute_rule(rule_iri, index) for index, rule_iri in enumerate(order)
+            )
+        waiting_for, dependents, ready = self._start()
+        rc = 0
+        index = 0
+        with ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='rule'
+        ) as pool:
+            running: dict[Future[int], URIRef] = {}
+            while ready or running:
+                while ready and len(running) < max_workers:
+                    _, _, rule_iri = heapq.heappop(ready)
+                    running[pool.submit(execute_rule, rule_iri, index)] = rule_iri
+                    index += 1
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in sorted(done, key=lambda f: self.sort_keys[running[f]]):
+                    rule_iri = running.pop(future)
+                    rc += future.result()
+                    self._finish(rule_iri, waiting_for, dependents, ready)
+        return rc
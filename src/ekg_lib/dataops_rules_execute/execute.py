@@ -1,6 +1,11 @@
 # noqa
 import argparse
+import hashlib
+import os
 import textwrap
+import threading
+from itertools import pairwise
+from pathlib import Path
 from typing import Any
 
 from rdflib import RDF, Graph, URIRef
@@ -9,21 +14,32 @@ from ..data_source import set_cli_params as data_source_set_cli_params
 from ..git import set_cli_params as git_set_cli_params
 from ..kgiri import EKG_NS, set_kgiri_base
 from ..kgiri import set_cli_params as kgiri_set_cli_params
-from ..log import log, log_iri, log_item, log_rule, warning
+from ..log import log, log_error, log_iri, log_item, log_rule, warning
+from ..log.various import value_error
+from ..mime import MIME_TSV
 from ..namespace import DATAOPS, DATASET, RULE
 from ..sparql import SPARQLEndpoint
 from ..sparql import set_cli_params as sparql_set_cli_params
 from ..sparql.sparql_endpoint import SPARQLResponse
+from .cache import RuleCache, rule_hash
+from .dag import RuleDag
+
+DEFAULT_PROVENANCE_FLUSH_SIZE = 100
 
 
 #
-# TODO: Make rules link to other rules so that we can calculate the right
-#       execution order.
 # TODO: Specify per rule whether its generic or dataset-specific.
 #
 class DataopsRulesExecute:
     """Finds each `rule.ttl` file in each subdirectory of `/metadata` and executes the rule it describes
     against the given SPARQL s3_endpoint.
+
+    Rules can link to the rules they depend on with `rule:dependsOn`, a rule that doesn't
+    depends on the rule before it (in sort key order) in the same rule set (`rule:inSet`).
+    The rule sets themselves are executed one after the other, in the order of their sort
+    keys (`01-generic`, `10-<set>`, `98-generic-last`, `99-obfuscate`), see rule_stages().
+    With `--max-workers` greater than 1, rules that do not depend on each other are
+    executed concurrently.
     """
 
     def __init__(
@@ -35,12 +51,23 @@ class DataopsRulesExecute:
         self.rules_file = args.rules_file
         self.rule_type = URIRef(args.rule_type)
         self.sparql_endpoint = sparql_endpoint
+        self.max_workers = getattr(args, 'max_workers', None) or 1
+        self.provenance_flush_size = (
+            getattr(args, 'provenance_flush_size', None)
+            or DEFAULT_PROVENANCE_FLUSH_SIZE
+        )
+        self.provenance_updates = 0
+        self.rule_cache_file = getattr(args, 'rule_cache_file', None)
+        self.force = getattr(args, 'force', False)
+        self.rule_cache: RuleCache | None = None
+        self._provenance: list[tuple[URIRef, Any | None]] = []
+        self._provenance_lock = threading.Lock()
         if self.rules_file is None:
             result = self._query_all_rules()
             if result is None:
                 self.g = Graph()
             else:
-                converted = result.convert()  # type: ignore[attr-defined]
+                converted = result.convert()
                 if not isinstance(converted, Graph):
                     raise ValueError(f'Expected Graph, got {type(converted)}')
                 self.g = converted
@@ -90,23 +117,171 @@ class DataopsRulesExecute:
             """  # noqa: F541
         )
 
-    def execute(self) -> int:
+    def build_dag(self) -> RuleDag:
         #
         # We're looking up each rule IRI via the sort key to:
         # - ensure we're doing in the right sorted order
         # - ensure that regardless of the actual IRI (which may be obfuscated even) we'll find
         #   the rule anyway.
         #
-        rule_iris = list(self.g.objects(None, RULE.sortKey))
-        max_rules = len(rule_iris)
-        rc = 0
-        for index, key in enumerate(sorted(rule_iris, key=str)):
-            for rule_iri in self.g.subjects(RULE.sortKey, key):
-                if not isinstance(rule_iri, URIRef):
-                    continue
-                rc += self.execute_rule(rule_iri, index, max_rules, key)
+        dag = RuleDag()
+        for rule_iri, key in sorted(
+            self.g.subject_objects(RULE.sortKey), key=lambda item: str(item[1])
+        ):
+            if isinstance(rule_iri, URIRef) and rule_iri not in dag.sort_keys:
+                dag.add_rule(rule_iri, str(key))
+        ordered = sorted(dag.sort_keys, key=lambda rule: dag.sort_keys[rule])
+        previous_in_set: dict[Any, URIRef] = {}
+        for rule_iri in ordered:
+            rule_set = self.g.value(rule_iri, RULE.inSet)
+            dependencies = list(self.g.objects(rule_iri, RULE.dependsOn))
+            for dependency in dependencies:
+                if dependency in dag.sort_keys:
+                    dag.add_dependency(rule_iri, dependency)  # type: ignore[arg-type]
+                else:
+                    warning(f'Rule {rule_iri} depends on unknown rule {dependency}')
+            if not dependencies and rule_set in previous_in_set:
+                dag.add_dependency(rule_iri, previous_in_set[rule_set])
+            previous_in_set[rule_set] = rule_iri
+        # every rule of a stage waits for the rules of the previous stage that no other
+        # rule of that stage waits for, and with that for the whole previous stage
+        for previous_stage, stage in pairwise(self.rule_stages(ordered)):
+            waited_for = set().union(*(dag.depends_on[rule] for rule in previous_stage))
+            last_rules = [rule for rule in previous_stage if rule not in waited_for]
+            for rule_iri in stage:
+                for last_rule in last_rules:
+                    dag.add_dependency(rule_iri, last_rule)
+        return dag
+
+    def rule_stages(self, ordered: list[URIRef]) -> list[list[URIRef]]:
+        """
+        Split the given rules, in sort key order, into the stages that are executed one
+        after the other: normally one stage per rule set, but rule sets of which the sort
+        keys interleave end up in the same stage
+        """
+        last_of_set = {
+            self.g.value(rule_iri, RULE.inSet): index
+            for index, rule_iri in enumerate(ordered)
+        }
+        stages: list[list[URIRef]] = []
+        stage: list[URIRef] = []
+        end = -1
+        for index, rule_iri in enumerate(ordered):
+            stage.append(rule_iri)
+            end = max(end, last_of_set[self.g.value(rule_iri, RULE.inSet)])
+            if index == end:
+                stages.append(stage)
+                stage = []
+        return stages
+
+    def graph_iri(self) -> str:
+        return f'{EKG_NS["KGGRAPH"]}{self.data_source_code}'
+
+    def graph_fingerprint(self) -> str | None:
+        """
+        Return a fingerprint of the content of the dataset's graph and all graphs that
+        belong to it, such as the raw input graphs `kggraph:<data_source_code>-...-raw`
+        that the rules read, None if it could not be determined (in which case the rule
+        cache considers the dataset to be changed).
+
+        The store computes the number of triples and a checksum of each graph, so none of
+        the triples have to be downloaded.
+        """
+        if self.sparql_endpoint is None:
+            return None
+        graph_iri = self.graph_iri()
+        result = self.sparql_endpoint.execute_sparql_select_query(
+            f'''PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+SELECT ?graph (COUNT(*) AS ?triples) (SUM(?hash) AS ?checksum) WHERE {{
+    GRAPH ?graph {{ ?s ?p ?o }}
+    FILTER(?graph = <{graph_iri}> || STRSTARTS(STR(?graph), "{graph_iri}-"))
+    BIND(xsd:integer(CONCAT("0", SUBSTR(REPLACE(MD5(CONCAT(
+        IF(isBlank(?s), "_:", STR(?s)), " ", STR(?p), " ",
+        IF(isBlank(?o), "_:", STR(?o)), " ",
+        IF(isLiteral(?o), CONCAT(LANG(?o), " ", STR(DATATYPE(?o))), "")
+    )), "[a-f]", ""), 1, 9))) AS ?hash)
+}} GROUP BY ?graph''',
+            mime_type=MIME_TSV,
+        )
+        if result is None:
+            return None
+        digest = hashlib.sha256()
+        for graph, triples, checksum in sorted(
+            tuple(str(term) for term in row) for row in result.iter_rows(as_terms=True)
+        ):
+            digest.update(f'{graph} {triples} {checksum}\n'.encode())
+        return f'sha256:{digest.hexdigest()}'
+
+    def _open_rule_cache(self) -> RuleCache | None:
+        if self.rule_cache_file is None:
+            return None
+        return RuleCache(
+            Path(self.rule_cache_file),
+            self.graph_iri(),
+            # --force executes all rules whatever the fingerprint is
+            None if self.force else self.graph_fingerprint(),
+            force=self.force,
+        )
+
+    def execute(self) -> int:
+        dag = self.build_dag()
+        max_rules = len(dag)
+        log_item('Max workers', self.max_workers)
+        cache = self.rule_cache = self._open_rule_cache()
+        previous_hashes = cache.start(dag.sort_keys) if cache else {}
+
+        def execute_or_skip_rule(rule_iri: URIRef, index: int) -> int:
+            key = dag.sort_keys[rule_iri]
+            if cache is None:
+                return self.execute_rule(rule_iri, index, max_rules, key)
+            current_hash = rule_hash(self.g, rule_iri)
+            if cache.should_skip(
+                rule_iri,
+                current_hash,
+                previous_hashes.get(rule_iri),
+                dag.depends_on[rule_iri],
+            ):
+                log_item(f'Skipping unchanged rule {index + 1}/{max_rules}', key)
+                cache.record(rule_iri, current_hash)
+                return 0
+            rc = self.execute_rule(rule_iri, index, max_rules, key)
+            if rc == 0:
+                cache.record(rule_iri, current_hash)
+            return rc
+
+        try:
+            rc = dag.execute(execute_or_skip_rule, max_workers=self.max_workers)
+        except BaseException:
+            self._flush_provenance_after_error()
+            raise
+        else:
+            self.flush_provenance()
+            # only a completed run sets the fingerprint that the next run compares with
+            if cache is not None:
+                cache.save(
+                    # skipped rules don't change the dataset
+                    cache.fingerprint
+                    if not cache.executed and cache.fingerprint is not None
+                    else self.graph_fingerprint()
+                )
+        finally:
+            if cache is not None:
+                cache.report()
+        log_item('Provenance updates', self.provenance_updates)
+        if self.sparql_endpoint is not None:
+            self.sparql_endpoint.log_pool_stats()
         return rc
 
+    def _flush_provenance_after_error(self) -> None:
+        """
+        Don't lose the provenance of the rules that did execute, but don't let an error
+        while writing it hide the error that stopped the execution
+        """
+        try:
+            self.flush_provenance()
+        except Exception as err:  # noqa: BLE001
+            log_error(f'Could not flush the provenance after an error: {err}')
+
     def execute_rule(self, rule_iri: URIRef, index: int, max_: int, key: Any) -> int:  # noqa: C901
         if self.sparql_endpoint is None:
             raise ValueError('sparql_endpoint is required')
@@ -115,11 +290,8 @@ class DataopsRulesExecute:
         count = 0
         if self.rule_type == RULE.ObfuscationRule:
             # add details of the obfucation rule being executed to the dataset first so it can also be obfuscated
-            self.sparql_endpoint.execute_sparql_statement(
-                self.insert_detail_about_sparql_statement(
-                    self.data_source_code, rule_iri
-                )
-            )
+            self.record_provenance(rule_iri)
+            self.flush_provenance()
         for sparql_rule in self.g.objects(rule_iri, RULE.hasSPARQLRule):
             count += 1
             validation_result = None
@@ -131,21 +303,18 @@ class DataopsRulesExecute:
                     )
                     if result is not None:
                         # Read and decode response (result used for side effects)
-                        result.response.read().decode('utf-8')
+                        result.read().decode('utf-8')
                 elif statement_type == RULE.SPARQLConstructQuery:
-                    construct_result: Any = self.sparql_endpoint.execute_construct(
-                        sparql_rule_str
-                    )
-                    if construct_result is not None:
+                    result = self.sparql_endpoint.execute_construct(sparql_rule_str)
+                    if result is not None:
                         # Convert result (result used for side effects)
-                        if hasattr(construct_result, 'convert'):
-                            construct_result.convert()  # type: ignore[attr-defined]
+                        result.convert()
                 elif statement_type == RULE.SPARQLAskQuery:
                     result = self.sparql_endpoint.execute_sparql_statement(
                         sparql_rule_str
                     )
                     if result is not None:
-                        actual_result = format(result.response.read().decode('utf-8'))
+                        actual_result = format(result.read().decode('utf-8'))
                         for expected_result in self.g.objects(
                             rule_iri, RULE.expectedResult
                         ):
@@ -167,35 +336,60 @@ class DataopsRulesExecute:
                     )
                     if result is not None:
                         # Read and decode response (result used for side effects)
-                        result.response.read().decode('utf-8')
+                        result.read().decode('utf-8')
                 else:
                     continue
                 #  details of obfucation rules have already been added so should not be included here
                 if self.rule_type != RULE.ObfuscationRule:
-                    if validation_result is None:
-                        self.sparql_endpoint.execute_sparql_statement(
-                            self.insert_detail_about_sparql_statement(
-                                self.data_source_code, rule_iri
-                            )
-                        )
-                    else:
-                        self.sparql_endpoint.execute_sparql_statement(
-                            self.insert_detail_about_sparql_statement(
-                                self.data_source_code, rule_iri, validation_result
-                            )
-                        )
-                        if validation_result == RULE.ValidationRuleFail:
-                            for severity in self.g.objects(rule_iri, RULE.severity):
-                                if severity == RULE.Violation:
-                                    return 1
+                    self.record_provenance(rule_iri, validation_result)
+                    if validation_result == RULE.ValidationRuleFail:
+                        for severity in self.g.objects(rule_iri, RULE.severity):
+                            if severity == RULE.Violation:
+                                return 1
         if count > 0:
             log_item('# SPARQL Rules', count)
         else:
             warning(f'Story validation rule has no SPARQL rule: {rule_iri}')
         return 0
 
+    def record_provenance(self, rule_iri: URIRef, result: Any | None = None) -> None:
+        """
+        Remember that the given rule has been executed (with the given validation result, if any).
+        The provenance is written to the triple store in batches, see flush_provenance().
+        """
+        with self._provenance_lock:
+            self._provenance.append((rule_iri, result))
+            full = len(self._provenance) >= self.provenance_flush_size
+        if full:
+            self.flush_provenance()
+
+    def flush_provenance(self) -> None:
+        """Write all recorded provenance to the triple store with one INSERT DATA statement"""
+        with self._provenance_lock:
+            executed, self._provenance = self._provenance, []
+        if not executed or self.sparql_endpoint is None:
+            return
+        log_item('Flushing provenance of # rules', len(executed))
+        result = self.sparql_endpoint.execute_sparql_statement(
+            self.insert_detail_about_sparql_statements(self.data_source_code, executed)
+        )
+        if result is None:
+            raise value_error(
+                'Could not write the provenance of {} executed rules', len(executed)
+            )
+        result.read()
+        with self._provenance_lock:
+            self.provenance_updates += 1
+
     def insert_detail_about_sparql_statement(
         self, dataset_code: str, rule_iri: URIRef, result: Any | None = None
+    ) -> str:
+        return self.insert_detail_about_sparql_statements(
+            dataset_code, [(rule_iri, result)]
+        )
+
+    def insert_detail_about_sparql_statements(
+        self, dataset_code: str, executed: list[tuple[URIRef, Any | None]]
     ) -> str:
         #
         # We cannot use prefixes here because they might clash with the prefixes in sparql_rule
@@ -220,12 +414,15 @@ class DataopsRulesExecute:
         pipeline_iri = f'{EKG_NS["KGIRI"]}dataops-pipeline-{self.data_source_code}'
         pipeline_class_iri = f'{DATAOPS}Pipeline'
         pipeline_produced_dataset_p_iri = f'{DATAOPS}hasProducedDataset'
+        rule_iris = ' , '.join(
+            f'<{rule_iri}>' for rule_iri in dict.fromkeys(r for r, _ in executed)
+        )
         core_detail = f"""\
             INSERT DATA {{
                 GRAPH <{graph_iri}> {{
                     <{dataset_iri}> a <{dataset_class_iri}> ;
                         <{dataset_code_p_iri}> "{dataset_code}" ;
-                        <{executed_rule_p_iri}> <{rule_iri}> ;
+                        <{executed_rule_p_iri}> {rule_iris} ;
                         <{dataset_in_graph_p_iri}> <{graph_iri}> ;
                         <{created_by_pipeline_p_iri}> <{pipeline_iri}> .
                     <{pipeline_iri}> a <{pipeline_class_iri}> ;
@@ -238,14 +435,14 @@ class DataopsRulesExecute:
             }
             
         """
-        result_detail = f"""\
-                    <{rule_iri}> <{RULE}validationResult> <{result}> .
-        """
-
-        if result is None:
-            return textwrap.dedent(core_detail + tail_detail)
-        else:
-            return textwrap.dedent(core_detail + result_detail + tail_detail)
+        result_detail = ''.join(
+            f'        <{rule_iri}> <{RULE}validationResult> <{result}> .\n'
+            for rule_iri, result in dict.fromkeys(executed)
+            if result is not None
+        )
+        return (
+            textwrap.dedent(core_detail) + result_detail + textwrap.dedent(tail_detail)
+        )
 
 
 def main() -> int:
@@ -270,6 +467,32 @@ def main() -> int:
     parser.add_argument(
         '--rule-type', help='Type of rules to be executed', default=None
     )
+    parser.add_argument(
+        '--provenance-flush-size',
+        help='Number of executed rules whose provenance is written to the triple store '
+        f'in one update, default {DEFAULT_PROVENANCE_FLUSH_SIZE}',
+        type=int,
+        default=DEFAULT_PROVENANCE_FLUSH_SIZE,
+    )
+    parser.add_argument(
+        '--rule-cache-file',
+        help='Local file in which to remember which rules have been executed against which '
+        'state of the graph, so that unchanged rules can be skipped next time '
+        '(default is EKG_RULE_CACHE_FILE, no caching when not set)',
+        default=os.getenv('EKG_RULE_CACHE_FILE', None),
+    )
+    parser.add_argument(
+        '--force',
+        help='Execute all rules, even the ones that the rule cache says are unchanged',
+        default=False,
+        action='store_true',
+    )
+    parser.add_argument(
+        '--max-workers',
+        help='Maximum number of rules that are executed concurrently, default 1',
+        type=int,
+        default=1,
+    )
     git_set_cli_params(parser)
     kgiri_set_cli_params(parser)
     data_source_set_cli_params(parser)
@@ -1,3 +1,21 @@
-from .various import set_cli_params, export_dataset, datasets_produced_by_pipeline  # noqa: F401
+from .various import (  # noqa: F401
+    COMPRESSION_GZIP,
+    COMPRESSION_ZSTD,
+    DEFAULT_TURTLE_MAX_TRIPLES,
+    EXPORT_COMPRESSIONS,
+    datasets_produced_by_pipeline,
+    export_dataset,
+    export_format,
+    set_cli_params,
+)
 
-__all__ = ['set_cli_params', 'export_dataset', 'datasets_produced_by_pipeline']
+__all__ = [
+    'COMPRESSION_GZIP',
+    'COMPRESSION_ZSTD',
+    'DEFAULT_TURTLE_MAX_TRIPLES',
+    'EXPORT_COMPRESSIONS',
+    'datasets_produced_by_pipeline',
+    'export_dataset',
+    'export_format',
+    'set_cli_params',
+]
@@ -1,21 +1,39 @@
 import argparse
+import contextlib
 import gzip
 import os
 import textwrap
+from collections.abc import Iterator
+from itertools import batched
 from pathlib import Path
-from typing import Generator, Tuple
+from typing import BinaryIO
 
 import rdflib
-import requests
 from rdflib import Graph, plugin
-from six import BytesIO
 
 from ..kgiri import EKG_NS
 from ..log import log_item, log_rule
 from ..mime import MIME_NTRIPLES, MIME_TURTLE
 from ..namespace import DATAOPS, DATASET
-from ..s3 import S3ObjectStore
-from ..sparql import SPARQLEndpoint, iter_raw
+from ..ntriples import NTriplesWriter
+from ..s3 import S3ObjectStore, S3UploadStream
+from ..sparql import SPARQLEndpoint
+
+try:
+    from compression import zstd
+except ImportError:  # Python built without zstd support
+    zstd = None
+
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_ZSTD = 'zstd'
+# the compressions that are available in this Python build
+EXPORT_COMPRESSIONS = (COMPRESSION_GZIP,) + ((COMPRESSION_ZSTD,) if zstd else ())
+DEFAULT_TURTLE_MAX_TRIPLES = 100000
+
+# compression levels for small (Turtle) and large (N-Triples) graphs
+_COMPRESSION_LEVELS = {COMPRESSION_GZIP: (9, 4), COMPRESSION_ZSTD: (19, 3)}
+_COMPRESSION_EXTENSIONS = {COMPRESSION_GZIP: 'gz', COMPRESSION_ZSTD: 'zst'}
+_EXPORT_CHUNK_SIZE = 1024 * 1024
 
 
 def set_cli_params(parser: argparse.ArgumentParser) -> None:
@@ -37,6 +55,36 @@ def set_cli_params(parser: argparse.ArgumentParser) -> None:
         )
 
 
+def export_format(
+    triple_count: int | None,
+    turtle_max_triples: int = DEFAULT_TURTLE_MAX_TRIPLES,
+    compression: str = COMPRESSION_GZIP,
+) -> tuple[str, int]:
+    """
+    The mime type and compression level to export a graph with the given number of
+    triples with.
+
+    Graphs of up to turtle_max_triples triples are exported as Turtle, which is a lot
+    smaller than N-Triples, and compressed with the highest compression level since
+    that's cheap for a small graph. Larger graphs, and graphs of unknown size, are
+    exported as N-Triples, which the triple store can stream without first grouping
+    the triples by subject, with a fast compression level so that compressing them
+    keeps up with the download.
+    """
+    small_level, large_level = _COMPRESSION_LEVELS[compression]
+    if triple_count is not None and triple_count <= turtle_max_triples:
+        return MIME_TURTLE, small_level
+    return MIME_NTRIPLES, large_level
+
+
+def _compressed(stream: S3UploadStream, compression: str, level: int) -> BinaryIO:
+    if compression == COMPRESSION_ZSTD:
+        compressed: BinaryIO = zstd.ZstdFile(stream, mode='w', level=level)  # type: ignore[union-attr]
+        return compressed
+    # no timestamp in the header so that a resumed upload can skip the first part too
+    return gzip.GzipFile(mode='wb', fileobj=stream, compresslevel=level, mtime=0)  # type: ignore[arg-type, return-value]
+
+
 #
 # TODO: externalize s3os
 #
@@ -45,8 +93,19 @@ def export_dataset(
     s3_endpoint: S3ObjectStore | None = None,
     data_source_code: str | None = None,
     graph_iri: rdflib.URIRef | None = None,
-    mime: str = MIME_NTRIPLES,
+    mime: str | None = None,
+    triple_count: int | None = None,
+    compression: str = COMPRESSION_GZIP,
+    turtle_max_triples: int = DEFAULT_TURTLE_MAX_TRIPLES,
 ) -> bool:
+    """
+    Export the given named graph from the triple store to S3, compressed with gzip or
+    zstd.
+
+    Unless a mime type is given, the format and compression level are chosen based on
+    the number of triples in the graph, see export_format(). The graph is downloaded
+    uncompressed and compressed and uploaded part by part while it comes in.
+    """
     if (
         sparql_endpoint is None
         or s3_endpoint is None
@@ -54,45 +113,59 @@ def export_dataset(
         or graph_iri is None
     ):
         raise ValueError('All parameters are required')
+    if compression not in EXPORT_COMPRESSIONS:
+        raise ValueError(f'Unsupported compression {compression}')
+    default_mime, level = export_format(triple_count, turtle_max_triples, compression)
+    mime = mime or default_mime
     log_rule(data_source_code)
     log_item('Exporting Dataset', data_source_code)
     log_item('Named Graph IRI', graph_iri.n3())
-    r = requests.get(
+    log_item('Triples', 'unknown' if triple_count is None else triple_count)
+    log_item('Format', f'{mime} ({compression} level {level})')
+    r = sparql_endpoint.request(
+        'GET',
         sparql_endpoint.endpoint_url(),
-        auth=(sparql_endpoint.user_id(), sparql_endpoint.password()),
         params={'graph': graph_iri},
-        headers={'Accept': mime},
+        headers={'Accept': mime, 'Accept-Encoding': 'identity'},
         stream=True,
     )
     if sparql_endpoint.handle_error(r):
         log_item('response', 'Receiving...')
-        content_encoding = r.headers.get('Content-Encoding')
-        # log_item("Content Encoding", content_encoding)
-        # log_item("Response Encoding", r.encoding)
-
-        log_item('Uploading as', _s3_file_name(mime, data_source_code))
+        s3_file_name = _s3_file_name(mime, data_source_code, compression)
+        log_item('Uploading as', s3_file_name)
         uploader = s3_endpoint.uploader_for(
-            key=_s3_file_name(mime, data_source_code),
+            key=s3_file_name,
             mime=mime,
-            content_encoding=content_encoding,
+            content_encoding=compression,
             dataset_code=data_source_code,
         )
-        chunk_size = 5 * 1024 * 1024  # 5Mb is minimum
-        # for chunk in r.iter_lines(chunk_size=chunk_size, decode_unicode=False):
-        # for chunk in r.raw.stream(amt=chunk_size, decode_content=None):
-        for chunk in iter_raw(r, chunk_size=chunk_size):
-            uploader.part(chunk)
-            log_item('response', 'Processed chunk ...')
-        return uploader.complete()
+        stream = S3UploadStream(uploader)
+        try:
+            with _compressed(stream, compression, level) as compressed:
+                # iter_content decodes the content in case the server compressed it anyway
+                for chunk in r.iter_content(chunk_size=_EXPORT_CHUNK_SIZE):
+                    compressed.write(chunk)
+            stream.close()
+            log_item(f'{s3_file_name} parts', len(uploader.parts))
+            return uploader.complete()
+        except BaseException:
+            # don't leave an upload behind that is neither completed nor aborted
+            uploader.fail()
+            raise
+        finally:
+            r.close()
     else:
         log_item('response', 'Failure!')
         return False
 
 
-def _s3_file_name(mime: str, data_source_code: str) -> str:
+def _s3_file_name(
+    mime: str, data_source_code: str, compression: str = COMPRESSION_GZIP
+) -> str:
+    extension = _COMPRESSION_EXTENSIONS[compression]
     if mime == MIME_NTRIPLES:
-        return f'ekg-dataset-{data_source_code}.nt.gz'
-    return f'ekg-dataset-{data_source_code}.ttl.gz'  # TODO: Support other mime types as well
+        return f'ekg-dataset-{data_source_code}.nt.{extension}'
+    return f'ekg-dataset-{data_source_code}.ttl.{extension}'  # TODO: Support other mime types as well
 
 
 def export_graph(
@@ -101,54 +174,64 @@ def export_graph(
     s3_endpoint: S3ObjectStore | None = None,
     data_source_code: str | None = None,
 ) -> bool:
-    """Export the content of the given rdflib.Graph as a Turtle file to the given S3 bucket"""
+    """
+    Export the content of the given rdflib.Graph as a Turtle file to the given S3 bucket,
+    or as N-Triples if the file name has an .nt extension. The file is gzipped if, and
+    only if, the file name ends with .gz.
+
+    The serialized graph is compressed and uploaded as it is written, one part of the
+    multipart upload at a time, so only one part is kept in memory rather than the whole
+    file. N-Triples are written straight from the triples of the graph, which is a lot
+    faster than the rdflib Turtle serializer that first has to sort out all subjects.
+    """
     if s3_endpoint is None:
         raise ValueError('s3_endpoint is required')
     log_rule(f'Uploading in-memory graph as {s3_file_name} to S3')
-    if Path(s3_file_name).suffix == '.gz':
-        content_encoding = 'gzip'
-    else:
-        content_encoding = None
+    content_encoding = COMPRESSION_GZIP if Path(s3_file_name).suffix == '.gz' else None
+    mime = MIME_NTRIPLES if '.nt' in Path(s3_file_name).suffixes else MIME_TURTLE
     uploader = s3_endpoint.uploader_for(
         s3_file_name,
-        mime=MIME_TURTLE,
-        content_encoding=content_encoding if content_encoding else None,
+        mime=mime,
+        content_encoding=content_encoding,
         dataset_code=data_source_code,
     )
-    #
-    # Unfortunately this is all happening in memory, the rdflib serializer does not seem
-    # to support streaming.
-    #
-    chunk_max_size = 5 * 1024 * 1024  # 5Mb is minimum
-    serializer = plugin.get('ttl', plugin.Serializer)(graph)  # type: ignore[attr-defined]
-    buf = BytesIO()
-    with gzip.GzipFile(mode='wb', fileobj=buf) as stream:
-        serializer.serialize(stream, encoding='UTF-8')  # type: ignore[arg-type]
-    chunk = bytearray(chunk_max_size)
-    chunk_size = chunk_max_size
-    buf.seek(0)
-
-    while chunk_size == chunk_max_size:
-        chunk_size = buf.readinto(chunk)
-        log_item(f'{s3_file_name} chunk_size', str(chunk_size))
-        if chunk_size > 0:
-            uploader.part(bytes(chunk[0:chunk_size]))
-    log_item(f'{s3_file_name} completing with', str(chunk_size))
-    return uploader.complete()
+    stream = S3UploadStream(uploader)
+    try:
+        with (
+            # no timestamp in the header so that a resumed upload can skip the first part too
+            gzip.GzipFile(mode='wb', fileobj=stream, mtime=0)  # type: ignore[arg-type]
+            if content_encoding
+            else contextlib.nullcontext(stream)
+        ) as output:
+            if mime == MIME_NTRIPLES:
+                writer = NTriplesWriter(output)  # type: ignore[arg-type]
+                for triples in batched(graph, 10000):
+                    writer.write(triples)
+                writer.flush()
+            else:
+                serializer = plugin.get('ttl', plugin.Serializer)(graph)  # type: ignore[attr-defined]
+                serializer.serialize(output, encoding='UTF-8')  # type: ignore[arg-type]
+        stream.close()
+        log_item(f'{s3_file_name} parts', len(uploader.parts))
+        return uploader.complete()
+    except BaseException:
+        uploader.fail()
+        raise
 
 
 def datasets_produced_by_pipeline(
     sparql_endpoint: SPARQLEndpoint, data_source_code: str
-) -> Generator[Tuple[rdflib.URIRef, rdflib.Literal], None, None]:
+) -> Iterator[tuple[rdflib.URIRef, rdflib.Literal, int]]:
     """
-    Return an iterator over the collection of graph iris and the codes of the datasets that the given pipeline
-    has produced in the staging database.
+    Return an iterator over the collection of graph iris, the codes and the number of
+    triples of the datasets that the given pipeline has produced in the staging database.
+
+    The triples of all graphs are counted by one aggregate query rather than one query
+    per graph.
 
     :param sparql_endpoint: the SPARQLEndpoint to use
     :param data_source_code: the code of the data source that the pipeline is for
-    :return: iterator over the collection of dataset graph IRIs
-
-    TODO: Also return size
+    :return: iterator over the dataset graph IRIs, dataset codes and triple counts
     """
 
     def _query() -> str:
@@ -157,64 +240,43 @@ def datasets_produced_by_pipeline(
             PREFIX dataset: <{DATASET}>
             PREFIX kgiri:   <{EKG_NS['KGIRI']}>
             PREFIX kggraph: <{EKG_NS['KGGRAPH']}>
-            
-            CONSTRUCT {{
-                ?pipeline a dataops:Pipeline ;
-                    dataset:dataSourceCode ?dataSourceCode
-                .
-                ?dataset
-                    dataops:createdByPipeline ?pipeline ;
-                    dataset:inGraph ?graphIRI ;
-                    dataset:datasetCode ?datasetCode ;
-                    # dataset:numberOfTriples ?numberOfTriples
-                .
-            }}
+
+            SELECT ?graphIRI ?datasetCode (COUNT(?s) AS ?numberOfTriples)
             WHERE {{
-                GRAPH ?g {{
-                    BIND("{data_source_code}" as ?dataSourceCode)
-                    ?pipeline a dataops:Pipeline ;
-                        dataset:dataSourceCode ?dataSourceCode
-                    .
-                    ?dataset
-                        dataops:createdByPipeline ?pipeline ;
-                        dataset:inGraph ?graphIRI ;
-                        dataset:datasetCode ?datasetCode
-                    .
+                # the same graph and dataset may be found for multiple datasets
+                {{
+                    SELECT DISTINCT ?graphIRI ?datasetCode
+                    WHERE {{
+                        GRAPH ?g {{
+                            BIND("{data_source_code}" as ?dataSourceCode)
+                            ?pipeline a dataops:Pipeline ;
+                                dataset:dataSourceCode ?dataSourceCode
+                            .
+                            ?dataset
+                                dataops:createdByPipeline ?pipeline ;
+                                dataset:inGraph ?graphIRI ;
+                                dataset:datasetCode ?datasetCode
+                            .
+                        }}
+                    }}
+                }}
+                OPTIONAL {{
+                    GRAPH ?graphIRI {{ ?s ?p ?o }}
                 }}
-                # GRAPH ?graph_iri {{
-                    # ?s ?p ?o .
-                    # BIND(COUNT(?s) AS ?numberOfTriples)
-                # }}
             }}
-        """)  # noqa: W293
+            GROUP BY ?graphIRI ?datasetCode
+        """)
 
     log_item('Query', _query())
-    result = sparql_endpoint.execute_construct(_query())
+    result = sparql_endpoint.execute_sparql_select_query(_query())
     if result is None:
-        g = Graph()
-    else:
-        converted = result.convert()  # type: ignore[attr-defined]
-        if not isinstance(converted, Graph):
-            raise ValueError(f'Expected Graph, got {type(converted)}')
-        g = converted
-
-    def datasets() -> Generator[Tuple[rdflib.URIRef, rdflib.Literal], None, None]:
-        for dataset_iri, graph_iri in g.subject_objects(DATASET.inGraph):
-            log_item('Dataset IRI', dataset_iri)
-            log_item('Graph IRI', graph_iri)
-            assert isinstance(dataset_iri, rdflib.URIRef)
-            assert isinstance(graph_iri, rdflib.URIRef)
-            for dataset_code in g.objects(dataset_iri, DATASET.datasetCode):
-                log_item('Dataset Code', dataset_code)
-                assert isinstance(dataset_code, rdflib.Literal)
-                yield graph_iri, dataset_code
-
-    # make these unique as the same graph and dataset may be returned for multiple dataset_iris
-    for _ in set(datasets()):
-        yield _
-
-    # exit(1)
-    # results = sparql_endpoint.execute_csv_query(query).iter_lines()
-    # for graph_iri, dataset_code in [(row['graph_iri'], row['data_source_code']) for row in results]:
-    #     # print(f"graph_iri={graph_iri} data_source_code={data_source_code}")
-    #     yield rdflib.URIRef(graph_iri), dataset_code
+        return
+    for graph_iri, dataset_code, number_of_triples in result.iter_rows():
+        log_item('Graph IRI', graph_iri)
+        log_item('Dataset Code', dataset_code)
+        log_item('Number of Triples', number_of_triples)
+        yield (
+            rdflib.URIRef(graph_iri),
+            rdflib.Literal(dataset_code),
+            int(number_of_triples or 0),
+        )
@@ -14,4 +14,6 @@ from .various import (
     set_cli_params as set_cli_params,
     parse_identity_key as parse_identity_key,
     parse_identity_key_with_prefix as parse_identity_key_with_prefix,
+    set_identity_key_cache_size as set_identity_key_cache_size,
+    identity_key_cache_info as identity_key_cache_info,
 )  # noqa: F401
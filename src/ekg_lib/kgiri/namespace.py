@@ -92,12 +92,35 @@ def kgiri_replace(value: Any) -> Any:
         return value
 
 
-def kgiri_replace_iri_in_graph(g: Graph) -> None:
-    if not kgiri_replace_enabled:
-        return
-    for s, p, o in g:
-        g.remove((s, p, o))
-        g.add((kgiri_replace(s), kgiri_replace(p), kgiri_replace(o)))
+def kgiri_replace_iri_in_graph(g: Graph) -> int:
+    """
+    Apply kgiri_replace() to all IRIs in the given graph, returns the number of IRIs that
+    were replaced.
+
+    Only the triples that have an IRI with the KGIRI base replace fragment in them are
+    touched: they are collected first and then removed and added again in bulk, rather
+    than removing and adding every triple of the graph while iterating over it.
+    """
+    if not kgiri_replace_enabled or kgiri_base_replace is None or kgiri_base is None:
+        return 0
+    base_replace = str(kgiri_base_replace)
+
+    def needs_replace(term: Any) -> bool:
+        return isinstance(term, URIRef) and base_replace in term
+
+    triples = [
+        (s, p, o)
+        for s, p, o in g
+        if needs_replace(s) or needs_replace(p) or needs_replace(o)
+    ]
+    replaced = 0
+    for triple in triples:
+        g.remove(triple)
+        replaced += sum(1 for term in triple if needs_replace(term))
+    g.addN(
+        (kgiri_replace(s), kgiri_replace(p), kgiri_replace(o), g) for s, p, o in triples
+    )
+    return replaced
 
 
 def kgiri_replace_iri_in_literal(value: Literal) -> Literal:
@@ -3,6 +3,7 @@ import os
 import re
 import sys
 import uuid
+from functools import lru_cache
 from typing import Any
 
 import inflection
@@ -57,43 +58,89 @@ special_char_map = {
 }
 
 
+_WORD = re.compile(r'(?i)([a-z\d]*)')
+_FIRST_CHARACTER = re.compile(r'^\w')
+_WORD_START = re.compile(r"\b('?\w)")
+# the keys that parse_identity_key returns as they are, like 'foo-bar-42'
+_NORMALIZED_KEY = re.compile(r'[a-z0-9]+(?:-[a-z0-9]+)*')
+
+DEFAULT_IDENTITY_KEY_CACHE_SIZE = 100000
+
+
 def _translate_to_human_readable(key: str) -> str:
-    key = re.sub(r'(?i)([a-z\d]*)', lambda m: m.group(1).lower(), key)
-    return re.sub(r'^\w', lambda m: m.group(0).upper(), key)
+    key = _WORD.sub(lambda m: m.group(1).lower(), key)
+    return _FIRST_CHARACTER.sub(lambda m: m.group(0).upper(), key)
+
+
+def _tidy_identity_key(key: str) -> str:
+    key = key.replace('--', '-')
+    key = key.replace('--', '-')
+    return strip_end(key, '-')
+
+
+def _parse_identity_key_string(legacy_id: str) -> str:
+    if _NORMALIZED_KEY.fullmatch(legacy_id):
+        return legacy_id
+    key = legacy_id.translate(special_char_map)
+
+    key = _WORD_START.sub(
+        lambda match: match.group(1).capitalize(),
+        inflection.dasherize(_translate_to_human_readable(inflection.underscore(key))),
+    )
+
+    # key = inflection.titleize(key)
+    key = inflection.parameterize(key, separator='-')
+    # key = unidecode(legacy_id)
+    # key = stringcase.spinalcase(stringcase.lowercase(key))
+    # key = key.replace('"', '')
+    # key = key.replace('(', '-')
+    # key = key.replace(')', '-')
+    # key = key.replace('/', '-')
+    # key = key.replace('\\', '-')
+    # key = key.replace('=', '-')
+    # key = key.replace('>', '-')
+    # key = key.replace('<', '-')
+    # key = key.replace(':', '-')
+    # key = key.replace(',', '-')
+    # key = key.replace('|', '-')
+    # key = key.replace('&amp;', '-and-')
+    # key = key.replace('-&-', '-and-')
+    return _tidy_identity_key(key)
+
+
+_parse_identity_key_cached = lru_cache(
+    maxsize=int(
+        os.getenv('EKG_KGIRI_KEY_CACHE_SIZE', str(DEFAULT_IDENTITY_KEY_CACHE_SIZE))
+    )
+)(_parse_identity_key_string)
+
+
+def set_identity_key_cache_size(size: int | None) -> None:
+    """
+    Set the maximum number of strings for which parse_identity_key() remembers the key,
+    None for no limit and 0 to not remember any. Can also be set with env var
+    EKG_KGIRI_KEY_CACHE_SIZE (default is DEFAULT_IDENTITY_KEY_CACHE_SIZE).
+    """
+    global _parse_identity_key_cached
+    _parse_identity_key_cached = lru_cache(maxsize=size)(_parse_identity_key_string)
+
+
+def identity_key_cache_info() -> Any:
+    """The hits, misses, maxsize and currsize of the cache of parse_identity_key()"""
+    return _parse_identity_key_cached.cache_info()
 
 
 def parse_identity_key(legacy_id: Any) -> str | None:
-    """Try to convert a given value into a string that we can use to construct a non-obfuscated KGIRI"""
+    """
+    Try to convert a given value into a string that we can use to construct a non-obfuscated KGIRI
+
+    The same values come up over and over again, so the keys of the most recently used
+    strings are remembered, see set_identity_key_cache_size().
+    """
     if isinstance(legacy_id, int):
         key = f'{legacy_id}'
     elif isinstance(legacy_id, str):
-        key = legacy_id.translate(special_char_map)
-
-        key = re.sub(
-            r"\b('?\w)",
-            lambda match: match.group(1).capitalize(),
-            inflection.dasherize(
-                _translate_to_human_readable(inflection.underscore(key))
-            ),
-        )
-
-        # key = inflection.titleize(key)
-        key = inflection.parameterize(key, separator='-')
-        # key = unidecode(legacy_id)
-        # key = stringcase.spinalcase(stringcase.lowercase(key))
-        # key = key.replace('"', '')
-        # key = key.replace('(', '-')
-        # key = key.replace(')', '-')
-        # key = key.replace('/', '-')
-        # key = key.replace('\\', '-')
-        # key = key.replace('=', '-')
-        # key = key.replace('>', '-')
-        # key = key.replace('<', '-')
-        # key = key.replace(':', '-')
-        # key = key.replace(',', '-')
-        # key = key.replace('|', '-')
-        # key = key.replace('&amp;', '-and-')
-        # key = key.replace('-&-', '-and-')
+        return _parse_identity_key_cached(str(legacy_id))
     elif isinstance(legacy_id, Timestamp):
         key = Literal(legacy_id).lower()
     else:
@@ -104,10 +151,7 @@ def parse_identity_key(legacy_id: Any) -> str | None:
             file=sys.stderr,
         )
         return None
-    key = key.replace('--', '-')
-    key = key.replace('--', '-')
-    key = strip_end(key, '-')
-    return key
+    return _tidy_identity_key(key)
 
 
 def parse_identity_key_with_prefix(prefix: str, legacy_id: Any) -> str | None:
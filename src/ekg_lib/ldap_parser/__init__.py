@@ -1,3 +1,4 @@
-from .parser import LdapParser  # noqa: F401
+from .parser import LdapParser
+from .various import set_cli_params
 
-__all__ = ['LdapParser']
+__all__ = ['LdapParser', 'set_cli_params']
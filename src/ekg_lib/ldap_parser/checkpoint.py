@@ -0,0 +1,164 @@
+import json
+import threading
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+from ldap3.protocol.formatters.formatters import format_time
+from ldap3.utils.conv import escape_filter_chars
+
+from ..log import log_item, warning
+
+CHANGE_ATTRIBUTES = ('modifyTimestamp', 'entryCSN')
+
+
+def _first_raw_value(entry: dict[str, Any], key: str) -> str | None:
+    """The first value of the given attribute as sent by the server, if any"""
+    for attributes in (entry.get('raw_attributes'), entry.get('attributes')):
+        if not attributes or key not in attributes:
+            continue
+        values = attributes[key]
+        if isinstance(values, list | tuple):
+            if not values:
+                continue
+            values = values[0]
+        if isinstance(values, bytes):
+            return values.decode('utf-8')
+        if isinstance(values, datetime):
+            return values.astimezone(UTC).strftime('%Y%m%d%H%M%SZ')
+        return str(values)
+    return None
+
+
+def change_value(entry: dict[str, Any], change_attribute: str) -> str | None:
+    """
+    The value of the change attribute of the given entry in a form that sorts in time
+    order. An entryCSN does that as is, a modifyTimestamp is a generalized time that can
+    have a fraction and a timezone offset so it's normalized to whole seconds in UTC.
+    """
+    value = _first_raw_value(entry, change_attribute)
+    if value is None or change_attribute != 'modifyTimestamp':
+        return value
+    timestamp = format_time(value.encode('utf-8'))
+    if not isinstance(timestamp, datetime):
+        return value
+    return timestamp.astimezone(UTC).strftime('%Y%m%d%H%M%SZ')
+
+
+def entry_key(entry: dict[str, Any]) -> str:
+    """The entryUUID of the given entry or, if the server doesn't have those, its DN"""
+    uuid = _first_raw_value(entry, 'entryUUID')
+    if uuid:
+        return uuid
+    return f'dn:{str(entry["dn"]).lower()}'
+
+
+class LdapCheckpoint:
+    """
+    Local checkpoint file that allows LdapParser to only harvest what changed since the
+    previous run.
+
+    The checkpoint records the high-water mark (the highest `modifyTimestamp` or
+    `entryCSN` seen) and the DN of every entry, keyed by its `entryUUID`. A run with a
+    checkpoint only asks the server for entries that changed at or after the high-water
+    mark, lists the entryUUIDs of all entries (without any other attributes) and reports
+    every entry of the previous run that is no longer there, or that got another DN, as
+    deleted.
+
+    A checkpoint that was made for another server, naming context, search filter or change
+    attribute is ignored, in which case the run harvests everything.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        server: str,
+        naming_context: str | None,
+        search_filter: str,
+        change_attribute: str = 'modifyTimestamp',
+        full: bool = False,
+    ) -> None:
+        self.path = path
+        self.scope = {
+            'server': server,
+            'naming_context': naming_context,
+            'search_filter': search_filter,
+            'change_attribute': change_attribute,
+        }
+        self.change_attribute = change_attribute
+        self.high_water_mark: str | None = None
+        self.entries: dict[str, str] = {}
+        # what this run saw, becomes the content of the checkpoint when the run succeeds
+        self.new_high_water_mark: str | None = None
+        self.seen: dict[str, str] = {}
+        self._lock = threading.Lock()
+        if path.exists() and not full:
+            try:
+                content = json.loads(path.read_text(encoding='utf-8'))
+                if content.get('scope') == self.scope:
+                    self.high_water_mark = content.get('high_water_mark')
+                    self.entries = content.get('entries', {})
+                else:
+                    warning(f'Ignoring LDAP checkpoint {path} made for another harvest')
+            except (ValueError, OSError, AttributeError) as err:
+                warning(f'Ignoring unreadable LDAP checkpoint {path}: {err}')
+        self.incremental = self.high_water_mark is not None
+        self.new_high_water_mark = self.high_water_mark
+        log_item('LDAP checkpoint', path)
+        log_item('Incremental', self.incremental)
+        if self.incremental:
+            log_item('High-water mark', self.high_water_mark)
+            log_item('Known entries', len(self.entries))
+
+    def search_filter(self, search_filter: str) -> str:
+        """The given search filter, restricted to what changed since the last run"""
+        if not self.incremental:
+            return search_filter
+        value = escape_filter_chars(self.high_water_mark)
+        # >= rather than > since a timestamp only has a resolution of one second
+        return f'(&{search_filter}({self.change_attribute}>={value}))'
+
+    def track(self, entry: dict[str, Any]) -> None:
+        """Record a harvested entry"""
+        value = change_value(entry, self.change_attribute)
+        key = entry_key(entry)
+        with self._lock:
+            self.seen[key] = str(entry['dn'])
+            if value is not None and (
+                self.new_high_water_mark is None or value > self.new_high_water_mark
+            ):
+                self.new_high_water_mark = value
+
+    def list_entry(self, entry: dict[str, Any]) -> None:
+        """Record an entry found by the listing of all entryUUIDs"""
+        key = entry_key(entry)
+        with self._lock:
+            self.seen[key] = str(entry['dn'])
+
+    def deleted(self) -> list[tuple[str, str]]:
+        """The (key, DN) of the entries of the previous run that no longer exist"""
+        return sorted(
+            (key, dn)
+            for key, dn in self.entries.items()
+            if self.seen.get(key, '').lower() != dn.lower()
+        )
+
+    def save(self) -> None:
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+            tmp_path.write_text(
+                json.dumps(
+                    {
+                        'scope': self.scope,
+                        'high_water_mark': self.new_high_water_mark,
+                        'entries': self.seen,
+                    },
+                    indent=2,
+                    sort_keys=True,
+                ),
+                encoding='utf-8',
+            )
+            tmp_path.replace(self.path)
+        log_item('Saved LDAP checkpoint', self.path)
+        log_item('High-water mark', self.new_high_water_mark)
@@ -1,10 +1,14 @@
+import argparse
 import logging
 import sys
+import threading
 import time
 import traceback
 import typing
 from base64 import b64encode
-from datetime import datetime
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import UTC, datetime
 from io import BytesIO
 from pathlib import Path
 from typing import Any
@@ -29,16 +33,25 @@ from ldap3.utils.log import (
     set_library_log_detail_level,
 )
 from pyasn1.error import PyAsn1Error
-from rdflib import OWL, PROV, RDF, RDFS, XSD, Literal, URIRef, plugin
+from rdflib import OWL, PROV, RDF, RDFS, XSD, Literal, URIRef
 
 from ..dataset.various import export_graph
 from ..exceptions import CannotCapture, PagingNotSupported
-from ..kgiri import EKG_NS, kgiri_random, parse_identity_key_with_prefix
+from ..kgiri import (
+    EKG_NS,
+    kgiri_random,
+    parse_identity_key_with_prefix,
+    set_kgiri_base,
+    set_kgiri_base_replace,
+)
+from ..kgiri import namespace as kgiri_namespace
 from ..log import error, log, log_dump, log_error, log_exception, log_item, warning
 from ..main import dump_as_ttl_to_stdout
 from ..namespace import DATAOPS, LDAP, RAW
+from ..ntriples import NTriplesWriter
 from ..s3 import S3ObjectStore
 from ..string import str_to_binary
+from .checkpoint import LdapCheckpoint
 
 # logging.basicConfig(filename='ldap.log', level=logging.DEBUG)
 # logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
@@ -53,6 +66,12 @@ skip_naming_contexts = (
     'cn=virtual access controls',
 )
 
+DEFAULT_PAGE_SIZE = 250
+CONVERT_BATCH_SIZE = 500
+
+# A part of the directory that is harvested as one search: (base DN, search scope)
+Partition = tuple[str, typing.Any]
+
 
 def parse_ldap_domain(domain: str) -> str:
     x = domain.strip('\n').rsplit('.', 1)  # TODO: Support multiple levels of domains
@@ -73,7 +92,38 @@ def _log_who_am_i(conn: Connection) -> None:
         log_error("Couldn't get who_am_i" + str(e))
 
 
+def _init_convert_worker(
+    kgiri_base: str | None, kgiri_base_replace: str | None
+) -> None:
+    """Worker processes don't inherit the KGIRI settings of the parent, set them again"""
+    if kgiri_base:
+        set_kgiri_base(kgiri_base)
+    set_kgiri_base_replace(kgiri_base_replace)
+
+
+def _convert_entries(args: Any, entries: list[dict[str, Any]]) -> tuple[bytes, int]:
+    """Convert a batch of entries to N-Triples, returns the bytes and the number of triples"""
+    stream = BytesIO()
+    writer = NTriplesWriter(stream)
+    for entry in entries:
+        LdapEntry(args, entry, writer)  # type: ignore[arg-type]
+    writer.flush()
+    return stream.getvalue(), writer.triples_written
+
+
 class LdapParser:
+    """
+    Harvests all entries of an LDAP directory and writes them as N-Triples to the given stream.
+
+    By default all naming contexts are searched one after the other over one connection.
+    With `--ldap-max-connections` greater than 1 the naming contexts are harvested
+    concurrently, each over its own connection, and with `--ldap-split-subtrees` each
+    naming context is split up further into its direct children (typically the OUs) so
+    that one large naming context can be harvested concurrently as well. With
+    `--ldap-convert-workers` the entries are converted to RDF in a pool of processes
+    rather than in the harvesting threads.
+    """
+
     skip_rdf_generation = False  # set to true to test/debug the overall flow of the app
 
     def __init__(self, args: Any, stream: typing.BinaryIO | None = None) -> None:
@@ -89,13 +139,34 @@ class LdapParser:
         self.add_namespaces()
         self.bind_dn = args.ldap_bind_dn
         self.bind_auth = args.ldap_bind_auth
-        self.paged_size: int | None = 250
+        self.paged_size: int | None = (
+            getattr(args, 'ldap_page_size', None) or DEFAULT_PAGE_SIZE
+        )
+        self.max_connections = getattr(args, 'ldap_max_connections', None) or 1
+        self.split_subtrees = getattr(args, 'ldap_split_subtrees', False)
+        self.convert_workers = getattr(args, 'ldap_convert_workers', None) or 0
+        self._lock = threading.Lock()
         self.search_filter = args.ldap_search_filter
         self.stream = stream
+        self.writer = NTriplesWriter(stream) if stream is not None else None
         self.ldap_host = args.ldap_host
         self.ldap_port = args.ldap_port
         self.ldap_host_port = f'{args.ldap_host}:{args.ldap_port}'
         self.ldap_timeout = args.ldap_timeout
+        self.checkpoint: LdapCheckpoint | None = None
+        self.harvested = False
+        checkpoint_file = getattr(args, 'ldap_checkpoint', None)
+        if checkpoint_file:
+            self.checkpoint = LdapCheckpoint(
+                Path(checkpoint_file),
+                server=self.ldap_host_port,
+                naming_context=self.naming_context,
+                search_filter=args.ldap_search_filter,
+                change_attribute=getattr(args, 'ldap_change_attribute', None)
+                or 'modifyTimestamp',
+                full=getattr(args, 'ldap_full_harvest', False),
+            )
+            self.search_filter = self.checkpoint.search_filter(self.search_filter)
         #
         # TODO: Support ldaps as well
         #
@@ -158,6 +229,11 @@ class LdapParser:
             log_error(f'LDAP Socket Receive Error: {e}')
             rc = 7
 
+        if self.writer is not None:
+            self.writer.flush()
+            log_item('Triples written', self.writer.triples_written)
+        if self.checkpoint is not None and rc == 0 and self.harvested:
+            self.checkpoint.save()
         log_item('Seconds', time.time() - start)
         # activity_iri = self.prov_activity_start(xlsx_iri)
         # self.prov_activity_end(activity_iri)
@@ -200,9 +276,7 @@ class LdapParser:
 
             if not conn.bind():
                 log_error(
-                    "Can't bind to the LDAP server with the provided credentials ({})'".format(
-                        self.bind_dn
-                    )
+                    f"Can't bind to the LDAP server with the provided credentials ({self.bind_dn})'"
                 )
                 return 1
 
@@ -231,6 +305,9 @@ class LdapParser:
                     )
                     self.paged_size = None
                     rc = self._process_naming_contexts(server, conn)
+                if rc == 0 and self.checkpoint and self.checkpoint.incremental:
+                    rc = self._process_deletions(server, conn)
+                self.harvested = True
             except Exception as e:
                 log_error(f'Unknown exception: {e}')
                 traceback.print_exc()
@@ -242,14 +319,215 @@ class LdapParser:
         if (
             self.returned_entries == 0
         ):  # Getting nothing is probably an error so let's not return zero here.
-            rc = 2
+            # unless nothing changed since the last incremental run
+            checkpoint = self.checkpoint
+            if not (checkpoint and checkpoint.incremental and checkpoint.seen):
+                rc = 2
         return rc
 
     def _process_naming_contexts(self, server: SchemaInfo, conn: Connection) -> int:
+        if self.max_connections > 1 or self.split_subtrees or self.convert_workers:
+            return self._process_partitions(server, conn)
         if self.naming_context:
             return self._process_one_naming_contexts(conn)
         return self._process_all_naming_contexts(server, conn)
 
+    def _bases(self, server: SchemaInfo) -> list[str]:
+        if self.naming_context:
+            return [self.naming_context]
+        bases = []
+        for naming_context in _naming_contexts(server.info):
+            if not naming_context.strip():
+                continue
+            if naming_context.lower() in skip_naming_contexts:
+                log_item('Skipping', naming_context)
+                continue
+            bases.append(naming_context)
+        return bases
+
+    def _partitions(self, server: SchemaInfo, conn: Connection) -> list[Partition]:
+        """
+        The parts of the directory that can be harvested independently, either each naming
+        context as a whole or, with split_subtrees, the naming context entry itself plus
+        each of the sub-trees directly underneath it.
+        """
+        partitions: list[Partition] = []
+        for base in self._bases(server):
+            log_item('Naming Context', base)
+            if not self.split_subtrees:
+                partitions.append((base, ldap3.SUBTREE))
+                continue
+            partitions.append((base, ldap3.BASE))
+            for child in self._children(conn, base):
+                partitions.append((child, ldap3.SUBTREE))
+        log_item('Partitions', len(partitions))
+        return partitions
+
+    def _children(self, conn: Connection, base: str) -> list[str]:
+        children = self._list_entries(
+            conn, base, ldap3.LEVEL, '(objectClass=*)', ldap3.NO_ATTRIBUTES
+        )
+        # some servers include the base itself in a one-level search
+        return sorted(
+            dn
+            for dn in (self.dn_of_entry(child) for child in children)
+            if dn.lower() != base.lower()
+        )
+
+    def _list_entries(
+        self,
+        conn: Connection,
+        base: str,
+        scope: Any,
+        search_filter: str,
+        attributes: Any,
+    ) -> Any:
+        """Paged search for just the given attributes, only yields the actual entries"""
+        conn.raise_exceptions = True
+        try:
+            for entry in conn.extend.standard.paged_search(
+                base,
+                search_filter=search_filter,
+                search_scope=scope,
+                dereference_aliases=ldap3.DEREF_SEARCH,
+                attributes=attributes,
+                paged_size=self.paged_size,
+                paged_criticality=self.paged_size is not None,
+                generator=True,
+            ):
+                if 'dn' in entry:
+                    yield entry
+        except LDAPUnavailableCriticalExtensionResult as e:
+            log_exception(e)
+            raise PagingNotSupported(e.message)
+        except LDAPOperationResult as e:
+            raise CannotCapture(e.message)
+
+    def _process_deletions(self, server: SchemaInfo, conn: Connection) -> int:
+        """
+        List the entryUUIDs of all entries and write a tombstone for each entry of the
+        previous run that is gone.
+        """
+        assert self.checkpoint is not None
+        try:
+            for base in self._bases(server):
+                for entry in self._list_entries(
+                    conn,
+                    base,
+                    ldap3.SUBTREE,
+                    self.args.ldap_search_filter,
+                    ['entryUUID'],
+                ):
+                    self.checkpoint.list_entry(entry)
+        except CannotCapture:
+            log_error('Cannot list the LDAP entries')
+            return 1
+        deleted = self.checkpoint.deleted()
+        log_item('Deleted entries', len(deleted))
+        deleted_at = Literal(datetime.now(UTC))
+        for key, dn in deleted:
+            if self.verbose:
+                log_item('Deleted', dn)
+            if self.writer is not None:
+                self.writer.write(tombstone_triples(key, dn, deleted_at))
+        return 0
+
+    def _process_partitions(self, server: SchemaInfo, conn: Connection) -> int:
+        log_item('Max connections', self.max_connections)
+        log_item('Convert workers', self.convert_workers)
+        try:
+            partitions = self._partitions(server, conn)
+        except CannotCapture:
+            log_error('Cannot capture LDAP data')
+            return 1
+        converter = None
+        if self.convert_workers:
+            converter = ProcessPoolExecutor(
+                max_workers=self.convert_workers,
+                initializer=_init_convert_worker,
+                initargs=(
+                    kgiri_namespace.kgiri_base,
+                    kgiri_namespace.kgiri_base_replace,
+                ),
+            )
+        try:
+            with ThreadPoolExecutor(
+                max_workers=self.max_connections, thread_name_prefix='ldap'
+            ) as pool:
+                futures = [
+                    pool.submit(self._process_partition, server, base, scope, converter)
+                    for base, scope in partitions
+                ]
+                return max((future.result() for future in futures), default=0)
+        finally:
+            if converter is not None:
+                converter.shutdown()
+
+    def _process_partition(
+        self,
+        server: ldap3.Server,
+        base: str,
+        scope: Any,
+        converter: ProcessPoolExecutor | None,
+    ) -> int:
+        """Harvest one partition over its own connection"""
+        log_item('Partition', f'{scope}: {base}')
+        with self._create_connection(server) as conn:
+            if not conn.bind():
+                log_error(f"Can't bind to the LDAP server for partition {base}")
+                return 1
+            try:
+                entries = self._process_search(
+                    conn=conn, base=base, scope=scope, expand_base=False
+                )
+                if converter is None:
+                    for entry in entries:
+                        self.process_entry(entry)
+                else:
+                    self._convert_partition(entries, converter)
+            except CannotCapture:
+                log_error(f'Cannot capture LDAP data under {base}')
+                return 1
+        return 0
+
+    def _convert_partition(self, entries: Any, converter: ProcessPoolExecutor) -> None:
+        """
+        Convert the entries of a partition in batches in the converter processes, writing
+        the results in order and keeping only a few batches in flight per partition.
+        """
+        args = argparse.Namespace(verbose=self.verbose)
+        pending: deque[tuple[Future[tuple[bytes, int]], int]] = deque()
+
+        def write_oldest() -> None:
+            future, count = pending.popleft()
+            data, triple_count = future.result()
+            if self.writer is not None:
+                self.writer.write_serialized(data, triple_count)
+            with self._lock:
+                self.processed_entries += count
+
+        def submit(batch: list[dict[str, Any]]) -> None:
+            pending.append((
+                converter.submit(_convert_entries, args, batch),
+                len(batch),
+            ))
+            if len(pending) > 2:
+                write_oldest()
+
+        batch: list[dict[str, Any]] = []
+        for entry in entries:
+            if self.skip_rdf_generation:
+                continue
+            # only send what LdapEntry needs, not the raw attributes
+            batch.append({'dn': entry['dn'], 'attributes': entry['attributes']})
+            if len(batch) >= CONVERT_BATCH_SIZE:
+                submit(batch)
+                batch = []
+        if batch:
+            submit(batch)
+        while pending:
+            write_oldest()
+
     def _process_one_naming_contexts(self, conn: Connection) -> int:
         rc = 0
         try:
@@ -285,8 +563,9 @@ class LdapParser:
     def process_entry(self, entry: Entry) -> None:
         if self.skip_rdf_generation:
             return
-        LdapEntry(self.args, entry, self.stream)
-        self.processed_entries += 1
+        LdapEntry(self.args, entry, self.writer)
+        with self._lock:
+            self.processed_entries += 1
 
     @staticmethod
     def has_subordinates(entry: Entry | dict[str, Any]) -> bool:
@@ -319,9 +598,8 @@ class LdapParser:
         if hasattr(entry, 'entry_dn'):
             dn = entry.entry_dn  # type: ignore[attr-defined]
             return str(dn) if dn is not None else ''
-        if isinstance(entry, dict):
-            if 'dn' in entry:
-                return str(entry['dn'])
+        if isinstance(entry, dict) and 'dn' in entry:
+            return str(entry['dn'])
         result = LdapParser.value_of_attribute_with_key(entry, 'dn')  # type: ignore[arg-type]
         if result is None:
             raise ValueError('Could not find dn in entry')
@@ -377,18 +655,26 @@ class LdapParser:
         except LDAPOperationResult as e:
             raise CannotCapture(e.message)
 
-    def _process_search(self, conn: Connection, base: str, scope: int) -> Any:
+    def _process_search(
+        self, conn: Connection, base: str, scope: int, expand_base: bool = True
+    ) -> Any:
         entries = self._process_search_get_entries(conn, base, scope)
-        yield from self._process_entries(conn, base, scope, entries)
+        yield from self._process_entries(conn, base, scope, entries, expand_base)
 
     def _process_entries(
-        self, conn: Connection, base: str, scope: int, entries: Any
+        self,
+        conn: Connection,
+        base: str,
+        scope: int,
+        entries: Any,
+        expand_base: bool = True,
     ) -> Any:
         returned_entries = 0
         try:
             for entry in entries:
                 returned_entries += 1
-                self.returned_entries += 1
+                with self._lock:
+                    self.returned_entries += 1
                 yield from self._process_entry(entry)
         except LDAPUnavailableCriticalExtensionResult as e:
             log_exception(e)
@@ -397,7 +683,7 @@ class LdapParser:
             raise CannotCapture(e.message)
         if self.verbose:
             log_item('Returned Entries', returned_entries)
-        if returned_entries == 1 and scope is ldap3.BASE:
+        if expand_base and returned_entries == 1 and scope is ldap3.BASE:
             yield from self._process_search(conn, base, ldap3.SUBTREE)
 
     def _process_entry(self, entry: Entry) -> Any:
@@ -405,6 +691,8 @@ class LdapParser:
             log_dump(f'Entry {self.returned_entries}', entry)
         if 'dn' in entry:
             self.log_entry(entry)
+            if self.checkpoint is not None:
+                self.checkpoint.track(entry)
             # has_subordinates = self.has_subordinates(entry)
             # log_item("Has Subordinates", has_subordinates)
             # if has_subordinates:
@@ -485,34 +773,38 @@ def _naming_contexts(info: SchemaInfo) -> Any:
             yield str(info.naming_contexts)
 
 
-_substitution_iri_map = {
-    # replace the 'placeholder' IRI in the serialized stream with the desired one
-    rdflib.term.URIRef(
-        'http://www.w3.org/2001/XMLSchema#base64BinaryString'
-    ).toPython(): XSD.base64Binary.toPython()
-}
-
-
-def _substitute_iris(serialized_graph: BytesIO) -> BytesIO:
-    bts = BytesIO(b'')
-    for frm, to in _substitution_iri_map.items():
-        bts.write(serialized_graph.getvalue().decode().replace(frm, to).encode())
-    return bts
+def tombstone_triples(key: str, dn: str, deleted_at: Literal) -> list[Any]:
+    """
+    The triples that tell that the entry with the given DN (and, unless the key is a DN,
+    entryUUID) has been deleted from the directory.
+    """
+    identity_key = parse_identity_key_with_prefix('ldap-term', dn)
+    if identity_key is None:
+        raise ValueError(f'Could not parse identity key for dn: {dn}')
+    entry_iri = EKG_NS['KGIRI'].term(identity_key)
+    triples = [
+        (entry_iri, RDF.type, LDAP.Term),
+        (entry_iri, LDAP.entryStatus, Literal('Deleted')),
+        (entry_iri, PROV.invalidatedAtTime, deleted_at),
+    ]
+    if not key.startswith('dn:'):
+        triples.append((entry_iri, OWL.sameAs, EKG_NS['KGIRI'].term(f'guid:{key}')))
+    return triples
 
 
 class LdapEntry:
     """One LdapEntry represents, as the name suggests, one entry in LDAP, for which this class generates the
-    RDF representation in one Graph that gets streamed to the given output stream.
+    RDF triples that get written, as N-Triples, to the given writer.
     """
 
     entry: Entry
 
-    def __init__(self, args: Any, entry: Entry, stream: typing.BinaryIO | None) -> None:
+    def __init__(self, args: Any, entry: Entry, writer: NTriplesWriter | None) -> None:
         self.args = args
         self.verbose = args.verbose
-        self.g = rdflib.Graph()
-        self._add_namespaces()
-        self.stream = stream
+        # the triples of this entry, in the order they were added, without duplicates
+        self.triples: dict[tuple[Any, Any, Any], None] = {}
+        self.writer = writer
         self.entry = entry
         if isinstance(self.entry, dict):
             self.dn = self.entry['dn']
@@ -522,23 +814,13 @@ class LdapEntry:
             self.attributes = self.entry.entry_attributes_as_dict()
         self.entry_iri = self._parse_entry_dn(self.dn)
         self._parse_other()
-        self._graph_to_stream()
-
-    def _add_namespaces(self) -> None:
-        """Define the @base and @prefix to be used when we would dump the graph for one entry as turtle.
-        In production though we would always be streaming this as N-Triples so there's no real need
-        for doing this in that case.
-        """
-        self.g.base = EKG_NS['KGIRI']
-        self.g.namespace_manager.bind('prov', PROV)
-        self.g.namespace_manager.bind('raw', RAW)
-        self.g.namespace_manager.bind('dataops', DATAOPS)
+        self._triples_to_stream()
 
     def _add(self, triple: tuple[Any, Any, Any]) -> None:
         if self.verbose:
             s, p, o = triple
             log(f'<{s}> <{p}> {o}')
-        self.g.add(triple)
+        self.triples[triple] = None
 
     def _parse_entry_dn(self, dn: str) -> URIRef:
         key = parse_identity_key_with_prefix('ldap-term', dn)
@@ -592,13 +874,12 @@ class LdapEntry:
                 Literal(base64_url, datatype=XSD.anyURI),
             ))
 
-            # NB: Can't use rdflib.Literal with the correct datatype xsd:base64Binary,
-            # as it messes with the value (decodes it), using a placeholder xsd:base64BinaryString
-            # which gets replaced in the output stream, see _substitute_iris
+            # NB: normalize=False, otherwise rdflib decodes the value and we'd lose the
+            # lexical form that we want to write out as is
             self._add((
                 self.entry_iri,
                 LDAP.term(key),
-                Literal(base64_bytes, datatype=XSD.term('base64BinaryString')),
+                Literal(base64_bytes, datatype=XSD.base64Binary, normalize=False),
             ))
 
     def parse_common_name(self, values: Any) -> None:
@@ -668,12 +949,11 @@ class LdapEntry:
         # TODO: When objectClass is a person and hasSubordinates is true can we
         #       then always conclude its a LineManager?
         #
-        pass
 
     def _parse_object_class(self, values: Any) -> None:
         """Translate object class to an RDF type"""
         for value in values:
-            self._add((self.entry_iri, RDF.type, self._parse_value_to_rdf_type(value)))  # noqa: E501
+            self._add((self.entry_iri, RDF.type, self._parse_value_to_rdf_type(value)))
 
     @staticmethod
     def _parse_value_to_rdf_type(value: Any) -> URIRef:
@@ -683,15 +963,12 @@ class LdapEntry:
     def _parse_entry_status(self) -> None:
         if isinstance(
             self.entry, dict
-        ):  # No status when entry is a 'searchResEntry' # noqa: E501
+        ):  # No status when entry is a 'searchResEntry'
             return
         status = self.entry.entry_status
         self._add((self.entry_iri, LDAP.entryStatus, Literal(status)))
 
-    def _graph_to_stream(self) -> None:
-        if self.stream is None:
+    def _triples_to_stream(self) -> None:
+        if self.writer is None:
             return
-        str_stream = BytesIO(b'')
-        serializer = plugin.get('ntriples', plugin.Serializer)(self.g)  # type: ignore[attr-defined]
-        serializer.serialize(str_stream)
-        self.stream.write(_substitute_iris(str_stream).getvalue())
+        self.writer.write(self.triples)
@@ -0,0 +1,60 @@
+import os
+from argparse import ArgumentParser
+from typing import Any
+
+from .checkpoint import CHANGE_ATTRIBUTES
+from .parser import DEFAULT_PAGE_SIZE
+
+
+def set_cli_params(parser: ArgumentParser) -> Any:
+    group = parser.add_argument_group('LDAP Harvesting')
+    group.add_argument(
+        '--ldap-page-size',
+        help='The number of entries per page of a paged search, '
+        'can also be set with env var EKG_LDAP_PAGE_SIZE',
+        type=int,
+        default=int(os.getenv('EKG_LDAP_PAGE_SIZE', str(DEFAULT_PAGE_SIZE))),
+    )
+    group.add_argument(
+        '--ldap-max-connections',
+        help='The number of naming contexts or sub-trees that are harvested '
+        'concurrently, each over its own connection, '
+        'can also be set with env var EKG_LDAP_MAX_CONNECTIONS',
+        type=int,
+        default=int(os.getenv('EKG_LDAP_MAX_CONNECTIONS', '1')),
+    )
+    group.add_argument(
+        '--ldap-split-subtrees',
+        help='Harvest each of the direct children (e.g. the OUs) of a naming context '
+        'as a separate sub-tree',
+        default=False,
+        action='store_true',
+    )
+    group.add_argument(
+        '--ldap-convert-workers',
+        help='The number of processes that convert entries to RDF, '
+        'default 0 means that entries are converted in the harvesting threads, '
+        'can also be set with env var EKG_LDAP_CONVERT_WORKERS',
+        type=int,
+        default=int(os.getenv('EKG_LDAP_CONVERT_WORKERS', '0')),
+    )
+    group.add_argument(
+        '--ldap-checkpoint',
+        help='Harvest incrementally: only the entries that changed since the run that '
+        'wrote the given checkpoint file plus tombstones for the deleted entries, '
+        'can also be set with env var EKG_LDAP_CHECKPOINT',
+        default=os.getenv('EKG_LDAP_CHECKPOINT'),
+    )
+    group.add_argument(
+        '--ldap-change-attribute',
+        help='The attribute that tells when an entry changed, default modifyTimestamp',
+        choices=CHANGE_ATTRIBUTES,
+        default=os.getenv('EKG_LDAP_CHANGE_ATTRIBUTE', 'modifyTimestamp'),
+    )
+    group.add_argument(
+        '--ldap-full-harvest',
+        help='Ignore the content of the checkpoint file, harvest everything and '
+        'write a new checkpoint',
+        default=False,
+        action='store_true',
+    )
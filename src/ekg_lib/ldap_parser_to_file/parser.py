@@ -6,6 +6,7 @@ from ..data_source import set_cli_params as data_source_set_cli_params
 from ..kgiri import set_cli_params as kgiri_set_cli_params
 from ..kgiri import set_kgiri_base
 from ..ldap_parser import LdapParser
+from ..ldap_parser import set_cli_params as ldap_set_cli_params
 from ..log import log_item
 
 
@@ -55,13 +56,14 @@ def main() -> int:
     parser.add_argument(
         '--ldap-timeout', help='Specify timeout in seconds', type=int, default=60
     )
+    ldap_set_cli_params(parser)
     kgiri_set_cli_params(parser)
     data_source_set_cli_params(parser)
 
     args = parser.parse_args()
     set_kgiri_base(args.kgiri_base)
 
-    rc: int = 0  # noqa
+    rc: int = 0
 
     if args.output is None:
         log_item('Streaming output to', 'stdout')
@@ -3,6 +3,7 @@ import argparse
 from ..data_source import set_cli_params as data_source_set_cli_params
 from ..kgiri import set_cli_params as kgiri_set_cli_params
 from ..kgiri import set_kgiri_base
+from ..ldap_parser import set_cli_params as ldap_set_cli_params
 
 # from ..ldap_parser import LdapParser
 from ..s3 import set_cli_params as s3_set_cli_params
@@ -46,6 +47,7 @@ def main() -> int:
     parser.add_argument(
         '--ldap-timeout', help='Specify timeout in seconds', type=int, default=60
     )
+    ldap_set_cli_params(parser)
     kgiri_set_cli_params(parser)
     data_source_set_cli_params(parser)
     s3_set_cli_params(parser)
@@ -1,3 +1,10 @@
-from .main import load_env, load_rdf_file_into_graph, dump_as_ttl_to_stdout  # noqa: F401
+from .inference import RuleInference, owlrl_closure
+from .main import load_env, load_rdf_file_into_graph, dump_as_ttl_to_stdout
 
-__all__ = ['load_env', 'load_rdf_file_into_graph', 'dump_as_ttl_to_stdout']
+__all__ = [
+    'RuleInference',
+    'dump_as_ttl_to_stdout',
+    'load_env',
+    'load_rdf_file_into_graph',
+    'owlrl_closure',
+]
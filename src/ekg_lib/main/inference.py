@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+from collections import deque
+from collections.abc import Callable, Collection, Iterable, Iterator
+from typing import Any
+
+import owlrl
+from rdflib import OWL, RDF, RDFS, BNode, Graph, URIRef
+
+from ..log.various import value_error
+
+Triple = tuple[Any, Any, Any]
+
+RULE_SUB_CLASS_OF = 'subClassOf'
+RULE_SUB_PROPERTY_OF = 'subPropertyOf'
+RULE_INVERSE_OF = 'inverseOf'
+RULE_DOMAIN = 'domain'
+RULE_RANGE = 'range'
+RULE_THING = 'thing'
+
+DEFAULT_RULES = (
+    RULE_SUB_CLASS_OF,
+    RULE_SUB_PROPERTY_OF,
+    RULE_INVERSE_OF,
+    RULE_DOMAIN,
+    RULE_RANGE,
+)
+
+
+def owlrl_closure(graph: Graph) -> None:
+    """Expand the given graph with the full RDFS and OWL-RL closure"""
+    owlrl.RDFSClosure.RDFS_Semantics(graph, True, True, True)
+    closure_class = owlrl.return_closure_class(
+        owl_closure=True, rdfs_closure=True, owl_extras=True, trimming=True
+    )
+    owlrl.DeductiveClosure(
+        closure_class,
+        improved_datatypes=False,
+        rdfs_closure=True,
+        axiomatic_triples=False,
+        datatype_axioms=False,
+    ).expand(graph)
+
+
+def _add(index: dict[Any, list[Any]], key: Any, value: Any) -> None:
+    # lists rather than sets, so that the order of the inferred triples is stable
+    values = index.setdefault(key, [])
+    if value not in values:
+        values.append(value)
+
+
+def _transitive_closure(direct: dict[Any, list[Any]]) -> dict[Any, list[Any]]:
+    closure: dict[Any, list[Any]] = {}
+    for start, nodes in direct.items():
+        reachable: list[Any] = []
+        todo = deque(nodes)
+        while todo:
+            node = todo.popleft()
+            if node != start and node not in reachable:
+                reachable.append(node)
+                todo.extend(direct.get(node, ()))
+        if reachable:
+            closure[start] = reachable
+    return closure
+
+
+class RuleInference:
+    """
+    Lightweight forward chaining reasoner that only applies a declared set of rules,
+    as a much cheaper alternative to the complete OWL-RL closure when only a handful
+    of entailments are needed:
+
+    - `subClassOf`: `x a C` and `C rdfs:subClassOf D` gives `x a D`
+    - `subPropertyOf`: `x p y` and `p rdfs:subPropertyOf q` gives `x q y`
+    - `inverseOf`: `x p y` and `p owl:inverseOf q` (or `p a owl:SymmetricProperty`)
+      gives `y q x`
+    - `domain`: `x p y` and `p rdfs:domain C` gives `x a C`
+    - `range`: `x p y` and `p rdfs:range C` gives `y a C`
+    - `thing`: `x p y` gives `x a owl:Thing` and `y a owl:Thing`
+
+    The class and property hierarchies, domains, ranges and inverses are read once from
+    the given schema graph and indexed, with the hierarchies transitively closed. The
+    data triples are then pushed through the rules one by one until no new triples
+    follow, where every rule is a lookup in those indexes rather than a query over the
+    whole graph. Like the trimming in OWL-RL, nothing is typed as `rdfs:Resource`.
+
+    The new triples are added in the order in which they're inferred, so that the
+    order in which the graph returns them doesn't depend on hashing.
+    """
+
+    def __init__(self, schema: Graph, rules: Iterable[str] = DEFAULT_RULES) -> None:
+        self.rules = tuple(rules)
+        self._rules: dict[str, Callable[[Triple], Iterator[Triple]]] = {
+            RULE_SUB_CLASS_OF: self._sub_class_of,
+            RULE_SUB_PROPERTY_OF: self._sub_property_of,
+            RULE_INVERSE_OF: self._inverse_of,
+            RULE_DOMAIN: self._domain,
+            RULE_RANGE: self._range,
+            RULE_THING: self._thing,
+        }
+        unknown = [rule for rule in self.rules if rule not in self._rules]
+        if unknown:
+            raise value_error(f'Unknown inference rule(s): {", ".join(unknown)}')
+        self._apply = [self._rules[rule] for rule in self.rules]
+        self._index(schema)
+
+    def _index(self, schema: Graph) -> None:
+        super_classes: dict[Any, list[Any]] = {}
+        for sub, sup in schema.subject_objects(RDFS.subClassOf):
+            _add(super_classes, sub, sup)
+        self.super_classes = _transitive_closure(super_classes)
+        super_properties: dict[Any, list[Any]] = {}
+        for sub, sup in schema.subject_objects(RDFS.subPropertyOf):
+            _add(super_properties, sub, sup)
+        self.super_properties = _transitive_closure(super_properties)
+        self.domains: dict[Any, list[Any]] = {}
+        for prop, cls in schema.subject_objects(RDFS.domain):
+            _add(self.domains, prop, cls)
+        self.ranges: dict[Any, list[Any]] = {}
+        for prop, cls in schema.subject_objects(RDFS.range):
+            _add(self.ranges, prop, cls)
+        self.inverses: dict[Any, list[Any]] = {}
+        for prop, inverse in schema.subject_objects(OWL.inverseOf):
+            _add(self.inverses, prop, inverse)
+            _add(self.inverses, inverse, prop)
+        for prop in schema.subjects(RDF.type, OWL.SymmetricProperty):
+            _add(self.inverses, prop, prop)
+
+    def _sub_class_of(self, triple: Triple) -> Iterator[Triple]:
+        s, p, o = triple
+        if p == RDF.type:
+            for cls in self.super_classes.get(o, ()):
+                yield s, RDF.type, cls
+
+    def _sub_property_of(self, triple: Triple) -> Iterator[Triple]:
+        s, p, o = triple
+        for prop in self.super_properties.get(p, ()):
+            yield s, prop, o
+
+    def _inverse_of(self, triple: Triple) -> Iterator[Triple]:
+        s, p, o = triple
+        if isinstance(o, (URIRef, BNode)):
+            for prop in self.inverses.get(p, ()):
+                yield o, prop, s
+
+    def _domain(self, triple: Triple) -> Iterator[Triple]:
+        s, p, _ = triple
+        for cls in self.domains.get(p, ()):
+            yield s, RDF.type, cls
+
+    def _range(self, triple: Triple) -> Iterator[Triple]:
+        _, p, o = triple
+        for cls in self.ranges.get(p, ()):
+            yield o, RDF.type, cls
+
+    @staticmethod
+    def _thing(triple: Triple) -> Iterator[Triple]:
+        s, _, o = triple
+        yield s, RDF.type, OWL.Thing
+        yield o, RDF.type, OWL.Thing
+
+    def infer(self, g: Graph, exclude: Collection[Triple] = ()) -> list[Triple]:
+        """
+        Return the triples that follow from the triples in g, except the excluded ones
+        (typically the schema, whose consequences are known already), and that aren't
+        in g yet
+        """
+        todo = deque(triple for triple in g if triple not in exclude)
+        seen = set(todo)
+        inferred = []
+        while todo:
+            triple = todo.popleft()
+            for apply in self._apply:
+                for new in apply(triple):
+                    if new in seen or new[2] == RDFS.Resource:
+                        continue
+                    seen.add(new)
+                    todo.append(new)
+                    if new not in g:
+                        inferred.append(new)
+        return inferred
+
+    def expand(self, g: Graph, exclude: Collection[Triple] = ()) -> int:
+        """Add everything that follows from the triples in g, returns the number added"""
+        inferred = self.infer(g, exclude)
+        g.addN((s, p, o, g) for s, p, o in inferred)
+        return len(inferred)
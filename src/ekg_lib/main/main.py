@@ -26,14 +26,20 @@ def load_rdf_file_into_graph(graph: rdflib.Graph, rdf_file: pathlib.Path) -> Non
         raise value_error(f'File does not exist: {rdf_file}')
     with rdf_file.open() as f:
         graph.parse(source=f, format='turtle')  # TODO: support any RDF file
-        kgiri_replace_iri_in_graph(graph)
+        _replace_kgiris(graph)
 
 
 def load_rdf_stream_into_graph(graph: rdflib.Graph, rdf_stream: BytesIO) -> None:
     graph.parse(
         source=rdf_stream, format='turtle'
     )  # TODO: support any RDF file. # noqa: E501
-    kgiri_replace_iri_in_graph(graph)
+    _replace_kgiris(graph)
+
+
+def _replace_kgiris(graph: rdflib.Graph) -> None:
+    replaced = kgiri_replace_iri_in_graph(graph)
+    if replaced:
+        log_item('Replaced KGIRIs', replaced)
 
 
 def dump_as_ttl_to_stdout(graph: Graph) -> None:
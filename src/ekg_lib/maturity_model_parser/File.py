@@ -99,8 +99,22 @@ def copy_template_fragment(from_path: Path, config: Config) -> None:
     File.copy(config=config, from_path=template_path, to_path=from_path)
 
 
+def write_generated_file(
+    config: Config, path: Path, data: str, inputs: str | None = None
+) -> None:
+    """Write a generated file, via the build manifest when there is one"""
+    if config.manifest is not None:
+        config.manifest.write(path, data, inputs)
+    else:
+        File(mkdocs=config.mkdocs, path=path).rewrite_all_file(data)
+
+
 def copy_fragment(
-    md_file: MarkdownDocument, from_path: Path, config: Config, indent_prefix: str
+    md_file: MarkdownDocument,
+    from_path: Path,
+    config: Config,
+    indent_prefix: str,
+    inputs: str | None = None,
 ) -> None:
     if not from_path.exists():
         copy_template_fragment(from_path=from_path, config=config)
@@ -110,7 +124,8 @@ def copy_fragment(
     to_path2 = md_file.path.parent / fragment_base
     if config.verbose:
         log_item('to', to_path2)
-    File.copy(config=config, from_path=from_path, to_path=to_path2)
+    fragment = File.existing_file(mkdocs=config.mkdocs, path=from_path)
+    write_generated_file(config, to_path2, fragment.read_all_content(), inputs)
     # ...but make the include path relative to the docs root so the include-markdown
     # plugin (which resolves paths from docs_dir) can always find it.
     include_path = os.path.relpath(to_path2, config.docs_root)
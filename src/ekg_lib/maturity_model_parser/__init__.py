@@ -1,15 +1,18 @@
-from .model import MaturityModel  # noqa: F401
-from .pillar import MaturityModelPillar  # noqa: F401
+from .model import MaturityModel
+from .pillar import MaturityModelPillar
 from .graph import MaturityModelGraph
-from .loader import MaturityModelLoader  # noqa: F401
-from .exporter import GraphExporter  # noqa: F401
-from .markdown_generator import MaturityModelMarkdownGenerator  # noqa: F401
-from .config import Config  # noqa: F401
-from .__main__ import main, run_with_config, run_with_args  # noqa: F401
-from .capability_area import MaturityModelCapabilityArea  # noqa: F401
-from .capability import MaturityModelCapability  # noqa: F401
+from .loader import MaturityModelLoader
+from .exporter import GraphExporter
+from .markdown_generator import MaturityModelMarkdownGenerator
+from .cache import InferredGraphCache
+from .config import Config
+from .manifest import BuildManifest
+from .__main__ import main, run_with_config, run_with_args
+from .capability_area import MaturityModelCapabilityArea
+from .capability import MaturityModelCapability
 
 __all__ = [
+    'BuildManifest',
     'Config',
     'MaturityModel',
     'MaturityModelLoader',
@@ -19,6 +22,7 @@ __all__ = [
     'MaturityModelCapabilityArea',
     'MaturityModelCapability',
     'GraphExporter',
+    'InferredGraphCache',
     'main',
     'run_with_config',
     'run_with_args',
@@ -1,19 +1,42 @@
 import argparse
+import os
 import option
 from pathlib import Path
 
-from ekg_lib.maturity_model_parser.config import Config
+from ekg_lib.maturity_model_parser.cache import CACHE_DIR_NAME
+from ekg_lib.maturity_model_parser.config import REASONER_RULES, REASONERS, Config
+from ekg_lib.log import log_item
 from ekg_lib.maturity_model_parser.loader import MaturityModelLoader
+from ekg_lib.maturity_model_parser.manifest import (
+    MANIFEST_FILE_NAME,
+    BuildManifest,
+    input_files,
+    settings_for,
+)
 from ekg_lib.maturity_model_parser.markdown_generator import (
     MaturityModelMarkdownGenerator,
 )
 
 
 def run_with_config(config: Config) -> int:
+    manifest = None
+    if config.manifest_path is not None and not config.mkdocs:
+        manifest = BuildManifest.load(
+            config.manifest_path,
+            settings_for(config),
+            input_files(config),
+            force=config.force,
+        )
+        if manifest.is_up_to_date():
+            log_item('Build manifest', 'No input changed, nothing to generate')
+            return 0
+        config.manifest = manifest
     loader = MaturityModelLoader(config)
     graph = loader.load()
     generator = MaturityModelMarkdownGenerator(graph, config)
     generator.generate()
+    if manifest is not None:
+        manifest.save(input_files(config))
     # exporter = GraphExporter(graph)
     # return exporter.export(stream)
     return 0
@@ -34,6 +57,13 @@ def run_with_args(args: argparse.Namespace) -> int:
         fragments_root=Path(args.fragments_root),
         output_root=Path(args.output),
         pillar_dir_name=pillar_dir_name,
+        manifest_path=Path(args.manifest or Path(args.output) / MANIFEST_FILE_NAME),
+        force=args.force,
+        cache_dir=None
+        if args.no_cache
+        else Path(args.cache_dir or Path(args.output) / CACHE_DIR_NAME),
+        reasoner=args.reasoner,
+        max_workers=args.max_workers,
     )
     return run_with_config(config)
 
@@ -70,6 +100,49 @@ def main() -> int:
     )
     parser.add_argument('--output', help='The output directory', required=True)
     parser.add_argument('--model', help='The name of the model', default='EKG Maturity')
+    parser.add_argument(
+        '--manifest',
+        help='The build manifest that records what was generated from which inputs, '
+        'so that only the pages whose inputs changed are generated again '
+        f'(default is {MANIFEST_FILE_NAME} in the output directory)',
+        required=False,
+    )
+    parser.add_argument(
+        '--force',
+        help='generate all pages, even when their inputs did not change',
+        default=False,
+        action='store_true',
+    )
+    parser.add_argument(
+        '--cache-dir',
+        help='The directory with the cached inferred graph, which is reused as long '
+        'as the ontologies and model files do not change (default is '
+        f'EKG_MATURITY_MODEL_CACHE_DIR or {CACHE_DIR_NAME} in the output directory)',
+        default=os.getenv('EKG_MATURITY_MODEL_CACHE_DIR', None),
+    )
+    parser.add_argument(
+        '--no-cache',
+        help='always load and infer the model, without using or updating the cache',
+        default=False,
+        action='store_true',
+    )
+    parser.add_argument(
+        '--reasoner',
+        help='How to infer the triples that the generator needs: "rules" only applies '
+        'the subClassOf, subPropertyOf, inverseOf, domain and range rules, "owlrl" '
+        'computes the complete OWL-RL closure (default is EKG_MATURITY_MODEL_REASONER '
+        f'or {REASONER_RULES})',
+        choices=REASONERS,
+        default=os.getenv('EKG_MATURITY_MODEL_REASONER', REASONER_RULES),
+    )
+    parser.add_argument(
+        '--max-workers',
+        help='Maximum number of threads that generate pages concurrently, the pages '
+        'are the same whatever the number of threads (default is '
+        'EKG_MATURITY_MODEL_MAX_WORKERS or 1)',
+        type=int,
+        default=int(os.getenv('EKG_MATURITY_MODEL_MAX_WORKERS', '1')),
+    )
 
     return run_with_args(parser.parse_args())
 
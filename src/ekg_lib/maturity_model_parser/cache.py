@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+from collections.abc import Iterable
+from pathlib import Path
+
+import owlrl
+import rdflib
+from rdflib import Graph
+
+from ..__about__ import __version__
+from ..kgiri import namespace as kgiri_namespace
+from ..log import log_item, warning
+
+CACHE_DIR_NAME = '.cache'
+
+
+class InferredGraphCache:
+    """
+    The inferred graph of a maturity model, kept on disk so that a build whose model
+    files didn't change can skip parsing and inferring, which is by far the slowest
+    step of the build.
+
+    The cache file is named after a hash of everything the inferred graph depends on:
+    the content of the ontologies and the model files, the reasoner, the versions of
+    ekg_lib, rdflib and owlrl, and the KGIRI base (replacement) that is applied while
+    loading. Only the
+    most recent cache file is kept.
+
+    The graph is pickled rather than serialized as N-Triples because the OWL-RL
+    closure produces "generalized" triples (with literals as subject) that no RDF
+    syntax can represent, because unpickling is an order of magnitude faster than
+    parsing, and because it keeps the order in which the store returns triples, so
+    that the generated pages are the same as without the cache. Only ever point the
+    cache directory at a directory you trust.
+    """
+
+    def __init__(self, directory: Path, key: str) -> None:
+        self.directory = directory
+        self.key = key
+        self.path = directory / f'inferred-{key}.pickle'
+
+    @classmethod
+    def for_inputs(
+        cls, directory: Path, inputs: Iterable[tuple[str, bytes]], reasoner: str
+    ) -> InferredGraphCache:
+        """
+        Return the cache for the given named input files and their content, inferred
+        with the given reasoner
+        """
+        digest = hashlib.sha256()
+        for setting in (
+            f'ekg_lib={__version__}',
+            f'rdflib={rdflib.__version__}',
+            f'owlrl={owlrl.__version__}',
+            f'reasoner={reasoner}',
+            f'kgiri_base={kgiri_namespace.kgiri_base}',
+            f'kgiri_base_replace={kgiri_namespace.kgiri_base_replace}',
+            f'kgiri_replace_enabled={kgiri_namespace.kgiri_replace_enabled}',
+        ):
+            digest.update(setting.encode('utf-8') + b'\0')
+        for name, content in inputs:
+            digest.update(name.encode('utf-8') + b'\0')
+            digest.update(hashlib.sha256(content).digest())
+        return cls(directory, digest.hexdigest())
+
+    def load(self) -> Graph | None:
+        """Return the cached inferred graph, or None on a cache miss"""
+        try:
+            with self.path.open('rb') as file:
+                g = pickle.load(file)
+        except FileNotFoundError:
+            log_item('Inferred graph cache', 'miss')
+            return None
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError) as err:
+            warning(f'Ignoring unreadable inferred graph cache {self.path}: {err}')
+            return None
+        if not isinstance(g, Graph):
+            warning(f'Ignoring inferred graph cache {self.path} without a graph')
+            return None
+        log_item('Inferred graph cache', f'hit, {len(g)} triples')
+        return g
+
+    def save(self, g: Graph) -> None:
+        """Store the given graph, replacing any earlier cache file"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temporary_path = self.path.with_suffix('.tmp')
+        with temporary_path.open('wb') as file:
+            pickle.dump(g, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, self.path)
+        log_item('Inferred graph cache', self.path)
+        for path in self.directory.glob('inferred-*.pickle'):
+            if path != self.path:
+                path.unlink(missing_ok=True)
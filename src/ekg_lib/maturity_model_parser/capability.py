@@ -11,6 +11,7 @@ from ekg_lib import log_item
 from ..namespace import MATURITY_MODEL
 from .config import Config
 from .File import copy_fragment, makedirs
+from .manifest import inputs_hash
 from .markdown_document import MarkdownDocument
 from .pages_yaml import PagesYaml
 
@@ -21,6 +22,16 @@ class MaturityModelCapability:
     class_label: str = 'Capability'
     class_label_plural: str = 'Capabilities'
     class_iri = MATURITY_MODEL.Capability
+    # the tabs of a capability page and the fragment that each of them includes
+    fragments: tuple[tuple[str, str], ...] = (
+        ('Intro', 'background-and-intro.md'),
+        ('Dimensions', 'dimensions.md'),
+        ('Levels', 'levels.md'),
+        ('Value', 'value.md'),
+        ('Traditional Approach', 'traditional-approach.md'),
+        ('EKG Approach', 'ekg-approach.md'),
+        ('Use cases', 'use-cases.md'),
+    )
 
     def __init__(
         self,
@@ -45,9 +56,25 @@ class MaturityModelCapability:
         self.fragments_dir = capability_area_fragments_dir / self.local_name
         log_item(f'{self.class_label} Fragments', relpath(self.fragments_dir, getcwd()))
         self.md_file: MarkdownDocument | None = None
+        self.inputs: str | None = None
         makedirs(self.full_dir, self.class_label)
 
+    def up_to_date(self) -> bool:
+        """Whether the previous build generated this page from the same inputs"""
+        manifest = self.config.manifest
+        if manifest is None:
+            return False
+        self.inputs = inputs_hash(
+            self.graph.fingerprint([self.node, self.area.node, self.area.pillar.node]),
+            [self.fragments_dir / name for _, name in self.fragments],
+        )
+        outputs = [self.full_dir / 'index.md']
+        outputs.extend(self.full_dir / name for _, name in self.fragments)
+        return manifest.up_to_date(outputs, self.inputs)
+
     def generate_markdown(self) -> None:
+        if self.up_to_date():
+            return
         self.md_file = MarkdownDocument(
             path=self.full_dir / 'index.md',
             metadata={'title': f'{self.number}. {self.name}'},
@@ -55,7 +82,7 @@ class MaturityModelCapability:
         self.generate_summary()
         self.copy_fragments()
         assert self.md_file is not None
-        self.md_file.create_md_file()
+        self.md_file.create_md_file(self.config.manifest, self.inputs)
 
     def generate_link_from_area_to_capability(self) -> None:
         assert self.area.md_file is not None
@@ -83,49 +110,15 @@ class MaturityModelCapability:
     def copy_fragments(self) -> None:
         assert self.md_file is not None
         indent_prefix = '    '
-        self.md_file.new_line('\n\n=== "Intro"')
-        copy_fragment(
-            self.md_file,
-            self.fragments_dir / 'background-and-intro.md',
-            self.config,
-            indent_prefix,
-        )
-        self.md_file.new_line('\n\n=== "Dimensions"')
-        copy_fragment(
-            self.md_file,
-            self.fragments_dir / 'dimensions.md',
-            self.config,
-            indent_prefix,
-        )
-        self.md_file.new_line('\n\n=== "Levels"')
-        copy_fragment(
-            self.md_file, self.fragments_dir / 'levels.md', self.config, indent_prefix
-        )
-        self.md_file.new_line('\n\n=== "Value"')
-        copy_fragment(
-            self.md_file, self.fragments_dir / 'value.md', self.config, indent_prefix
-        )
-        self.md_file.new_line('\n\n=== "Traditional Approach"')
-        copy_fragment(
-            self.md_file,
-            self.fragments_dir / 'traditional-approach.md',
-            self.config,
-            indent_prefix,
-        )
-        self.md_file.new_line('\n\n=== "EKG Approach"')
-        copy_fragment(
-            self.md_file,
-            self.fragments_dir / 'ekg-approach.md',
-            self.config,
-            indent_prefix,
-        )
-        self.md_file.new_line('\n\n=== "Use cases"')
-        copy_fragment(
-            self.md_file,
-            self.fragments_dir / 'use-cases.md',
-            self.config,
-            indent_prefix,
-        )
+        for tab_title, fragment_name in self.fragments:
+            self.md_file.new_line(f'\n\n=== "{tab_title}"')
+            copy_fragment(
+                self.md_file,
+                self.fragments_dir / fragment_name,
+                self.config,
+                indent_prefix,
+                self.inputs,
+            )
 
     # @classmethod
     # def generate_index_md(cls, area: MaturityModelCapabilityArea):
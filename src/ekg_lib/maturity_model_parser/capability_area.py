@@ -13,6 +13,7 @@ from ..log.various import log_item
 from ..namespace import MATURITY_MODEL
 from .config import Config
 from .File import makedirs
+from .manifest import inputs_hash
 from .markdown_document import MarkdownDocument
 
 if TYPE_CHECKING:
@@ -39,6 +40,7 @@ class MaturityModelCapabilityArea:
         self.node = area_node
         self.config = config
         self._capabilities: list[Any] = list()
+        self.inputs: str | None = None
 
         self.name = self.graph.name_for(self.node, self.class_label)
         self.local_name = self.graph.local_name_for(self.node, self.class_label)
@@ -53,14 +55,35 @@ class MaturityModelCapabilityArea:
         log_item(f'{self.class_label} Fragments', relpath(self.fragments_dir, getcwd()))
         makedirs(self.full_dir, self.class_label)
 
+    def up_to_date(self) -> bool:
+        """Whether the previous build generated the area pages from the same inputs"""
+        manifest = self.config.manifest
+        if manifest is None:
+            return False
+        self.inputs = inputs_hash(
+            self.graph.fingerprint([
+                self.node,
+                self.pillar.node,
+                *self.capability_nodes(),
+            ])
+        )
+        outputs = [self.full_dir / '.pages.yaml', self.full_path]
+        return manifest.up_to_date(outputs, self.inputs)
+
     def generate_markdown(self) -> None:
-        self.generate_link_from_pillar_to_capability_area()
+        self.generate_area_markdown()
+        self.generate_capabilities()
+
+    def generate_area_markdown(self) -> None:
+        """Generate the pages of the capability area but not those of its capabilities"""
+        if self.up_to_date():
+            return
         self.generate_pages_yaml()
         self.generate_index_md()
         assert self.md_file is not None
         self.generate_summary(self.md_file)
-        self.generate_capabilities()
-        self.md_file.create_md_file()
+        self.generate_capability_list()
+        self.md_file.create_md_file(self.config.manifest, self.inputs)
 
     def generate_index_md(self) -> None:
         self.md_file = MarkdownDocument(
@@ -75,7 +98,7 @@ class MaturityModelCapabilityArea:
         pages_yaml.add('...')
         for capability in self.capabilities():
             pages_yaml.add(f'{capability.name}: {capability.local_name}')
-        pages_yaml.write()
+        pages_yaml.write(self.config.manifest, self.inputs)
 
     def generate_summary(self, md_file: MarkdownDocument) -> None:
         # self.md_file.heading(2, "Summary")
@@ -96,11 +119,11 @@ class MaturityModelCapabilityArea:
         self.pillar.md_file.new_line(f'- [{self.name}]({link})')
 
     def capabiliy_nodes_unsorted(self) -> Generator[Node, None, None]:
-        for capability_node in self.graph.g.subjects(MATURITY_MODEL.inArea, self.node):
+        for capability_node in self.graph.subjects(MATURITY_MODEL.inArea, self.node):
             yield capability_node
 
     def sort_key(self, element: Node) -> str:
-        for sort_key_node in self.graph.g.objects(element, MATURITY_MODEL.sortKey):
+        for sort_key_node in self.graph.objects(element, MATURITY_MODEL.sortKey):
             # log_item("Sort key of", f"{sort_key_node} -> {element}")
             return str(sort_key_node)
         sort_key_str = str(element)
@@ -127,15 +150,15 @@ class MaturityModelCapabilityArea:
             self._capabilities = list(self.capabilities_non_cached())
         return self._capabilities
 
-    def generate_capabilities(self) -> None:
+    def generate_capability_list(self) -> None:
         assert self.md_file is not None
         from .capability import MaturityModelCapability
 
         self.md_file.heading(2, MaturityModelCapability.class_label_plural)
-        # Write the list of capabilities in this area once
         for capability in self.capabilities():
             link = Path('.') / capability.local_name / 'index.md'
             self.md_file.new_line(f'- [{capability.name}]({link})')
-        # Then generate each capability page
+
+    def generate_capabilities(self) -> None:
         for capability in self.capabilities():
             capability.generate_markdown()
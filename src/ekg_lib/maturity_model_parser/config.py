@@ -1,9 +1,17 @@
 from __future__ import annotations
 from option import Option
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 from ..log.various import value_error
 
+if TYPE_CHECKING:
+    from .manifest import BuildManifest
+
+REASONER_RULES = 'rules'
+REASONER_OWLRL = 'owlrl'
+REASONERS = (REASONER_RULES, REASONER_OWLRL)
+
 
 class Config:
     def __init__(
@@ -16,6 +24,11 @@ class Config:
         output_root: Path,
         fragments_root: Path,
         pillar_dir_name: Option[str],
+        manifest_path: Path | None = None,
+        force: bool = False,
+        cache_dir: Path | None = None,
+        reasoner: str = REASONER_RULES,
+        max_workers: int = 1,
     ):
         self.model_name = model_name
         self.verbose = verbose
@@ -25,6 +38,13 @@ class Config:
         self.output_root = output_root
         self.fragments_root = fragments_root
         self.pillar_dir_name = pillar_dir_name
+        self.manifest_path = manifest_path
+        self.force = force
+        self.cache_dir = cache_dir
+        self.reasoner = reasoner
+        self.max_workers = max_workers
+        # set while generating with a build manifest, see run_with_config()
+        self.manifest: BuildManifest | None = None
 
         if not self.model_root.is_dir():
             raise value_error('{} is not a valid directory', self.model_root.name)
@@ -32,3 +52,7 @@ class Config:
             raise value_error('{} is not a valid directory', self.docs_root.name)
         if not self.fragments_root.is_dir():
             raise value_error('{} is not a valid directory', self.fragments_root.name)
+        if self.reasoner not in REASONERS:
+            raise value_error('{} is not a valid reasoner', self.reasoner)
+        if self.max_workers < 1:
+            raise value_error('{} is not a valid number of workers', self.max_workers)
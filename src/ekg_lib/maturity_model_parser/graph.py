@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import hashlib
 import textwrap
 from os import getcwd
 from os.path import relpath
@@ -8,7 +9,7 @@ from typing import Any, Iterable, List, Optional
 
 import rdflib
 from rdflib import DCTERMS, OWL, RDF, RDFS, SKOS, Graph, URIRef
-from rdflib.term import Literal, Node
+from rdflib.term import BNode, Literal, Node
 
 from ..log import log_item
 from ..log.various import value_error, warning
@@ -39,6 +40,63 @@ def get_text_in_language(
     return textwrap.indent(textwrap.dedent(str(default_value)).strip(), indent_prefix)
 
 
+class MaturityModelIndex:
+    """
+    The triples that the generator navigates by, read from the graph in one pass
+    so that each question about the structure of a model is a dictionary lookup
+    rather than a pattern scan over the whole graph.
+
+    The values and subjects are kept in the order in which the graph returns them,
+    so that the generated pages are the same as when querying the graph directly.
+    """
+
+    value_predicates = (
+        RDF.type,
+        SKOS.prefLabel,
+        RDFS.label,
+        MATURITY_MODEL.sortKey,
+        MATURITY_MODEL.capabilityNumber,
+        MATURITY_MODEL.iriLocalName,
+        MATURITY_MODEL.iriLocalTypeName,
+    )
+    structure_predicates = (
+        MATURITY_MODEL.pillarInModel,
+        MATURITY_MODEL.inPillar,
+        MATURITY_MODEL.inArea,
+    )
+
+    def __init__(self, g: Graph):
+        self.g = g
+        self._objects: dict[tuple[Node, Node], list[Node]] = {}
+        self._subjects: dict[tuple[Node, Node], list[Node]] = {}
+        predicates = set(self.value_predicates)
+        for subject in g.subjects(unique=True):
+            for predicate, objekt in g.predicate_objects(subject):
+                if predicate in predicates:
+                    self._objects.setdefault((subject, predicate), []).append(objekt)
+        for predicate in self.structure_predicates:
+            for subject, objekt in g.subject_objects(predicate):
+                self._subjects.setdefault((predicate, objekt), []).append(subject)
+
+    def __len__(self) -> int:
+        return sum(len(values) for values in self._objects.values()) + sum(
+            len(subjects) for subjects in self._subjects.values()
+        )
+
+    def objects(self, subject: Node, predicate: Node) -> list[Node]:
+        if predicate not in self.value_predicates:
+            return list(self.g.objects(subject, predicate))
+        return self._objects.get((subject, predicate), [])
+
+    def subjects(self, predicate: Node, objekt: Node) -> list[Node]:
+        if predicate not in self.structure_predicates:
+            return list(self.g.subjects(predicate, objekt))
+        return self._subjects.get((predicate, objekt), [])
+
+    def has_type(self, subject: Node, type_node: Node) -> bool:
+        return type_node in self._objects.get((subject, RDF.type), ())
+
+
 class MaturityModelGraph:
     g: rdflib.Graph
 
@@ -48,6 +106,25 @@ class MaturityModelGraph:
         self.verbose = verbose
         self.lang = lang
         self._models: list[Any] = list()
+        self._fingerprints: dict[Node, str] = {}
+        self._index: MaturityModelIndex | None = None
+
+    @property
+    def index(self) -> MaturityModelIndex:
+        if self._index is None:
+            self._index = MaturityModelIndex(self.g)
+        return self._index
+
+    def create_index(self) -> None:
+        """(Re)build the index, call this after the last change to the graph"""
+        self._index = MaturityModelIndex(self.g)
+        log_item('Indexed', f'{len(self._index)} triples')
+
+    def objects(self, subject: Node, predicate: URIRef) -> list[Node]:
+        return self.index.objects(subject, predicate)
+
+    def subjects(self, predicate: URIRef, objekt: Node) -> list[Node]:
+        return self.index.subjects(predicate, objekt)
 
     def __name_with_lang_for(
         self, subject_uri: Node, lang: Optional[str], hint: str
@@ -100,11 +177,7 @@ class MaturityModelGraph:
             lang_filter = lambda l_: True  # noqa
 
         for labelProp in label_properties:
-            labels = list(
-                filter(
-                    lang_filter, self.g.objects(subject=subject, predicate=labelProp)
-                )
-            )
+            labels = list(filter(lang_filter, self.objects(subject, labelProp)))
             if len(labels) == 0:
                 continue
             else:
@@ -129,6 +202,35 @@ class MaturityModelGraph:
             return name
         raise value_error(f'{hint} has no label: {subject_uri}')
 
+    def fingerprint(self, nodes: Iterable[Node]) -> str:
+        """
+        Hash of all triples that the given nodes are the subject or the object of,
+        including the triples about their types, so that a generated page can tell
+        whether anything that it was generated from changed since the previous build
+        """
+        digest = hashlib.sha256()
+        for node in nodes:
+            digest.update(self._node_fingerprint(node).encode('ascii'))
+        return digest.hexdigest()
+
+    def _node_fingerprint(self, node: Node) -> str:
+        fingerprint = self._fingerprints.get(node)
+        if fingerprint is not None:
+            return fingerprint
+        triples = set(self.g.triples((node, None, None)))
+        triples.update(self.g.triples((None, None, node)))
+        for node_type in self.g.objects(node, RDF.type):
+            triples.update(self.g.triples((node_type, None, None)))
+
+        def n3(term: Node) -> str:
+            # blank node ids differ from one load to the next
+            return '_:' if isinstance(term, BNode) else term.n3()
+
+        lines = sorted(' '.join(n3(term) for term in triple) for triple in triples)
+        fingerprint = hashlib.sha256('\n'.join(lines).encode('utf-8')).hexdigest()
+        self._fingerprints[node] = fingerprint
+        return fingerprint
+
     def tag_line_for(self, node: Node) -> str | None:
         return get_text_in_language(self.g, self.lang, node, RDFS.comment, '')
 
@@ -138,13 +240,13 @@ class MaturityModelGraph:
         )
 
     def capability_number_for(self, capability_node: Node, hint: str) -> str:
-        for number in self.g.objects(capability_node, MATURITY_MODEL.capabilityNumber):
+        for number in self.objects(capability_node, MATURITY_MODEL.capabilityNumber):
             log_item(f'{hint} Number', number)
             return str(number)
         raise value_error(f'{hint} has no capabilityNumber: {capability_node}')
 
     def local_name_for(self, subject_node: Node, hint: str) -> str:
-        for local_name in self.g.objects(subject_node, MATURITY_MODEL.iriLocalName):
+        for local_name in self.objects(subject_node, MATURITY_MODEL.iriLocalName):
             log_item(f'{hint} Local Name', local_name)
             return str(local_name)
         raise value_error(f'{hint} has no iriLocalName: {subject_node}')
@@ -156,22 +258,20 @@ class MaturityModelGraph:
         return self.local_type_name_for_type(type_node, hint)
 
     def local_type_name_for_type(self, type_node: Node, hint: str) -> str:
-        for local_type_name in self.g.objects(
-            type_node, MATURITY_MODEL.iriLocalTypeName
-        ):
+        for local_type_name in self.objects(type_node, MATURITY_MODEL.iriLocalTypeName):
             # log_item(f"{hint} Local Type Name", local_type_name)
             return str(local_type_name)
         raise value_error(f'{hint} has no iriLocalTypeName: {type_node}')
 
     def get_type(self, subject_node: Node) -> Node | None:
-        for node_type in self.g.objects(subject_node, RDF.type):
+        for node_type in self.objects(subject_node, RDF.type):
             if node_type in (OWL.Thing, OWL.NamedIndividual):
                 continue
             return node_type
         return None
 
     def has_type(self, subject_uri: Node, type_uri: Node) -> bool:
-        return (subject_uri, RDF.type, type_uri) in self.g
+        return self.index.has_type(subject_uri, type_uri)
 
     def has_type_pillar(self, subject_iri: Node) -> bool:
         return self.has_type(subject_iri, MATURITY_MODEL.Pillar)
@@ -214,9 +314,7 @@ class MaturityModelGraph:
 
     def capability_areas_of_pillar(self, pillar_node: Node) -> Iterable[Node]:
         found = 0
-        for in_pillar_thing in self.g.subjects(
-            predicate=MATURITY_MODEL.inPillar, object=pillar_node
-        ):
+        for in_pillar_thing in self.subjects(MATURITY_MODEL.inPillar, pillar_node):
             if self.has_type_capability_area(in_pillar_thing):
                 found += 1
                 yield in_pillar_thing
@@ -225,7 +323,7 @@ class MaturityModelGraph:
 
     def capabilities_in_area(self, area_node: Node) -> Iterable[Node]:
         found = 0
-        for in_area_thing in self.g.subjects(MATURITY_MODEL.inArea, area_node):
+        for in_area_thing in self.subjects(MATURITY_MODEL.inArea, area_node):
             if self.has_type_capability(in_area_thing):
                 found += 1
                 yield in_area_thing
@@ -253,6 +351,7 @@ class MaturityModelGraph:
                 raise value_error(f'Fragment {fragment_path} does not exist')
             self.g.remove((subject, predicate, objekt))
             self.g.add((subject, predicate, Literal(str(fragment_path))))
+        self._index = None
 
     def create_sort_keys(self) -> None:
         """Generate sortKeys for anything with an ekgmm:capabilityNumber"""
@@ -266,6 +365,7 @@ class MaturityModelGraph:
                 )
             sort_key = f'{capability_number_parts[0]}.{capability_number_parts[1]:0>3}.{capability_number_parts[2]:0>3}'
             self.g.add((subject, MATURITY_MODEL.sortKey, Literal(sort_key)))
+        self._index = None
 
     def write_tag_line(self, md: MarkdownDocument, node: Node) -> None:
         tag_line = self.tag_line_for(node)
@@ -6,16 +6,17 @@ from os import getcwd
 from os.path import relpath
 from pathlib import Path
 
-import owlrl
 import rdflib
 from rdflib import Graph
 
 from ..log import error, log_item
 from ..log.various import log, value_error
 from ..main import load_rdf_file_into_graph
+from ..main.inference import RuleInference, owlrl_closure
 from ..main.main import load_rdf_stream_into_graph
 from ..namespace import BASE_IRI_MATURITY_MODEL
-from .config import Config
+from .cache import InferredGraphCache
+from .config import REASONER_OWLRL, Config
 from .graph import MaturityModelGraph
 
 ontology_file_names = ['maturity-model.ttl']
@@ -30,6 +31,25 @@ def check_ontologies(ontologies_root: Path) -> Path:
     return ontologies_root
 
 
+def ontology_bytes(ontology_file_name: str) -> bytes:
+    return (
+        importlib.resources.files('ekg_lib.resources.ontologies')
+        .joinpath(ontology_file_name)
+        .read_bytes()
+    )
+
+
+def model_files(model_root: Path) -> list[Path]:
+    """The turtle files of the model in the given directory, skipping any virtualenv"""
+    turtle_files = []
+    for turtle_file in sorted(model_root.rglob('*.ttl')):
+        if '.venv' in str(turtle_file.resolve()):
+            log_item('Skipping', turtle_file)
+        else:
+            turtle_files.append(turtle_file)
+    return turtle_files
+
+
 class MaturityModelLoader:
     """Checks each turtle file in the given directory"""
 
@@ -42,9 +62,17 @@ class MaturityModelLoader:
         self.g.base = BASE_IRI_MATURITY_MODEL
 
     def load(self) -> MaturityModelGraph:
-        self.load_ontologies()
-        self.load_model_files()
-        self.rdfs_infer()
+        cache = self.inferred_graph_cache()
+        cached = cache.load() if cache is not None else None
+        if cached is not None:
+            self.g = cached
+            self.g.base = BASE_IRI_MATURITY_MODEL
+        else:
+            self.load_ontologies()
+            self.load_model_files()
+            self.rdfs_infer()
+            if cache is not None:
+                cache.save(self.g)
         # dump_as_ttl_to_stdout(self.g)
         log(
             'All {} triples loaded and inferred, processing them now:'.format(
@@ -58,6 +86,7 @@ class MaturityModelLoader:
             log_item('Loaded model', node)
         graph.rewrite_fragment_references(self.config.fragments_root)
         graph.create_sort_keys()
+        graph.create_index()
         return graph
 
     def load_ontology_from_stream(self, ontology_stream: BytesIO) -> None:
@@ -67,22 +96,29 @@ class MaturityModelLoader:
         log_item('Loading', 'Ontologies')
         for ontology_file_name in ontology_file_names:
             log_item('Loading Ontology', ontology_file_name)
-            with (
-                importlib.resources.files('ekg_lib.resources.ontologies')
-                .joinpath(ontology_file_name)
-                .open('rb') as stream
-            ):
-                self.load_ontology_from_stream(BytesIO(stream.read()))
+            self.load_ontology_from_stream(BytesIO(ontology_bytes(ontology_file_name)))
+
+    def inferred_graph_cache(self) -> InferredGraphCache | None:
+        """The cache of the inferred graph for the current ontologies and model files"""
+        if self.config.cache_dir is None:
+            return None
+        inputs = [(name, ontology_bytes(name)) for name in ontology_file_names]
+        model_root = self.config.model_root
+        for turtle_file in model_files(model_root):
+            inputs.append((
+                turtle_file.relative_to(model_root).as_posix(),
+                turtle_file.read_bytes(),
+            ))
+        return InferredGraphCache.for_inputs(
+            self.config.cache_dir, inputs, self.config.reasoner
+        )
 
     def load_model_files(self) -> None:
         log_item('Loading', 'Model Files')
         # for turtle_file in self.root_directory.rglob("*.ttl"):
         #     log_item("Going to load", turtle_file)
-        for turtle_file in self.config.model_root.rglob('*.ttl'):
-            if '.venv' in str(turtle_file.resolve()):
-                log_item('Skipping', turtle_file)
-            else:
-                self.load_model_file(Path(turtle_file))
+        for turtle_file in model_files(self.config.model_root):
+            self.load_model_file(turtle_file)
         log_item('# asserted triples', len(self.g))
 
     def load_model_file(self, turtle_file: Path) -> None:
@@ -90,18 +126,11 @@ class MaturityModelLoader:
         load_rdf_file_into_graph(self.g, turtle_file)
 
     def rdfs_infer(self) -> None:
-        log_item('Inferring', 'Triples')
-        owlrl.RDFSClosure.RDFS_Semantics(self.g, True, True, True)
-        closure_class = owlrl.return_closure_class(
-            owl_closure=True, rdfs_closure=True, owl_extras=True, trimming=True
-        )
-        owlrl.DeductiveClosure(
-            closure_class,
-            improved_datatypes=False,
-            rdfs_closure=True,
-            axiomatic_triples=False,
-            datatype_axioms=False,
-        ).expand(self.g)
+        log_item('Inferring', f'Triples ({self.config.reasoner})')
+        if self.config.reasoner == REASONER_OWLRL:
+            owlrl_closure(self.g)
+        else:
+            RuleInference(self.g).expand(self.g)
         log_item('# triples', len(self.g))
 
     def add_literal_triple(
@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from collections.abc import Iterable
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from ..__about__ import __version__
+from ..log import log_item, warning
+from .loader import model_files
+
+if TYPE_CHECKING:
+    from .config import Config
+
+MANIFEST_VERSION = 1
+MANIFEST_FILE_NAME = '.build-manifest.json'
+
+
+def content_hash(data: str | bytes) -> str:
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def _file_hash(path: Path) -> str | None:
+    try:
+        return content_hash(path.read_bytes())
+    except FileNotFoundError:
+        return None
+
+
+def _key(path: Path) -> str:
+    return str(path.resolve())
+
+
+class BuildManifest:
+    """
+    Record of the files that the maturity model generator wrote and what they were
+    generated from, so that a rebuild only regenerates and rewrites what changed.
+
+    The manifest has the hash of every input file (the model `.ttl` files and the
+    fragments) and, for every generated file, the hash of its content and the hash of
+    its inputs: the triples about the nodes that it was generated from and the fragment
+    files that it includes. A rebuild:
+
+    - is skipped altogether when no input file changed and all generated files are
+      still there as they were written (see `is_up_to_date()`);
+    - skips generating a page whose inputs have the same hash as last time
+      (see `up_to_date()`);
+    - only writes a file when its content changed, so that `mkdocs serve` only reloads
+      the pages that actually changed;
+    - removes the files that the previous build generated but this one didn't, for
+      instance when a capability was removed from the model.
+
+    Everything is rebuilt when the ekg_lib version or the configuration changes.
+
+    Pages may be generated concurrently (see `--max-workers`), so the bookkeeping is
+    guarded by a lock, while the files themselves are hashed and written outside of it.
+    """
+
+    def __init__(
+        self, path: Path, settings: dict[str, Any], input_files: list[Path]
+    ) -> None:
+        self.path = path
+        self.settings = settings
+        self.input_files = input_files
+        self.previous_inputs: dict[str, str] = {}
+        self.previous_outputs: dict[str, dict[str, Any]] = {}
+        self.outputs: dict[str, dict[str, Any]] = {}
+        self.written = 0
+        self.unchanged = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(
+        cls,
+        path: Path,
+        settings: dict[str, Any],
+        input_files: list[Path],
+        force: bool = False,
+    ) -> BuildManifest:
+        manifest = cls(path, settings, input_files)
+        log_item('Build manifest', path)
+        if force or not path.exists():
+            return manifest
+        try:
+            content = json.loads(path.read_text(encoding='utf-8'))
+        except (ValueError, OSError) as err:
+            warning(f'Ignoring unreadable build manifest {path}: {err}')
+            return manifest
+        if (
+            content.get('version') != MANIFEST_VERSION
+            or content.get('settings') != settings
+        ):
+            log_item('Build manifest', 'Configuration changed, rebuilding everything')
+            return manifest
+        manifest.previous_inputs = content.get('inputs', {})
+        manifest.previous_outputs = content.get('outputs', {})
+        return manifest
+
+    def current_inputs(self) -> dict[str, str]:
+        inputs = {}
+        for path in self.input_files:
+            key = _key(path)
+            if key in self.outputs or key in self.previous_outputs:
+                continue
+            file_hash = _file_hash(path)
+            if file_hash is not None:
+                inputs[key] = file_hash
+        return inputs
+
+    def _output_intact(self, key: str, output: dict[str, Any]) -> bool:
+        return _file_hash(Path(key)) == output.get('content')
+
+    def is_up_to_date(self) -> bool:
+        """
+        Whether the previous build generated all files from the same input files and
+        they're all still there, unchanged
+        """
+        if not self.previous_outputs:
+            return False
+        if self.current_inputs() != self.previous_inputs:
+            return False
+        return all(
+            self._output_intact(key, output)
+            for key, output in self.previous_outputs.items()
+        )
+
+    def up_to_date(self, paths: Iterable[Path], inputs: str) -> bool:
+        """
+        Whether the given files were generated from inputs with the given hash and are
+        still there as they were written, in which case they're kept as they are
+        """
+        keys = [_key(path) for path in paths]
+        for key in keys:
+            output = self.previous_outputs.get(key)
+            if output is None or output.get('inputs') != inputs:
+                return False
+            if not self._output_intact(key, output):
+                return False
+        with self._lock:
+            for key in keys:
+                self.outputs[key] = self.previous_outputs[key]
+            self.skipped += len(keys)
+        return True
+
+    def write(self, path: Path, data: str, inputs: str | None = None) -> None:
+        """Write the given generated file, unless it already has the given content"""
+        key = _key(path)
+        data_hash = content_hash(data)
+        with self._lock:
+            self.outputs[key] = {'content': data_hash, 'inputs': inputs}
+        if _file_hash(path) == data_hash:
+            with self._lock:
+                self.unchanged += 1
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(data, encoding='utf-8', newline='')
+        with self._lock:
+            self.written += 1
+
+    def remove_stale_outputs(self) -> None:
+        for key, output in self.previous_outputs.items():
+            if key in self.outputs:
+                continue
+            path = Path(key)
+            # never remove a file that was changed after we generated it
+            if self._output_intact(key, output):
+                log_item('Removing', os.path.relpath(path))
+                path.unlink()
+
+    def save(self, input_files: list[Path] | None = None) -> None:
+        """
+        Save the manifest with the given input files as they are after the generation,
+        which includes the fragments that were copied from the templates into the
+        fragments root, so that the next build has the same inputs
+        """
+        if input_files is not None:
+            self.input_files = input_files
+        self.remove_stale_outputs()
+        log_item('Written files', self.written)
+        log_item('Unchanged files', self.unchanged)
+        log_item('Skipped files', self.skipped)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(
+            json.dumps(
+                {
+                    'version': MANIFEST_VERSION,
+                    'settings': self.settings,
+                    'inputs': self.current_inputs(),
+                    'outputs': self.outputs,
+                },
+                indent=2,
+                sort_keys=True,
+            ),
+            encoding='utf-8',
+        )
+
+
+def settings_for(config: Config) -> dict[str, Any]:
+    """The settings that the generated files depend on besides the inputs"""
+    return {
+        'ekg_lib': __version__,
+        'model_name': config.model_name,
+        'model_root': str(config.model_root.resolve()),
+        'docs_root': str(config.docs_root.resolve()),
+        'fragments_root': str(config.fragments_root.resolve()),
+        'output_root': str(config.output_root.resolve()),
+        'pillar_dir_name': config.pillar_dir_name.unwrap_or(None),
+    }
+
+
+def input_files(config: Config) -> list[Path]:
+    """The model files and the fragments that the generated files are generated from"""
+    return model_files(config.model_root) + sorted(config.fragments_root.rglob('*.md'))
+
+
+def inputs_hash(fingerprint: str, fragments: Iterable[Path] = ()) -> str:
+    """
+    Combine the fingerprint of the triples that a page is generated from with the
+    hashes of the fragment files that it includes
+    """
+    digest = hashlib.sha256(fingerprint.encode('utf-8'))
+    for fragment in fragments:
+        digest.update(f'\0{_key(fragment)}\0{_file_hash(fragment)}'.encode())
+    return digest.hexdigest()
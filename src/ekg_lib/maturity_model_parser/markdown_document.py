@@ -5,7 +5,7 @@ from __future__ import annotations
 
 from pathlib import Path
 from textwrap import fill
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
 import mdutils.tools.Table
 from mdutils.fileutils.fileutils import MarkDownFile
@@ -15,6 +15,9 @@ from mdutils.tools.TextUtils import TextUtils
 
 from ..log import log_item
 
+if TYPE_CHECKING:
+    from .manifest import BuildManifest
+
 
 def new_inline_link(link: str, text: str | None = None) -> str:
     """Creates a inline link in markdown format.
@@ -80,7 +83,13 @@ class MarkdownDocument:
             return
         self.heading(1, metadata['title'])
 
-    def create_md_file(self) -> MarkDownFile:
+    def create_md_file(
+        self, manifest: BuildManifest | None = None, inputs: str | None = None
+    ) -> MarkDownFile | None:
+        """Write the Markdown file, via the given build manifest if there is one"""
+        if manifest is not None:
+            manifest.write(self.path, self.file_data_text, inputs)
+            return None
         file = MarkDownFile(self.file_name)
         file.rewrite_all_file(self.file_data_text)
         return file
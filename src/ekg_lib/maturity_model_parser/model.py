@@ -1,8 +1,10 @@
 from __future__ import annotations
 
+from collections.abc import Callable, Generator, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from os.path import relpath
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, Generator
+from typing import TYPE_CHECKING, Any
 
 from rdflib.term import Node
 
@@ -47,9 +49,7 @@ class MaturityModel:
         self._pillars: list[Any] = list()
 
     def sort_key(self, element: Node) -> str:
-        for sort_key_node in self.graph.g.objects(
-            subject=element, predicate=MATURITY_MODEL.sortKey
-        ):
+        for sort_key_node in self.graph.objects(element, MATURITY_MODEL.sortKey):
             log_item('Sort key of', f'{sort_key_node} -> {element}')
             return str(sort_key_node)
         sort_key_str = str(element)
@@ -58,8 +58,8 @@ class MaturityModel:
 
     def pillar_nodes_unsorted(self) -> Generator[Node, None, None]:
         found = 0
-        for pillar in self.graph.g.subjects(
-            predicate=MATURITY_MODEL.pillarInModel, object=self.model_node
+        for pillar in self.graph.subjects(
+            MATURITY_MODEL.pillarInModel, self.model_node
         ):
             log_item('Pillar', pillar)
             found += 1
@@ -104,8 +104,32 @@ class MaturityModel:
         # self.generate_capabilities_overview()
 
     def generate_pillars(self) -> None:
+        max_workers = self.config.max_workers
+        if max_workers <= 1 or self.config.mkdocs:
+            for pillar in self.pillars():
+                pillar.generate()
+            return
+        pages = list(self.page_generators())
+        log_item('Pages', len(pages))
+        log_item('Max workers', max_workers)
+        with ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='generate'
+        ) as pool:
+            # result() re-raises the first error in the order of the pages
+            for future in [pool.submit(generate) for generate in pages]:
+                future.result()
+
+    def page_generators(self) -> Iterator[Callable[[], None]]:
+        """
+        The functions that each generate the pages of one pillar, capability area or
+        capability, in the order in which generate_pillars() calls them one by one
+        """
         for pillar in self.pillars():
-            pillar.generate()
+            yield pillar.generate_markdown
+            for area in pillar.capability_areas():
+                yield area.generate_area_markdown
+                for capability in area.capabilities():
+                    yield capability.generate_markdown
 
     def generate_index_md(self) -> None:
         pillars_root = self.pillars_root
@@ -160,7 +184,7 @@ class MaturityModel:
             md_file.indent = card_indent_1
             md_file.new_line('</div>\n')
 
-        md_file.create_md_file()
+        md_file.create_md_file(self.config.manifest)
 
     def generate_pages_yaml(self) -> None:
         """Generate the .pages.yaml file for the root directory where the pillars get published"""
@@ -170,7 +194,7 @@ class MaturityModel:
         pages_yaml = PagesYaml(root=root, title='Maturity Model')
         for area in self.pillars():
             pages_yaml.add(f'{area.name}: {area.local_name}')
-        pages_yaml.write()
+        pages_yaml.write(self.config.manifest)
 
     def generate_capabilities_overview_table(self) -> None:
         overview_md_path = self.config.docs_root / 'intro' / 'overview.md'
@@ -241,7 +265,7 @@ class MaturityModel:
                         wrap_width=0,
                     )
         overview_md.write('</tbody>\n</table>\n', wrap_width=0)
-        overview_md.create_md_file()
+        overview_md.create_md_file(self.config.manifest)
 
     def generate_capabilities_overview(self) -> None:
         overview_md_path = self.config.docs_root / 'intro' / 'overview.md'
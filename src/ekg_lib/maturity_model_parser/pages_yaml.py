@@ -1,11 +1,15 @@
 from __future__ import annotations
 
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 from ekg_lib import log_item
 
 from .File import File
 
+if TYPE_CHECKING:
+    from .manifest import BuildManifest
+
 
 class PagesYaml:
     def __init__(self, root: Path, title: str):
@@ -16,12 +20,17 @@ class PagesYaml:
     def add(self, item: str) -> None:
         self.nav.append(item)
 
-    def write(self) -> None:
+    def write(
+        self, manifest: BuildManifest | None = None, inputs: str | None = None
+    ) -> None:
         file = File(False, self.root / '.pages.yaml')
         log_item('pages.yaml', file.path)
         data = f'title: {self.title}\nnav:'
         for item in self.nav:
             data += f'\n  - {item}'
         # log_item("pages.yaml", data)
+        if manifest is not None:
+            manifest.write(file.path, data, inputs)
+            return
         file.rewrite_all_file(data)
         file.rewrite_all_file(data)
@@ -58,14 +58,18 @@ class MaturityModelPillar:
         makedirs(self.full_dir, self.class_label)
 
     def generate(self) -> None:
+        self.generate_markdown()
+        for area in self.capability_areas():
+            area.generate_markdown()
+
+    def generate_markdown(self) -> None:
+        """Generate the pages of the pillar but not those of its capability areas"""
         self.generate_index_md()
         self.generate_pages_yaml()
         self.generate_capability_areas()
         self.copy_fragments()
         assert self.md_file is not None
-        self.md_file.create_md_file()
-        for area in self.capability_areas():
-            area.generate_markdown()
+        self.md_file.create_md_file(self.config.manifest)
 
     def generate_index_md(self) -> None:
         self.md_file = MarkdownDocument(
@@ -81,7 +85,7 @@ class MaturityModelPillar:
         )  # for the background-and-intro.md entry but possibly others
         for area in self.capability_areas():
             pages_yaml.add(f'{area.name}: {area.local_name}')
-        pages_yaml.write()
+        pages_yaml.write(self.config.manifest)
 
     def copy_fragments(self) -> None:
         assert self.md_file is not None
@@ -9,13 +9,16 @@ MIME_NQUADS = 'application/n-quads'
 MIME_N3 = 'text/n3'
 MIME_TRIX = 'application/trix'
 MIME_JSONLD = 'application/ld+json'
-MIME_SPARQLRESULTS_XML = 'application/sparql_endpoint-results+xml'
-MIME_SPARQLRESULTS_JSON = 'application/sparql_endpoint-results+json'
+MIME_SPARQLRESULTS_XML = 'application/sparql-results+xml'
+MIME_SPARQLRESULTS_JSON = 'application/sparql-results+json'
 MIME_XBINARY = 'application/x-binary-rdf-results-table'
 MIME_BOOLEAN = 'text/boolean'
 MIME_CSV = 'text/csv'
 MIME_TSV = 'text/tsv'
 MIME_TSV2 = 'text/tab-separated-values'
+# Content types of compressed files
+MIME_GZIP = 'application/gzip'
+MIME_ZSTD = 'application/zstd'
 _SPARQL_MIME_TYPES = [
     MIME_TURTLE,
     MIME_RDFXML,
@@ -50,6 +53,8 @@ __all__ = [
     'MIME_CSV',
     'MIME_TSV',
     'MIME_TSV2',
+    'MIME_GZIP',
+    'MIME_ZSTD',
     'check_sparql_mime_type',
 ]
 
@@ -0,0 +1,3 @@
+from .writer import DEFAULT_BUFFER_SIZE, NTriplesWriter, Triple, nt_line
+
+__all__ = ['DEFAULT_BUFFER_SIZE', 'NTriplesWriter', 'Triple', 'nt_line']
@@ -0,0 +1,88 @@
+import threading
+import typing
+from collections.abc import Iterable
+from functools import lru_cache
+from typing import Any
+
+from rdflib import Literal, URIRef
+
+Triple = tuple[Any, Any, Any]
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+
+@lru_cache(maxsize=4096)
+def _nt_iri(iri: URIRef) -> str:
+    """The predicates and classes are the same over and over again, so cache their N-Triples form"""
+    return iri.n3()
+
+
+def _nt_literal(literal: Literal) -> str:
+    """Same as the literal formatting of the rdflib N-Triples serializer"""
+    escaped = (
+        str(literal)
+        .replace('\\', '\\\\')
+        .replace('\n', '\\n')
+        .replace('"', '\\"')
+        .replace('\r', '\\r')
+    )
+    encoded = f'"{escaped}"'
+    if literal.language:
+        return f'{encoded}@{literal.language}'
+    if literal.datatype:
+        return f'{encoded}^^<{literal.datatype}>'
+    return encoded
+
+
+def nt_line(triple: Triple) -> str:
+    s, p, o = triple
+    if isinstance(o, Literal):
+        obj = _nt_literal(o)
+    elif isinstance(o, URIRef):
+        obj = _nt_iri(o)
+    else:
+        obj = o.n3()
+    return f'{s.n3()} {_nt_iri(p)} {obj} .\n'
+
+
+class NTriplesWriter:
+    """
+    Writes triples as N-Triples straight to a binary stream, without building an rdflib
+    Graph and running the serializer for them first.
+
+    The output is the same as what the rdflib `ntriples` serializer produces for a graph
+    with the same triples. Lines are collected in a buffer that is written to the
+    stream once it exceeds `buffer_size` bytes, call `flush()` when done. Each call to
+    `write()` is atomic so multiple threads can write to the same writer.
+    """
+
+    def __init__(
+        self, stream: typing.BinaryIO, buffer_size: int = DEFAULT_BUFFER_SIZE
+    ) -> None:
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.buffer = bytearray()
+        self.triples_written = 0
+        self._lock = threading.Lock()
+
+    def write(self, triples: Iterable[Triple]) -> None:
+        lines = [nt_line(triple) for triple in triples]
+        self.write_serialized(''.join(lines).encode(), len(lines))
+
+    def write_serialized(self, data: bytes, triple_count: int) -> None:
+        """Write triples that have already been serialized as N-Triples"""
+        with self._lock:
+            self.triples_written += triple_count
+            self.buffer += data
+            if len(self.buffer) >= self.buffer_size:
+                self._flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self.buffer:
+            self.stream.write(self.buffer)
+            self.buffer = bytearray()
+        self.stream.flush()
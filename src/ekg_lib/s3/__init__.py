@@ -1,10 +1,21 @@
-from .s3 import S3ObjectStore, S3Part, S3Uploader, s3_object_full_name  # noqa: F401
-from .various import set_cli_params  # noqa: F401
+from .checkpoint import UploadCheckpoint
+from .s3 import (
+    MIN_PART_SIZE,
+    S3ObjectStore,
+    S3Part,
+    S3Uploader,
+    S3UploadStream,
+    s3_object_full_name,
+)
+from .various import set_cli_params
 
 __all__ = [
+    'MIN_PART_SIZE',
     'S3ObjectStore',
     'S3Part',
+    'S3UploadStream',
     'S3Uploader',
+    'UploadCheckpoint',
     's3_object_full_name',
     'set_cli_params',
 ]
@@ -0,0 +1,66 @@
+import hashlib
+import json
+import threading
+from pathlib import Path
+
+from ..log import log_item, warning
+
+
+class UploadCheckpoint:
+    """
+    Local file that records a multipart upload while it's in progress, so that an
+    interrupted upload can be resumed by the next run instead of starting over.
+
+    The first line of the file has the bucket, key and upload id, every next line the
+    number and ETag of a part that was uploaded. Lines are only ever appended, so a
+    checkpoint stays valid when the process dies halfway writing one: a last line that
+    is incomplete is ignored.
+    """
+
+    def __init__(self, directory: str | Path, bucket: str, key: str) -> None:
+        name = hashlib.sha256(f'{bucket}/{key}'.encode()).hexdigest()
+        self.path = Path(directory) / f'{name}.jsonl'
+        self.bucket = bucket
+        self.key = key
+        self._lock = threading.Lock()
+
+    def load(self) -> tuple[str | None, dict[int, str]]:
+        """Return the upload id and the ETags by part number of an earlier upload"""
+        try:
+            lines = self.path.read_text(encoding='utf-8').splitlines()
+        except FileNotFoundError:
+            return None, {}
+        except OSError as err:
+            warning(f'Ignoring unreadable upload checkpoint {self.path}: {err}')
+            return None, {}
+        upload_id = None
+        parts = {}
+        for number, line in enumerate(lines):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if number == 0:
+                if record.get('bucket') != self.bucket or record.get('key') != self.key:
+                    warning(f'Ignoring upload checkpoint {self.path} of another object')
+                    return None, {}
+                upload_id = record.get('upload_id')
+            else:
+                parts[int(record['part'])] = record['etag']
+        return upload_id, parts
+
+    def start(self, upload_id: str) -> None:
+        """Record a new upload, which replaces any earlier one"""
+        log_item('Upload checkpoint', self.path)
+        record = {'bucket': self.bucket, 'key': self.key, 'upload_id': upload_id}
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_text(json.dumps(record) + '\n', encoding='utf-8')
+
+    def add_part(self, number: int, e_tag: str) -> None:
+        with self._lock, self.path.open('a', encoding='utf-8') as file:
+            file.write(json.dumps({'part': number, 'etag': e_tag}) + '\n')
+
+    def remove(self) -> None:
+        with self._lock:
+            self.path.unlink(missing_ok=True)
@@ -1,12 +1,23 @@
+import hashlib
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Any
 
 import boto3
 from botocore.client import Config
-from botocore.exceptions import ClientError, EndpointConnectionError
+from botocore.exceptions import BotoCoreError, ClientError, EndpointConnectionError
 
 from ..kgiri import parse_identity_key
-from ..log import error, log_item
-from ..mime import MIME_NTRIPLES
+from ..log import error, log_error, log_item, warning
+from ..mime import MIME_GZIP, MIME_NTRIPLES, MIME_ZSTD
+from .checkpoint import UploadCheckpoint
+
+MIN_PART_SIZE = 5 * 1024 * 1024  # every part of a multipart upload but the last
+DEFAULT_UPLOAD_CONCURRENCY = 4
+DEFAULT_PART_RETRIES = 3
+DEFAULT_PART_BACKOFF = 1.0  # seconds
+_COMPRESSED_CONTENT_TYPES = {'gzip': MIME_GZIP, 'zstd': MIME_ZSTD}
 
 
 def s3_object_full_name(object_: Any | None) -> str | None:
@@ -23,6 +34,18 @@ class S3ObjectStore:
         self.s3_bucket_name = args.s3_bucket
         self.git_branch = args.git_branch
         self.create_bucket = args.s3_create_bucket
+        self.upload_concurrency = (
+            getattr(args, 's3_upload_concurrency', None) or DEFAULT_UPLOAD_CONCURRENCY
+        )
+        part_retries = getattr(args, 's3_part_retries', None)
+        self.part_retries = (
+            DEFAULT_PART_RETRIES if part_retries is None else part_retries
+        )
+        part_backoff = getattr(args, 's3_part_backoff', None)
+        self.part_backoff = (
+            DEFAULT_PART_BACKOFF if part_backoff is None else part_backoff
+        )
+        self.checkpoint_dir = getattr(args, 's3_checkpoint_dir', None)
 
         self.s3 = boto3.resource(
             's3',
@@ -34,6 +57,8 @@ class S3ObjectStore:
                 signature_version='s3v4',
                 connect_timeout=5,
                 retries={'total_max_attempts': 1, 'max_attempts': 0},
+                # one connection per part that is being uploaded
+                max_pool_connections=max(10, self.upload_concurrency),
             ),
             region_name=args.aws_region,
         )
@@ -120,7 +145,37 @@ class S3ObjectStore:
         )
 
 
+def content_type(mime: str, content_encoding: str | None) -> str:
+    """
+    The content type of an uploaded file of the given mime type: a compressed file is
+    stored as the compressed file that it is (so that it is downloaded as is) rather than
+    with a Content-Encoding that would make HTTP clients decompress it
+    """
+    if content_encoding is None:
+        return mime
+    if content_encoding not in _COMPRESSED_CONTENT_TYPES:
+        raise ValueError(f'Unsupported content encoding {content_encoding}')
+    return _COMPRESSED_CONTENT_TYPES[content_encoding]
+
+
 class S3Uploader:
+    """
+    Multipart upload of one object.
+
+    The parts are uploaded by a pool of `--s3-upload-concurrency` threads while the
+    caller produces the next ones. part() only waits when twice that many parts are
+    being uploaded or waiting to be, which bounds the number of parts in memory. A part
+    that fails to upload is retried `--s3-part-retries` times with exponential backoff.
+    If it still fails, the multipart upload is aborted and the error is raised by
+    part() or complete().
+
+    With `--s3-checkpoint-dir` the upload id and the ETags of the uploaded parts are
+    recorded in an UploadCheckpoint and a failed upload is kept rather than aborted.
+    The next upload of the same key resumes it: the parts that S3 still has (see
+    list_parts) are only uploaded again if their content changed, which is checked by
+    comparing the MD5 of the new content with the ETag of the part.
+    """
+
     def __init__(
         self,
         s3_object_store: S3ObjectStore,
@@ -138,58 +193,222 @@ class S3Uploader:
         self.object = self.object_store.object(key)
         log_item('Object', self.object)
         self.e_tag = None
-        log_item('Creating MPU for', key)
-        log_item('MIME', mime)
-        log_item('Content Encoding', content_encoding)
-        self.mpu = self.object.initiate_multipart_upload(
-            # ContentType=mime,
-            ContentType='application/x-gzip',
-            # ContentEncoding=content_encoding,
-            Metadata={'dataset-code': dataset_code},
-        )
-        self.id = self.mpu.id
-        log_item('Multipart Upload Id', self.mpu.id)
+        self.checkpoint: UploadCheckpoint | None = None
+        # the ETags of the parts that an interrupted earlier upload uploaded
+        self.uploaded: dict[int, str] = {}
+        resumed_id = None
+        if s3_object_store.checkpoint_dir:
+            self.checkpoint = UploadCheckpoint(
+                s3_object_store.checkpoint_dir, s3_object_store.s3_bucket_name, key
+            )
+            resumed_id = self._resume()
+        if resumed_id is None:
+            log_item('Creating MPU for', key)
+            log_item('MIME', mime)
+            log_item('Content Encoding', content_encoding)
+            self.mpu = self.object.initiate_multipart_upload(
+                ContentType=content_type(mime, content_encoding),
+                Metadata={'dataset-code': dataset_code},
+            )
+            self.id = self.mpu.id
+            if self.checkpoint is not None:
+                self.checkpoint.start(self.id)
+        else:
+            self.id = resumed_id
+        log_item('Multipart Upload Id', self.id)
         self.parts: list['S3Part'] = []
+        self.concurrency = s3_object_store.upload_concurrency
+        self.pending: deque[Future[None]] = deque()
+        self.executor: ThreadPoolExecutor | None = None
+        self.failed = False
+        if self.concurrency > 1:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.concurrency, thread_name_prefix='s3-part'
+            )
+
+    def _resume(self) -> str | None:
+        """Return the id of the upload to resume, None if there isn't one"""
+        assert self.checkpoint is not None
+        upload_id, e_tags = self.checkpoint.load()
+        if upload_id is None:
+            return None
+        try:
+            listed = self.list_parts(upload_id)
+        except (ClientError, BotoCoreError) as err:
+            warning(f'Cannot resume the upload of {self.key}: {err}')
+            self.checkpoint.remove()
+            return None
+        self.uploaded = {
+            number: e_tag
+            for number, e_tag in listed.items()
+            if e_tags.get(number) == e_tag
+        }
+        log_item('Resuming upload', f'{upload_id} ({len(self.uploaded)} parts)')
+        return upload_id
+
+    def list_parts(self, upload_id: str) -> dict[int, str]:
+        """Return the ETags by part number of the parts that S3 has of the given upload"""
+        client = self.object_store.s3_client
+        parts = {}
+        kwargs: dict[str, Any] = {}
+        while True:
+            response = client.list_parts(
+                Bucket=self.object_store.s3_bucket_name,
+                Key=self.key,
+                UploadId=upload_id,
+                **kwargs,
+            )
+            for part in response.get('Parts', []):
+                parts[part['PartNumber']] = part['ETag']
+            if not response.get('IsTruncated'):
+                return parts
+            kwargs['PartNumberMarker'] = response['NextPartNumberMarker']
 
     def part(self, chunk: bytes) -> 'S3Part':
+        """Upload the next part, which may still be in progress when this returns"""
         part = S3Part(self, len(self.parts) + 1)
         self.parts.append(part)
-        part.upload(chunk)
+        if part.is_uploaded(chunk):
+            return part
+        if self.executor is None:
+            try:
+                part.upload(chunk)
+            except Exception:
+                self.fail()
+                raise
+            return part
+        while len(self.pending) >= 2 * self.concurrency:
+            self._wait(self.pending.popleft())
+        self.pending.append(self.executor.submit(part.upload, chunk))
         return part
 
+    def _wait(self, future: Future[None]) -> None:
+        try:
+            future.result()
+        except Exception:
+            self.fail()
+            raise
+
+    def wait(self) -> None:
+        """Wait until all parts have been uploaded"""
+        while self.pending:
+            self._wait(self.pending.popleft())
+
+    def _shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+    def fail(self) -> None:
+        """
+        Give up on the upload after an error, also when producing its content failed. A
+        checkpointed upload is kept so that the next run can resume it, others are aborted.
+        """
+        if self.failed:
+            return
+        self.failed = True
+        if self.checkpoint is None:
+            self.abort()
+            return
+        self.pending.clear()
+        self._shutdown()
+        log_item('Keeping upload', f'{self.key} to resume from {self.checkpoint.path}')
+
+    def abort(self) -> None:
+        """Abort the multipart upload, so that S3 drops the parts uploaded so far"""
+        self.pending.clear()
+        # parts that are uploaded after the abort would still be stored
+        self._shutdown()
+        if self.checkpoint is not None:
+            self.checkpoint.remove()
+        log_item('Aborting upload', self.key)
+        try:
+            self.object_store.s3_client.abort_multipart_upload(
+                Bucket=self.object_store.s3_bucket_name,
+                Key=self.key,
+                UploadId=self.id,
+            )
+        except (ClientError, EndpointConnectionError) as err:
+            log_error(f'Could not abort the upload of {self.key}: {err}')
+
     def parts_dict(self) -> Any:
         for part in self.parts:
             yield part.dict()
 
     def complete(self) -> bool:
+        self.wait()
+        self._shutdown()
         if len(self.parts) == 0:
             error('Cannot complete multipart upload because there were no parts')
         log_item('Completing upload', self.key)
         parts_dict = {'Parts': list(self.parts_dict())}
         # print(json.dumps(parts_dict))
         # boto3.set_stream_logger(name='botocore')
-        response = self.object_store.s3_client.complete_multipart_upload(
-            Bucket=self.object_store.s3_bucket_name,
-            Key=self.key,
-            UploadId=self.id,
-            MultipartUpload=parts_dict,
-        )
+        try:
+            response = self.object_store.s3_client.complete_multipart_upload(
+                Bucket=self.object_store.s3_bucket_name,
+                Key=self.key,
+                UploadId=self.id,
+                MultipartUpload=parts_dict,
+            )
+        except Exception:
+            self.fail()
+            raise
         http_status = response['ResponseMetadata']['HTTPStatusCode']
         if http_status == 200:
             log_item('Upload Status', 'Complete')
+            if self.checkpoint is not None:
+                self.checkpoint.remove()
             return True
         else:
             log_item('Status', http_status)
             log_item('Completed Object', response)
+            self.fail()
             return False
 
 
+class S3UploadStream:
+    """
+    Write-only binary stream that uploads what is written to it as the parts of the given
+    multipart upload, each time part_size bytes have come in. So apart from the parts
+    that the uploader is still uploading, at most one part is kept in memory. Call
+    close() to upload the last (smaller) part, the upload itself still needs to be
+    completed.
+    """
+
+    def __init__(self, uploader: S3Uploader, part_size: int = MIN_PART_SIZE) -> None:
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f'part_size must be at least {MIN_PART_SIZE} bytes')
+        self.uploader = uploader
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.bytes_written = 0
+
+    def write(self, data: Any) -> int:
+        self.buffer += data
+        size = len(data)
+        self.bytes_written += size
+        while len(self.buffer) >= self.part_size:
+            self.uploader.part(bytes(self.buffer[: self.part_size]))
+            del self.buffer[: self.part_size]
+        return size
+
+    def flush(self) -> None:
+        """Parts can only be uploaded once they are full, so this does nothing"""
+
+    def close(self) -> None:
+        if self.buffer:
+            self.uploader.part(bytes(self.buffer))
+            self.buffer = bytearray()
+        log_item('Uploaded bytes', self.bytes_written)
+
+
 class S3Part:
     def __init__(self, s3_uploader: S3Uploader, part_number: int) -> None:
         self.verbose = s3_uploader.args.verbose
         self.uploader = s3_uploader
         self.number = part_number
-        self.e_tag = None
+        self.e_tag: str | None = None
 
         log_item('Created Part', '{}: {}'.format(self.uploader.key, self.number))
 
@@ -199,16 +418,49 @@ class S3Part:
             'PartNumber': self.number,
         }
 
+    def is_uploaded(self, chunk: bytes) -> bool:
+        """
+        Whether an earlier run uploaded this part with the same content, the ETag of a
+        part is the MD5 of its content (unless the bucket uses SSE-KMS encryption, then
+        the part is simply uploaded again)
+        """
+        e_tag = self.uploader.uploaded.get(self.number)
+        if e_tag is None:
+            return False
+        if e_tag.strip('"') != hashlib.md5(chunk, usedforsecurity=False).hexdigest():
+            return False
+        log_item('Already Uploaded Part', f'{self.uploader.key}: {self.number}')
+        self.e_tag = e_tag
+        return True
+
+    def _upload_part(self, chunk: bytes) -> Any:
+        """Upload the part, retrying with exponential backoff when that fails"""
+        object_store = self.uploader.object_store
+        attempt = 0
+        while True:
+            try:
+                return object_store.s3_client.upload_part(
+                    Body=chunk,
+                    Bucket=object_store.s3_bucket_name,
+                    Key=self.uploader.key,
+                    PartNumber=self.number,
+                    UploadId=self.uploader.id,
+                )
+            except (ClientError, BotoCoreError) as err:
+                if attempt >= object_store.part_retries:
+                    raise
+                delay = object_store.part_backoff * 2**attempt
+                attempt += 1
+                warning(
+                    f'Upload of part {self.number} of {self.uploader.key} failed, '
+                    f'retry {attempt} in {delay:g}s: {err}'
+                )
+                time.sleep(delay)
+
     def upload(self, chunk: bytes) -> None:
         log_item('Type of chunk', type(chunk))
         log_item('Uploading Part', f'size={len(chunk)} last 10 bytes={chunk[-10:]!r}')
-        response = self.uploader.object_store.s3_client.upload_part(
-            Body=chunk,
-            Bucket=self.uploader.object_store.s3_bucket_name,
-            Key=self.uploader.key,
-            PartNumber=self.number,
-            UploadId=self.uploader.id,
-        )
+        response = self._upload_part(chunk)
         # log_item("Uploaded Part Response", response)
         for key, value in response.items():
             if key == 'ResponseMetadata':
@@ -223,4 +475,5 @@ class S3Part:
                 if value and value != '0':
                     log_item(key, value)
         self.e_tag = response['ETag']
-        self.e_tag = response['ETag']
+        if self.uploader.checkpoint is not None:
+            self.uploader.checkpoint.add_part(self.number, response['ETag'])
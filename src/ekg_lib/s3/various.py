@@ -2,6 +2,8 @@ import os
 from argparse import ArgumentParser
 from typing import Any
 
+from .s3 import DEFAULT_PART_BACKOFF, DEFAULT_PART_RETRIES, DEFAULT_UPLOAD_CONCURRENCY
+
 
 def set_cli_params(parser: ArgumentParser) -> Any:
     s3_endpoint_url = os.getenv('S3_ENDPOINT_URL', None)
@@ -46,6 +48,36 @@ def set_cli_params(parser: ArgumentParser) -> Any:
         required=False,
         default=False,
     )
+    group.add_argument(
+        '--s3-upload-concurrency',
+        help='The number of parts of a multipart upload that are uploaded concurrently '
+        f'(default is S3_UPLOAD_CONCURRENCY or {DEFAULT_UPLOAD_CONCURRENCY})',
+        type=int,
+        default=int(
+            os.getenv('S3_UPLOAD_CONCURRENCY', str(DEFAULT_UPLOAD_CONCURRENCY))
+        ),
+    )
+    group.add_argument(
+        '--s3-part-retries',
+        help='The number of times the upload of a part is retried '
+        f'(default is S3_PART_RETRIES or {DEFAULT_PART_RETRIES})',
+        type=int,
+        default=int(os.getenv('S3_PART_RETRIES', str(DEFAULT_PART_RETRIES))),
+    )
+    group.add_argument(
+        '--s3-part-backoff',
+        help='Seconds to wait before the first retry of a part, doubled after each '
+        f'retry (default is S3_PART_BACKOFF or {DEFAULT_PART_BACKOFF:g})',
+        type=float,
+        default=float(os.getenv('S3_PART_BACKOFF', str(DEFAULT_PART_BACKOFF))),
+    )
+    group.add_argument(
+        '--s3-checkpoint-dir',
+        help='Directory with checkpoints of multipart uploads, so that an interrupted '
+        'upload is resumed by the next run (can also be set with env var '
+        'S3_CHECKPOINT_DIR)',
+        default=os.getenv('S3_CHECKPOINT_DIR', None),
+    )
     if aws_region:
         group.add_argument(
             '--aws-region',
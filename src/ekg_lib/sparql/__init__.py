@@ -1,4 +1,12 @@
-from .sparql_endpoint import SPARQLEndpoint, SPARQLResponse, iter_raw  # noqa: F401
-from .various import dump, set_cli_params  # noqa: F401
+from .results import SPARQLResultsDecoder
+from .sparql_endpoint import SPARQLEndpoint, SPARQLResponse, iter_raw
+from .various import dump, set_cli_params
 
-__all__ = ['SPARQLEndpoint', 'SPARQLResponse', 'iter_raw', 'dump', 'set_cli_params']
+__all__ = [
+    'SPARQLEndpoint',
+    'SPARQLResponse',
+    'SPARQLResultsDecoder',
+    'iter_raw',
+    'dump',
+    'set_cli_params',
+]
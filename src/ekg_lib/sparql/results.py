@@ -0,0 +1,234 @@
+import csv
+import json
+import re
+from collections.abc import Iterator
+from typing import Any, TextIO
+
+from rdflib import BNode, Literal, URIRef
+from rdflib.term import Node
+from rdflib.util import from_n3
+
+from ..mime import MIME_CSV, MIME_SPARQLRESULTS_JSON, MIME_TSV, MIME_TSV2
+
+Row = tuple[Any, ...]
+
+_READ_SIZE = 64 * 1024
+_JSON_MIME_TYPES = (MIME_SPARQLRESULTS_JSON, 'application/json')
+_TSV_MIME_TYPES = (MIME_TSV, MIME_TSV2)
+_CSV_IRI = re.compile(r'^(?:[A-Za-z][A-Za-z0-9+.-]*://|urn:)\S+$')
+_DECODER = json.JSONDecoder()
+
+
+class SPARQLResultsDecoder:
+    """
+    Incremental decoder for SPARQL SELECT results in the JSON, CSV or TSV result format.
+
+    Iterating over the decoder yields one tuple per solution, with the values in the order
+    of `variables`. Unbound values are `None`. By default the values are plain strings (the
+    lexical value of a literal, the IRI itself, or `_:id` for a blank node), with
+    `as_terms=True` they are rdflib terms instead. The CSV format does not carry term types
+    so there IRIs are recognised by their scheme and everything else becomes a plain literal.
+
+    The body is read in chunks of 64 KiB so results of any size are decoded in constant
+    memory. `variables` (and `boolean` for ASK results) are set once iteration has started.
+    """
+
+    def __init__(self, stream: TextIO, mime: str, as_terms: bool = False) -> None:
+        self.stream = stream
+        self.mime = mime.split(';', maxsplit=1)[0].strip()
+        self.as_terms = as_terms
+        self.variables: list[str] | None = None
+        self.boolean: bool | None = None
+
+    def __iter__(self) -> Iterator[Row]:
+        if self.mime in _JSON_MIME_TYPES:
+            return self._iter_json()
+        if self.mime == MIME_CSV:
+            return self._iter_csv()
+        if self.mime in _TSV_MIME_TYPES:
+            return self._iter_tsv()
+        raise ValueError(f'Unsupported SPARQL results mime type: {self.mime}')
+
+    def _iter_csv(self) -> Iterator[Row]:
+        reader = csv.reader(self.stream)
+        self.variables = next(reader, [])
+        if self.as_terms:
+            for row in reader:
+                yield tuple(_csv_term(value) for value in row)
+        else:
+            for row in reader:
+                yield tuple(value or None for value in row)
+
+    def _iter_tsv(self) -> Iterator[Row]:
+        header = self.stream.readline().rstrip('\r\n')
+        self.variables = (
+            [name.lstrip('?$') for name in header.split('\t')] if header else []
+        )
+        convert = _tsv_term if self.as_terms else _tsv_value
+        for line in self.stream:
+            line = line.rstrip('\r\n')
+            if not line:
+                continue
+            yield tuple(convert(value) for value in line.split('\t'))
+
+    def _iter_json(self) -> Iterator[Row]:  # noqa: C901
+        reader = _JsonReader(self.stream)
+        # bindings that arrived before the head, only buffered when a server sends them in that order
+        pending: list[dict[str, Any]] = []
+        reader.expect('{')
+        while reader.peek() != '}':
+            if reader.peek() == ',':
+                reader.advance()
+                continue
+            key = reader.decode()
+            reader.expect(':')
+            if key == 'head':
+                self.variables = list(reader.decode().get('vars', []))
+                for binding in pending:
+                    yield self._json_row(binding)
+                pending = []
+            elif key == 'boolean':
+                self.boolean = bool(reader.decode())
+            elif key == 'results':
+                reader.expect('{')
+                while reader.peek() != '}':
+                    if reader.peek() == ',':
+                        reader.advance()
+                        continue
+                    results_key = reader.decode()
+                    reader.expect(':')
+                    if results_key != 'bindings':
+                        reader.decode()
+                        continue
+                    reader.expect('[')
+                    while reader.peek() != ']':
+                        if reader.peek() == ',':
+                            reader.advance()
+                            continue
+                        binding = reader.decode()
+                        if self.variables is None:
+                            pending.append(binding)
+                        else:
+                            yield self._json_row(binding)
+                    reader.advance()
+                reader.advance()
+            else:
+                reader.decode()
+        if self.variables is None:
+            self.variables = list(dict.fromkeys(k for b in pending for k in b))
+            for binding in pending:
+                yield self._json_row(binding)
+
+    def _json_row(self, binding: dict[str, Any]) -> Row:
+        assert self.variables is not None
+        convert = _json_term if self.as_terms else _json_value
+        return tuple(convert(binding.get(name)) for name in self.variables)
+
+
+class _JsonReader:
+    """Reads a JSON document value by value from a text stream, buffering only what it needs"""
+
+    def __init__(self, stream: TextIO) -> None:
+        self.stream = stream
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        chunk = self.stream.read(_READ_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.text = self.text[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self._fill():
+                raise ValueError('Unexpected end of SPARQL JSON results')
+
+    def advance(self) -> None:
+        self.pos += 1
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(
+                f'Expected {char!r} in SPARQL JSON results, got {self.text[self.pos]!r}'
+            )
+        self.pos += 1
+
+    def decode(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # a number at the very end of the buffer may continue in the next chunk
+            if (
+                end == len(self.text)
+                and not self.eof
+                and isinstance(value, (int, float))
+                and self._fill()
+            ):
+                continue
+            self.pos = end
+            return value
+
+
+def _csv_term(value: str) -> Node | None:
+    if not value:
+        return None
+    if value.startswith('_:'):
+        return BNode(value[2:])
+    if _CSV_IRI.match(value):
+        return URIRef(value)
+    return Literal(value)
+
+
+def _tsv_value(value: str) -> str | None:
+    if not value:
+        return None
+    if value[0] == '<':
+        return value[1:-1]
+    if value[0] == '"':
+        return str(from_n3(value))
+    return value
+
+
+def _tsv_term(value: str) -> Node | None:
+    if not value:
+        return None
+    term = from_n3(value)
+    if isinstance(term, Node):
+        return term
+    raise ValueError(f'Not an RDF term in SPARQL TSV results: {value}')
+
+
+def _json_value(term: dict[str, str] | None) -> str | None:
+    if term is None:
+        return None
+    if term['type'] == 'bnode':
+        return f'_:{term["value"]}'
+    return term['value']
+
+
+def _json_term(term: dict[str, str] | None) -> Node | None:
+    if term is None:
+        return None
+    term_type = term['type']
+    if term_type == 'uri':
+        return URIRef(term['value'])
+    if term_type == 'bnode':
+        return BNode(term['value'])
+    lang = term.get('xml:lang')
+    if lang:
+        return Literal(term['value'], lang=lang)
+    return Literal(term['value'], datatype=term.get('datatype'))
@@ -1,27 +1,34 @@
 import argparse
 import csv
-import urllib
-from typing import Any, Optional
+import io
+import threading
+import time
+import urllib.request
+from collections.abc import Iterator
+from typing import Any, Optional, TextIO
 
 import requests
-from requests.exceptions import StreamConsumedError
-from requests.utils import iter_slices
+from rdflib import Graph
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from ..log import error, log_error, log_item, warning
-from ..mime import MIME_CSV, MIME_TSV, check_sparql_mime_type
+from ..mime import MIME_CSV, MIME_RDFXML, MIME_TSV, check_sparql_mime_type
+from .results import Row, SPARQLResultsDecoder
 
 try:
     from SPARQLWrapper import GET, JSON, POST, RDFXML, URLENCODED, SPARQLWrapper
-    from SPARQLWrapper.SPARQLExceptions import (
-        EndPointNotFound,
-        QueryBadFormed,
-        Unauthorized,
-    )
 except ImportError:
     raise Exception(
         "SPARQLWrapper not found! install with 'pip3 install SPARQLWrapper'"
     )
 
+DEFAULT_MAX_CONNECTIONS = 10
+DEFAULT_IDLE_TIMEOUT = 60.0  # seconds
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5  # seconds
+TEXT_CHUNK_SIZE = 64 * 1024
+
 
 def dump(obj: Any) -> None:
     for attr in dir(obj):
@@ -43,14 +50,18 @@ def set_cli_params(parser: argparse.ArgumentParser) -> None:
     )
 
 
-# noinspection PyUnresolvedReferences
 def iter_raw(r: requests.Response, chunk_size: int = 1) -> Any:
     """
-    Reimplementation of requests.Response.iter_content that doesn't try
-    to decode zipped content
+    Like requests.Response.iter_content but without decoding zipped content, which
+    reads the body straight from the socket so the request must have been sent with
+    stream=True and the body must not have been read yet
     :param chunk_size:
     :type r: requests.Response
     """
+    if not isinstance(chunk_size, int):
+        raise TypeError(
+            f'chunk_size must be an int, it is instead a {type(chunk_size)}.'
+        )
 
     def generate() -> Any:
         while True:
@@ -61,25 +72,29 @@ def iter_raw(r: requests.Response, chunk_size: int = 1) -> Any:
             log_item('Type of chunk', type(chunk))
             yield chunk
 
-        r._content_consumed = True
+    return generate()
 
-    # noinspection PyProtectedMember
-    if r._content_consumed and isinstance(r._content, bool):
-        raise StreamConsumedError()
-    elif chunk_size is not None and not isinstance(chunk_size, int):
-        raise TypeError(
-            'chunk_size must be an int, it is instead a %s.' % type(chunk_size)
-        )
-    # noinspection PyProtectedMember
-    # simulate reading small chunks of the content
-    reused_chunks = iter_slices(r._content, chunk_size)
 
-    stream_chunks = generate()
+class _ChunkReader(io.RawIOBase):
+    """Binary stream over the chunks of a response body, for io.TextIOWrapper"""
+
+    def __init__(self, chunks: Iterator[bytes]) -> None:
+        self.chunks = chunks
+        self.pending = b''
 
-    # noinspection PyProtectedMember
-    chunks = reused_chunks if r._content_consumed else stream_chunks
+    def readable(self) -> bool:
+        return True
 
-    return chunks
+    def readinto(self, buffer: Any) -> int:
+        while not self.pending:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return 0
+            self.pending = chunk
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
 
 
 class SPARQLResponse:
@@ -95,6 +110,7 @@ class SPARQLResponse:
         self.response = response
         self.mime = mime
         self.chunk_size = 1024
+        self.decoder: SPARQLResultsDecoder | None = None
         if not self.sparql_endpoint.handle_error(self.response):
             return
         log_item('Content Encoding', self.response.headers.get('Content-Encoding'))
@@ -105,41 +121,64 @@ class SPARQLResponse:
         else:
             self.iter_lines_generator = self._iter_lines_raw
 
-    def _csv_iter(self) -> Any:
-        for line in self.response.iter_lines(
-            chunk_size=self.chunk_size, decode_unicode=False, delimiter=b'\n'
-        ):
-            yield line.decode('utf-8')
+    def _text_stream(self) -> TextIO:
+        """
+        The body as text, streamed from the socket unless it has already been read,
+        in which case iter_content() returns the content that was read
+        """
+        chunks = self.response.iter_content(chunk_size=TEXT_CHUNK_SIZE)
+        return io.TextIOWrapper(
+            io.BufferedReader(_ChunkReader(chunks)), encoding='utf-8', newline=''
+        )
 
     def _iter_lines_in_csv_format(self) -> Any:
-        for line in csv.DictReader(self._csv_iter()):
+        for line in csv.DictReader(self._text_stream()):
             yield line
 
-    #
-    # TODO: Translate each TSV row into a Python dictionary where the keys are the column names returned in row 1
-    #
     def _iter_lines_in_tsv_format(self) -> Any:
-        first_line = True
-        for line in self.response.iter_lines(
-            chunk_size=self.chunk_size, decode_unicode=False, delimiter=b'\n'
-        ):
-            if first_line:
-                first_line = False
-                continue
-            if len(line) == 0:
-                continue
-            yield line.decode('utf-8')
+        decoder = SPARQLResultsDecoder(self._text_stream(), MIME_TSV)
+        for row in decoder:
+            yield dict(zip(decoder.variables or [], row))
 
     def _iter_lines_raw(self) -> Any:
-        print('iter_lines 3')
         for line in self.response.iter_lines(
             chunk_size=self.chunk_size, decode_unicode=False, delimiter=b'\n'
         ):
             yield line.decode('utf-8')
 
+    def iter_rows(self, as_terms: bool = False) -> Iterator[Row]:
+        """
+        Decode a SELECT result (JSON, CSV or TSV) incrementally into one tuple per solution,
+        see SPARQLResultsDecoder. The column names are in `variables` once iteration started.
+        """
+        content_type = self.mime or self.response.headers.get('Content-Type', MIME_CSV)
+        self.decoder = SPARQLResultsDecoder(
+            self._text_stream(), content_type, as_terms=as_terms
+        )
+        return iter(self.decoder)
+
+    @property
+    def variables(self) -> list[str] | None:
+        return self.decoder.variables if self.decoder else None
+
     def iter_lines(self) -> Any:
         return self.iter_lines_generator()
 
+    def read(self) -> bytes:
+        """Read the whole response body, which releases the connection back to the pool"""
+        content: bytes = self.response.content
+        return content
+
+    def convert(self) -> Graph:
+        """Parse the RDF returned by a CONSTRUCT or DESCRIBE query into an rdflib.Graph"""
+        content_type = self.response.headers.get('Content-Type', MIME_RDFXML)
+        return Graph().parse(
+            data=self.read(), format=content_type.split(';')[0].strip()
+        )
+
+    def close(self) -> None:
+        self.response.close()
+
 
 class SPARQLEndpoint:
     sparql_endpoint: SPARQLWrapper
@@ -152,6 +191,9 @@ class SPARQLEndpoint:
         Create a SPARQL Endpoint (an instance of the class SPARQLWrapper) given the "standard"
         command line params that we're using for most command line utilities
 
+        All HTTP traffic to the endpoint goes through one pool of keep-alive connections
+        that is shared by all threads, see `session()`.
+
         :param args: the CLI args, see set_cli_params
         """
         if args is None:
@@ -170,7 +212,36 @@ class SPARQLEndpoint:
             args.sparql_endpoint_userid, passwd=args.sparql_endpoint_passwd
         )
         # self.s3_endpoint.addDefaultGraph(graph_iri_for_dataset(self.data_source_code))
-        # self.s3_endpoint.setUseKeepAlive()
+        self.max_connections = (
+            getattr(args, 'sparql_endpoint_max_connections', None)
+            or DEFAULT_MAX_CONNECTIONS
+        )
+        self.idle_timeout = (
+            getattr(args, 'sparql_endpoint_idle_timeout', None) or DEFAULT_IDLE_TIMEOUT
+        )
+        retries = getattr(args, 'sparql_endpoint_retries', None)
+        backoff = getattr(args, 'sparql_endpoint_backoff', None)
+        self.adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.max_connections,
+            # wait for a free connection rather than opening one beyond the limit
+            pool_block=True,
+            max_retries=Retry(
+                total=DEFAULT_RETRIES if retries is None else retries,
+                backoff_factor=DEFAULT_BACKOFF if backoff is None else backoff,
+                status_forcelist=(502, 503, 504),
+                raise_on_status=False,
+            ),
+        )
+        # The SPARQLWrapper instance is stateful, guard it while a request is being built
+        self._wrapper_lock = threading.Lock()
+        self._pool_lock = threading.Lock()
+        self._local = threading.local()
+        self._last_used = time.monotonic()
+        self._in_flight = 0
+        self._requests = 0
+        self._failures = 0
+        self._idle_resets = 0
 
     def endpoint_url(self) -> str:
         return f'{self.endpoint_base}/{self.database}'
@@ -184,6 +255,73 @@ class SPARQLEndpoint:
     def password(self) -> str | None:
         return self.sparql_endpoint.passwd
 
+    def session(self) -> requests.Session:
+        """
+        Return the requests.Session of the current thread. Each thread gets its own session
+        (sessions are not thread-safe) but all of them share the same connection pool.
+        """
+        session: requests.Session | None = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            if self.user_id() is not None:
+                session.auth = (self.user_id() or '', self.password() or '')
+            session.mount('http://', self.adapter)
+            session.mount('https://', self.adapter)
+            self._local.session = session
+        return session
+
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """Send an HTTP request to the endpoint over a pooled keep-alive connection"""
+        with self._pool_lock:
+            now = time.monotonic()
+            if self._in_flight == 0 and now - self._last_used > self.idle_timeout:
+                self.adapter.poolmanager.clear()
+                self._idle_resets += 1
+            self._in_flight += 1
+            self._requests += 1
+        try:
+            return self.session().request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            with self._pool_lock:
+                self._failures += 1
+            raise
+        finally:
+            with self._pool_lock:
+                self._in_flight -= 1
+                self._last_used = time.monotonic()
+
+    def pool_stats(self) -> dict[str, int]:
+        """Return statistics about the connection pool, for monitoring purposes"""
+        opened = 0
+        idle = 0
+        # a RecentlyUsedContainer can't be iterated, keys() returns a copy of its keys
+        keys = self.adapter.poolmanager.pools.keys()
+        pools = self.adapter.poolmanager.pools
+        for key in keys:
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)  # type: ignore[union-attr]
+        with self._pool_lock:
+            return {
+                'max_connections': self.max_connections,
+                'requests': self._requests,
+                'failures': self._failures,
+                'in_flight': self._in_flight,
+                'connections_opened': opened,
+                'connections_idle': idle,
+                'connections_reused': max(0, self._requests - opened),
+                'idle_resets': self._idle_resets,
+            }
+
+    def log_pool_stats(self) -> None:
+        for key, value in self.pool_stats().items():
+            log_item(f'SPARQL pool {key}', value)
+
+    def close(self) -> None:
+        self.adapter.close()
+
     def execute_sparql_select_query(
         self, sparql_statement: str, mime_type: str = MIME_CSV
     ) -> Optional[SPARQLResponse]:
@@ -191,25 +329,25 @@ class SPARQLEndpoint:
 
         if self.verbose:
             log_item('Executing', sparql_statement)
-        # noinspection PyProtectedMember
-        log_item(
-            'Statement Type', self.sparql_endpoint._parseQueryType(sparql_statement)
-        )
-        self.sparql_endpoint.clearCustomHttpHeader('Accept')
-        self.sparql_endpoint.setRequestMethod(URLENCODED)
-        self.sparql_endpoint.setMethod(GET)
-        self.sparql_endpoint.addCustomHttpHeader('Accept', mime_type)
-        log_item('Query', sparql_statement.lstrip())
-        self.sparql_endpoint.setQuery(sparql_statement.lstrip())
-        # noinspection PyProtectedMember
-        request = self.sparql_endpoint._createRequest()
-        for header_name, header_value in request.header_items():
-            log_item(header_name, header_value)
-        log_item('Is Update', self.sparql_endpoint.isSparqlUpdateRequest())
-        log_item('Full URL', request.full_url)
-        # with urllib.request.urlopen(request) as f:
-        #     print(f.read().decode('utf-8'))
-        return self._execute_query()
+        with self._wrapper_lock:
+            # noinspection PyProtectedMember
+            log_item(
+                'Statement Type',
+                self.sparql_endpoint._parseQueryType(sparql_statement),
+            )
+            self.sparql_endpoint.clearCustomHttpHeader('Accept')
+            self.sparql_endpoint.setRequestMethod(URLENCODED)
+            self.sparql_endpoint.setMethod(GET)
+            self.sparql_endpoint.addCustomHttpHeader('Accept', mime_type)
+            log_item('Query', sparql_statement.lstrip())
+            self.sparql_endpoint.setQuery(sparql_statement.lstrip())
+            # noinspection PyProtectedMember
+            request = self.sparql_endpoint._createRequest()
+            for header_name, header_value in request.header_items():
+                log_item(header_name, header_value)
+            log_item('Is Update', self.sparql_endpoint.isSparqlUpdateRequest())
+            log_item('Full URL', request.full_url)
+        return self._execute_query(request, mime=mime_type, stream=True)
 
     def execute_csv_query(self, sparql_statement: str) -> Optional[SPARQLResponse]:
         return self.execute_sparql_query2(sparql_statement)
@@ -242,22 +380,23 @@ class SPARQLEndpoint:
         #
         # Using this method: https://www.w3.org/TR/sparql11-protocol/#query-via-post-direct
         #
-        r = requests.post(
+        r = self.request(
+            'POST',
             endpoint_url,
             data=sparql_statement,
-            auth=(self.user_id(), self.password()),
             params=params,
             headers={
                 'Accept': mime,
                 'Accept-Encoding': '*;q=0, identity;q=1',
                 'Accept-Charset': '*;q=0, utf-8;q=1',
-                'Content-type': 'application/sparql_endpoint-query',
+                'Content-type': 'application/sparql-query',
             },
             stream=True,
         )
         if r.status_code == 200:
             return SPARQLResponse(self, r, mime=mime)
         log_item('HTTP Status', r.status_code)
+        r.close()
         return None
 
     def execute_sparql_statement(
@@ -265,78 +404,88 @@ class SPARQLEndpoint:
     ) -> Optional[SPARQLResponse]:
         if self.verbose:
             log_item('Executing', sparql_statement)
-        statement_type = self.sparql_endpoint._parseQueryType(sparql_statement)
-        log_item('Statement Type', statement_type)
-        self.sparql_endpoint.clearCustomHttpHeader('Accept')
-        self.sparql_endpoint.setMethod(POST)
-        self.sparql_endpoint.setRequestMethod(URLENCODED)
-        self.sparql_endpoint.addCustomHttpHeader('Accept', 'text/boolean')
-        self.sparql_endpoint.addParameter('reasoner', 'true')
-        log_item('Query', sparql_statement)
-        self.sparql_endpoint.setQuery(sparql_statement)
-        request = self.sparql_endpoint._createRequest()
-        for header_name, header_value in request.header_items():
-            log_item(header_name, header_value)
-        log_item('Is Update', self.sparql_endpoint.isSparqlUpdateRequest())
-        log_item('Full URL', request.full_url)
-        # with urllib.request.urlopen(request) as f:
-        #     print(f.read().decode('utf-8'))
-        return self._execute_query()
+        with self._wrapper_lock:
+            statement_type = self.sparql_endpoint._parseQueryType(sparql_statement)
+            log_item('Statement Type', statement_type)
+            self.sparql_endpoint.clearCustomHttpHeader('Accept')
+            self.sparql_endpoint.setMethod(POST)
+            self.sparql_endpoint.setRequestMethod(URLENCODED)
+            self.sparql_endpoint.addCustomHttpHeader('Accept', 'text/boolean')
+            self.sparql_endpoint.clearParameter('reasoner')
+            self.sparql_endpoint.addParameter('reasoner', 'true')
+            log_item('Query', sparql_statement)
+            self.sparql_endpoint.setQuery(sparql_statement)
+            request = self.sparql_endpoint._createRequest()
+            for header_name, header_value in request.header_items():
+                log_item(header_name, header_value)
+            log_item('Is Update', self.sparql_endpoint.isSparqlUpdateRequest())
+            log_item('Full URL', request.full_url)
+        return self._execute_query(request)
 
     def execute_construct(
         self, sparql_construct_statement: str
     ) -> Optional[SPARQLResponse]:
-        self.sparql_endpoint.clearCustomHttpHeader('Accept')
-        self.sparql_endpoint.setMethod(GET)
-        self.sparql_endpoint.setReturnFormat(
-            RDFXML
-        )  # the call to convert() below depends on this being RDFXML
-        self.sparql_endpoint.setRequestMethod(URLENCODED)
-        self.sparql_endpoint.addParameter('reasoner', 'true')
-        #
-        # timeout higher than triple store time out
-        # self.sparql_endpoint.setTimeout(10)
-        #
-        # millisecs. let triple store fail first so timeout earlier than HTTP
-        # self.sparql_endpoint.addParameter("timeout", "2000")
-        log_item('Query', sparql_construct_statement)
-        self.sparql_endpoint.setQuery(sparql_construct_statement)
-        # noinspection PyProtectedMember
-        request = self.sparql_endpoint._createRequest()
-        for header_name, header_value in request.header_items():
-            log_item(header_name, header_value)
-        return self._execute_query()
-
-    def _execute_query(self) -> Optional[SPARQLResponse]:  # noqa: C901
+        with self._wrapper_lock:
+            self.sparql_endpoint.clearCustomHttpHeader('Accept')
+            self.sparql_endpoint.setMethod(GET)
+            self.sparql_endpoint.setReturnFormat(
+                RDFXML
+            )  # the call to convert() below depends on this being RDFXML
+            self.sparql_endpoint.setRequestMethod(URLENCODED)
+            self.sparql_endpoint.clearParameter('reasoner')
+            self.sparql_endpoint.addParameter('reasoner', 'true')
+            #
+            # timeout higher than triple store time out
+            # self.sparql_endpoint.setTimeout(10)
+            #
+            # millisecs. let triple store fail first so timeout earlier than HTTP
+            # self.sparql_endpoint.addParameter("timeout", "2000")
+            log_item('Query', sparql_construct_statement)
+            self.sparql_endpoint.setQuery(sparql_construct_statement)
+            # noinspection PyProtectedMember
+            request = self.sparql_endpoint._createRequest()
+            for header_name, header_value in request.header_items():
+                log_item(header_name, header_value)
+        return self._execute_query(request, mime=MIME_RDFXML)
+
+    def _execute_query(
+        self,
+        request: urllib.request.Request,
+        mime: str | None = None,
+        stream: bool = False,
+    ) -> Optional[SPARQLResponse]:
+        """
+        Send the request that SPARQLWrapper prepared over the shared connection pool.
+        Only SELECT results are streamed, all other responses are small and are read
+        immediately so that their connection goes back to the pool straight away.
+        """
+        url = request.full_url
         try:
-            result = self.sparql_endpoint.query()
-            response = result.response
-            # result.response is an HTTPResponse from urllib which has a 'code' attribute
-            response_code = getattr(response, 'code', None) or getattr(
-                response, 'status_code', None
-            )  # type: ignore[attr-defined]
-            if response_code is not None:
-                log_item('Response Code', response_code)
-            if hasattr(response, 'info'):
-                for key, value in response.info().items():  # type: ignore[attr-defined]
-                    log_item(key, value)
-            for key, value in result.info().items():
-                log_item(key, value)
-            if response_code in (200, 201):
-                return SPARQLResponse(self, response)
-        except urllib.error.HTTPError as err:
-            error('{} code={}'.format(err, err.code))
-        except urllib.error.URLError as err:
-            error('{} reason={}'.format(err, err.reason))
-        except EndPointNotFound as err:
-            error('{}'.format(err))
-            dump(err)
-        except QueryBadFormed:
+            response = self.request(
+                request.get_method(),
+                url,
+                data=request.data,  # type: ignore[arg-type]
+                headers=dict(request.header_items()),
+                stream=stream,
+            )
+        except requests.exceptions.ConnectionError as err:
+            error(f'Could not connect to {url}: {err}')
+            return None
+        except requests.exceptions.RequestException as err:
+            error(f'{err}')
+            return None
+        log_item('Response Code', response.status_code)
+        if response.status_code in (200, 201):
+            return SPARQLResponse(self, response, mime=mime)
+        response.close()
+        if response.status_code == 400:
             error(f'Bad formed SPARQL statement: {self.sparql_endpoint.queryString}')
-        except Unauthorized:
-            error('Unauthorized to access {}'.format(self.sparql_endpoint.endpoint))
-        except ConnectionRefusedError:
-            error('Could not connect to {}'.format(self.sparql_endpoint.endpoint))
+        elif response.status_code in (401, 403):
+            error(f'Unauthorized to access {url}')
+        elif response.status_code == 404:
+            error(f'Endpoint not found: {url}')
+        else:
+            error(f'{response.reason} code={response.status_code}')
         return None
 
     def handle_error(self, r: requests.Response) -> bool:
@@ -89,3 +89,33 @@ def set_cli_params(parser: ArgumentParser) -> None:
             required=True,
             default='admin',
         )
+
+    group.add_argument(
+        '--sparql-endpoint-max-connections',
+        help='Maximum number of concurrent connections to the SPARQL endpoint, '
+        'further requests wait for a free one '
+        '(default is EKG_SPARQL_MAX_CONNECTIONS or 10)',
+        type=int,
+        default=int(os.getenv('EKG_SPARQL_MAX_CONNECTIONS', '10')),
+    )
+    group.add_argument(
+        '--sparql-endpoint-idle-timeout',
+        help='Number of seconds after which idle pooled connections are closed '
+        '(default is EKG_SPARQL_IDLE_TIMEOUT or 60)',
+        type=float,
+        default=float(os.getenv('EKG_SPARQL_IDLE_TIMEOUT', '60')),
+    )
+    group.add_argument(
+        '--sparql-endpoint-retries',
+        help='Number of retries for failed connections to the SPARQL endpoint '
+        '(default is EKG_SPARQL_RETRIES or 3)',
+        type=int,
+        default=int(os.getenv('EKG_SPARQL_RETRIES', '3')),
+    )
+    group.add_argument(
+        '--sparql-endpoint-backoff',
+        help='Backoff factor in seconds between retries, doubled after each retry '
+        '(default is EKG_SPARQL_BACKOFF or 0.5)',
+        type=float,
+        default=float(os.getenv('EKG_SPARQL_BACKOFF', '0.5')),
+    )
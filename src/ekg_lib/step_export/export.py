@@ -1,20 +1,46 @@
 import argparse
+import os
+import threading
+import time
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
+import requests
+from botocore.exceptions import BotoCoreError, ClientError
+
 from ..data_source import set_cli_params as data_source_set_cli_params
-from ..dataset import datasets_produced_by_pipeline, export_dataset
+from ..dataset import (
+    COMPRESSION_GZIP,
+    DEFAULT_TURTLE_MAX_TRIPLES,
+    EXPORT_COMPRESSIONS,
+    datasets_produced_by_pipeline,
+    export_dataset,
+)
 from ..git import set_cli_params as git_set_cli_params
 from ..kgiri import EKG_NS, set_kgiri_base
 from ..kgiri import set_cli_params as kgiri_set_cli_params
-from ..log import log_item
-from ..mime import MIME_NTRIPLES
+from ..log import log_error, log_item, warning
 from ..s3 import S3ObjectStore
 from ..s3 import set_cli_params as s3_set_cli_params
 from ..sparql import SPARQLEndpoint
 from ..sparql import set_cli_params as sparql_set_cli_params
 
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_RETRIES = 2
+DEFAULT_RETRY_DELAY = 10.0
+
 
 class Exporter:
+    """
+    Exports all datasets that the pipeline produced to S3.
+
+    With max_workers greater than 1 the datasets are exported concurrently, the largest
+    graphs first so that the longest exports don't end up waiting for a free worker at
+    the end. A failed export is retried, after which the other datasets are exported
+    anyway and a summary is logged: the exit code is 1 if any of them failed.
+    """
+
     sparql: SPARQLEndpoint
 
     def __init__(self, args: Any) -> None:
@@ -22,32 +48,114 @@ class Exporter:
         self.verbose = args.verbose
         self.data_source_code = args.data_source_code
         self.sparql = SPARQLEndpoint(args)
+        self.max_workers = getattr(args, 'max_workers', None) or DEFAULT_MAX_WORKERS
+        retries = getattr(args, 'retries', None)
+        self.retries = DEFAULT_RETRIES if retries is None else retries
+        retry_delay = getattr(args, 'retry_delay', None)
+        self.retry_delay = DEFAULT_RETRY_DELAY if retry_delay is None else retry_delay
+        self.compression = getattr(args, 'compression', None) or COMPRESSION_GZIP
+        self.turtle_max_triples = (
+            getattr(args, 'turtle_max_triples', None) or DEFAULT_TURTLE_MAX_TRIPLES
+        )
+        self._local = threading.local()
+
+    def object_store(self) -> S3ObjectStore:
+        # boto3 resources are not thread safe, so every worker gets its own
+        if not hasattr(self._local, 's3os'):
+            self._local.s3os = S3ObjectStore(self.args)
+        s3os: S3ObjectStore = self._local.s3os
+        return s3os
 
     def export(self) -> int:
-        s3os = S3ObjectStore(self.sparql.args)
-        for graph_iri, dataset_code in datasets_produced_by_pipeline(
-            self.sparql, self.data_source_code
-        ):
-            #
-            # TODO: For smaller datasets, use MIME_TURTLE, datasets_produced_by_pipeline needs to return size for that
-            #
-            if export_dataset(
-                sparql_endpoint=self.sparql,
-                s3_endpoint=s3os,
-                graph_iri=graph_iri,
-                data_source_code=dataset_code,
-                mime=MIME_NTRIPLES,
-            ):
-                continue
-            return 1
-        return 0
+        datasets = list(
+            datasets_produced_by_pipeline(self.sparql, self.data_source_code)
+        )
+        max_workers = max(1, min(self.max_workers, len(datasets)))
+        log_item('Datasets', len(datasets))
+        log_item('Max workers', max_workers)
+        if max_workers == 1:
+            results = [self.try_export_dataset(*dataset) for dataset in datasets]
+        else:
+            # the largest graphs first
+            order = sorted(
+                range(len(datasets)), key=lambda index: datasets[index][2], reverse=True
+            )
+            with ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix='export'
+            ) as pool:
+                futures = {
+                    index: pool.submit(self.try_export_dataset, *datasets[index])
+                    for index in order
+                }
+                results = [futures[index].result() for index in range(len(datasets))]
+        return self.summary(datasets, results)
+
+    def export_dataset(
+        self, graph_iri: Any, dataset_code: str, triple_count: int | None = None
+    ) -> bool:
+        """Export the given dataset, retrying failed exports, returns False if it failed"""
+        attempts = self.retries + 1
+        for attempt in range(1, attempts + 1):
+            if attempt > 1:
+                delay = self.retry_delay * 2 ** (attempt - 2)
+                warning(
+                    f'Retrying export of {dataset_code} in {delay:g}s '
+                    f'(attempt {attempt} of {attempts})'
+                )
+                time.sleep(delay)
+            try:
+                if export_dataset(
+                    sparql_endpoint=self.sparql,
+                    s3_endpoint=self.object_store(),
+                    graph_iri=graph_iri,
+                    data_source_code=dataset_code,
+                    triple_count=triple_count,
+                    compression=self.compression,
+                    turtle_max_triples=self.turtle_max_triples,
+                ):
+                    return True
+            except (
+                requests.exceptions.RequestException,
+                BotoCoreError,
+                ClientError,
+            ) as e:
+                log_error(f'Could not export {dataset_code}: {e}')
+        return False
+
+    def try_export_dataset(
+        self, graph_iri: Any, dataset_code: str, triple_count: int | None = None
+    ) -> bool:
+        """
+        Same as export_dataset but any other error, like an OSError while writing the
+        file to upload, only fails this dataset instead of the whole export
+        """
+        try:
+            return self.export_dataset(graph_iri, dataset_code, triple_count)
+        except Exception as e:  # noqa: BLE001
+            log_error(f'Could not export {dataset_code}: {e}')
+            return False
+
+    @staticmethod
+    def summary(
+        datasets: Sequence[tuple[Any, str, int | None]], results: Sequence[bool]
+    ) -> int:
+        failed = [
+            dataset_code
+            for (_, dataset_code, _), result in zip(datasets, results)
+            if not result
+        ]
+        log_item('Exported datasets', len(datasets) - len(failed))
+        log_item('Failed datasets', len(failed))
+        for dataset_code in failed:
+            log_error(f'Failed to export dataset {dataset_code}')
+        return 1 if failed else 0
 
 
 def main() -> int:
     parser = argparse.ArgumentParser(
         prog='python3 -m ekg_lib.step_export',
         description='Export the given named graph from the given staging database to the given S3 bucket',
-        epilog='Currently only supports turtle.',
+        epilog='Small graphs are exported as Turtle, large ones as N-Triples.',
         allow_abbrev=False,
     )
     parser.add_argument(
@@ -58,6 +166,45 @@ def main() -> int:
     data_source_set_cli_params(parser)
     sparql_set_cli_params(parser)
     s3_set_cli_params(parser)
+    parser.add_argument(
+        '--max-workers',
+        help='Number of datasets to export concurrently '
+        f'(default is EKG_EXPORT_MAX_WORKERS or {DEFAULT_MAX_WORKERS})',
+        type=int,
+        default=int(os.getenv('EKG_EXPORT_MAX_WORKERS', str(DEFAULT_MAX_WORKERS))),
+    )
+    parser.add_argument(
+        '--retries',
+        help='Number of times a failed export of a dataset is retried '
+        f'(default is EKG_EXPORT_RETRIES or {DEFAULT_RETRIES})',
+        type=int,
+        default=int(os.getenv('EKG_EXPORT_RETRIES', str(DEFAULT_RETRIES))),
+    )
+    parser.add_argument(
+        '--retry-delay',
+        help='Number of seconds to wait before the first retry, doubled after each retry '
+        f'(default is EKG_EXPORT_RETRY_DELAY or {DEFAULT_RETRY_DELAY:g})',
+        type=float,
+        default=float(os.getenv('EKG_EXPORT_RETRY_DELAY', str(DEFAULT_RETRY_DELAY))),
+    )
+
+    parser.add_argument(
+        '--compression',
+        help='The compression of the exported files '
+        '(default is EKG_EXPORT_COMPRESSION or gzip)',
+        choices=EXPORT_COMPRESSIONS,
+        default=os.getenv('EKG_EXPORT_COMPRESSION', COMPRESSION_GZIP),
+    )
+    parser.add_argument(
+        '--turtle-max-triples',
+        help='Graphs with up to this number of triples are exported as Turtle, larger '
+        'ones as N-Triples '
+        f'(default is EKG_EXPORT_TURTLE_MAX_TRIPLES or {DEFAULT_TURTLE_MAX_TRIPLES})',
+        type=int,
+        default=int(
+            os.getenv('EKG_EXPORT_TURTLE_MAX_TRIPLES', str(DEFAULT_TURTLE_MAX_TRIPLES))
+        ),
+    )
 
     args = parser.parse_args()
     set_kgiri_base(args.kgiri_base)
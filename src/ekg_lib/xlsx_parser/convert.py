@@ -0,0 +1,355 @@
+import contextlib
+import re
+from collections.abc import Callable, Iterable
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from dateutil.parser import ParserError, parse, parserinfo
+
+# noinspection SpellCheckingInspection
+translations = {
+    'Ja': True,
+    'Yes': True,
+    'Oui': True,
+    'No': False,
+    'Nein': False,
+    'Non': False,
+    'None': np.nan,
+}
+
+# The strings that pandas.read_excel turns into NaN by default (keep_default_na=True)
+DEFAULT_NA_VALUES = frozenset({
+    '',
+    '#N/A',
+    '#N/A N/A',
+    '#NA',
+    '-1.#IND',
+    '-1.#QNAN',
+    '-NaN',
+    '-nan',
+    '1.#IND',
+    '1.#QNAN',
+    '<NA>',
+    'N/A',
+    'NA',
+    'NULL',
+    'NaN',
+    'None',
+    'n/a',
+    'nan',
+    'null',
+})
+
+# Supersets of the strings for which is_int() and is_decimal() can be true, i.e. the
+# strings that look exactly like str() of an int or a Decimal
+_INT_CANDIDATE = r'-?[0-9]+'
+_DECIMAL_CANDIDATE = (
+    r'-?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)(?:[eE][+-]?[0-9]+)?|-?s?NaN[0-9]*|-?Infinity'
+)
+# ISO dates and times without a timezone, which pandas parses the same as dateutil
+_ISO_DATETIME = r'[0-9]{4}-[0-9]{2}-[0-9]{2}(?:[ T][0-9]{2}:[0-9]{2}(?::[0-9]{2}(?:\.[0-9]{1,6})?)?)?'
+# dateutil can only parse strings that have a digit or a month or weekday name in them
+_DATE_NAMES = frozenset(
+    name.lower()
+    for names in parserinfo.MONTHS + parserinfo.WEEKDAYS  # type: ignore[operator]
+    for name in names
+)
+_INT64 = np.iinfo(np.int64)
+_DIGIT = re.compile(r'\d')
+_WORD = re.compile(r'[^\W\d_]+')
+
+
+def is_int(value: Any) -> bool:
+    try:
+        number = int(value)
+        return bool(value == str(number))
+    except ValueError, TypeError:
+        return False
+
+
+def is_decimal(value: Any) -> bool:
+    try:
+        number = Decimal(value)
+        return bool(value == str(number))
+    except InvalidOperation, TypeError:
+        return False
+
+
+def as_date(date_time: datetime) -> date | datetime:
+    """A datetime at (almost exactly) midnight is a date"""
+    if (
+        date_time.hour == 0
+        and date_time.minute == 0
+        and date_time.second < 2
+        and date_time.microsecond < 32
+    ):
+        return date_time.date()
+    return date_time
+
+
+def convert_to_date(value: Any) -> date | datetime | None:
+    try:
+        return as_date(parse(value))
+    except ParserError, OverflowError:
+        return None
+
+
+def could_be_date(value: str) -> bool:
+    if _DIGIT.search(value):
+        return True
+    return any(word.lower() in _DATE_NAMES for word in _WORD.findall(value))
+
+
+def _as_number(value: Any) -> float | None:
+    try:
+        return float(value)
+    except TypeError, ValueError, OverflowError:
+        return None
+
+
+def na_values(ignored_values: Iterable[Any]) -> set[Any]:
+    """
+    The values that pandas.read_excel turns into NaN when it is given these values as its
+    na_values: the values themselves, the default ones and their string and numeric forms
+    (so that an ignored value 999 also matches '999.0' and 999.0)
+    """
+    result: set[Any] = set()
+    for value in {*ignored_values, *DEFAULT_NA_VALUES}:
+        result.update((value, str(value)))
+        number = _as_number(value)
+        if number is not None and not np.isnan(number):
+            result.add(number)
+            if number.is_integer() and not np.isinf(number):
+                result.update((int(number), str(int(number)), f'{int(number)}.0'))
+        with contextlib.suppress(TypeError, ValueError, OverflowError):
+            result.add(int(value))
+    return result
+
+
+class SheetCell:
+    """
+    A cell value exactly as pandas.read_excel found it in the sheet.
+
+    Using this as the converter of a column makes pandas leave its values alone: it
+    doesn't infer a dtype for them and doesn't deduplicate equal values (which would turn
+    a 1 into True when a True came before it), so that `ColumnConverter` can do both
+    after converting the values.
+    """
+
+    __slots__ = ('value',)
+
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
+
+def _objects(values: Iterable[Any], count: int) -> np.ndarray:
+    return np.fromiter(values, dtype=object, count=count)
+
+
+def infer_type(array: np.ndarray) -> np.ndarray:
+    """
+    The type inference that pandas applies to the result of a converter: a column of
+    bools or of numbers (with or without missing values) gets a bool or numeric dtype,
+    everything else stays a column of objects
+    """
+    kind = pd.api.types.infer_dtype(array, skipna=True)
+    if kind == 'boolean' and not pd.isna(array).any():
+        return array.astype(np.bool_)
+    if kind in ('integer', 'floating', 'mixed-integer-float') and not any(
+        isinstance(value, int) and not _INT64.min <= value <= _INT64.max
+        for value in array
+    ):
+        with contextlib.suppress(TypeError, ValueError, OverflowError):
+            return np.asarray(pd.to_numeric(array))
+    if kind == 'empty' and any(isinstance(value, float) for value in array):
+        return array.astype(np.float64)
+    return array
+
+
+def _str(values: np.ndarray) -> Any:
+    return pd.Series(values, dtype=object).str
+
+
+def map_strings(
+    values: pd.Series, function: Callable[[pd.Series], pd.Series]
+) -> pd.Series:
+    """
+    Apply function to the distinct strings in values only, leaving all other values as
+    they are, and map the results back. Spreadsheet columns tend to have the same
+    values over and over again so this saves most of the work.
+    """
+    is_object = pd.api.types.is_object_dtype(values)
+    if not (is_object or pd.api.types.is_string_dtype(values)):
+        return values
+    array = values.to_numpy(dtype=object, copy=True)
+    is_string = _objects((isinstance(value, str) for value in array), len(array))
+    is_string = is_string.astype(bool)
+    if not is_string.any():
+        return values
+    codes, uniques = pd.factorize(array[is_string])
+    converted = function(pd.Series(uniques, dtype=object))
+    converted = np.asarray(converted, dtype=object)
+    array[is_string] = converted[codes]
+    # a column of strings stays one as long as function only returns strings (or NaN)
+    keep_dtype = is_object or pd.api.types.infer_dtype(converted) in ('string', 'empty')
+    return pd.Series(
+        array,
+        index=values.index,
+        name=values.name,
+        dtype=values.dtype if keep_dtype else object,
+    )
+
+
+def remove_prefixes(strings: pd.Series, prefixes: Iterable[str]) -> pd.Series:
+    """Same as applying re.sub(f'^{prefix}', '', string) for each prefix in turn"""
+    for prefix in prefixes:
+        strings = strings.str.replace(rf'^{prefix}', '', regex=True)
+    return strings
+
+
+def mask_values(strings: pd.Series, values: Iterable[str]) -> pd.Series:
+    """Same as replacing each string for which re.search(f'^{value}$') matches with NaN"""
+    for value in values:
+        strings = strings.where(~strings.str.contains(rf'^{value}$', regex=True))
+    return strings
+
+
+class ColumnConverter:
+    """
+    Converts the cells of a column in one go, the result is the same as calling the
+    cell converter `XlsxParser.parse_value` on every cell followed by the NaN
+    detection that `pandas.read_excel` applies to the result of a converter.
+
+    Only string cells are converted and each distinct string only once. Whole columns
+    of distinct strings are classified with vectorized string operations: translations
+    and ignored values with `isin`, ints and decimals with a regular expression
+    (plus an exact check on the few candidates), ISO dates with `pandas.to_datetime`.
+    Only what's left and could be a date at all is handed to dateutil one by one.
+    """
+
+    def __init__(self, ignored_values: list[str], ignored_prefixes: list[str]) -> None:
+        self.ignored_values = ignored_values
+        self.ignored_prefixes = ignored_prefixes
+        self.na_values = na_values(ignored_values)
+
+    def convert(self, cells: pd.Series) -> pd.Series:
+        """Convert a column that was read with `SheetCell` as its converter"""
+        values = pd.Series(
+            _objects((cell.value for cell in cells), len(cells)), dtype=object
+        )
+        # the type inference and NaN detection pandas does on the result of a converter
+        array = infer_type(
+            map_strings(values, self.convert_strings).to_numpy(copy=True)
+        )
+        if array.dtype == np.object_:
+            self._mask_objects(array)
+        elif issubclass(array.dtype.type, (np.number, np.bool_)):
+            array = self._mask_numbers(array)
+        return pd.Series(array, index=cells.index, name=cells.name)
+
+    def convert_cells(self, values: pd.Series) -> pd.Series:
+        """
+        Convert a column of cell values like `convert` does but without the type inference
+        of pandas, every value keeps its own type. That way the result for a cell doesn't
+        depend on the other cells of the column, which is what reading a sheet in chunks
+        needs.
+        """
+        array = map_strings(values, self.convert_strings).to_numpy(
+            dtype=object, copy=True
+        )
+        self._mask_objects(array)
+        return pd.Series(array, index=values.index, name=values.name, dtype=object)
+
+    def _mask_objects(self, array: np.ndarray) -> None:
+        """Replace the NaN values in a column of objects with NaN, in place"""
+        for index, value in enumerate(array):
+            if value in self.na_values:
+                array[index] = np.nan
+
+    def _mask_numbers(self, array: np.ndarray) -> np.ndarray:
+        """Same as the NaN detection of pandas for a column that was converted to numbers"""
+        numbers = [value for value in self.na_values if not isinstance(value, str)]
+        mask = pd.Index(array).isin(numbers)
+        if not mask.any():
+            return array
+        if pd.api.types.is_integer_dtype(array):
+            array = array.astype(np.float64)
+        else:
+            array = array.copy()
+        np.putmask(array, mask, np.nan)
+        return array
+
+    def convert_strings(self, strings: pd.Series) -> np.ndarray:
+        values = strings.to_numpy(dtype=object)
+        result = np.full(len(values), np.nan, dtype=object)
+        todo = values != ''
+        todo &= ~self._translate(values, todo, result)
+        stripped = values.copy()
+        for prefix in self.ignored_prefixes:
+            starts = todo & _str(stripped).startswith(prefix).to_numpy(dtype=bool)
+            stripped[starts] = _str(stripped[starts]).slice(len(prefix)).to_numpy()
+        todo &= ~self._translate(stripped, todo, result)
+        todo &= ~self._convert(stripped, todo, result, _INT_CANDIDATE, is_int, int)
+        todo &= ~self._convert(
+            stripped, todo, result, _DECIMAL_CANDIDATE, is_decimal, Decimal
+        )
+        todo &= ~self._convert_iso_dates(stripped, todo, result)
+        for index in np.flatnonzero(todo):
+            value = stripped[index]
+            result[index] = (
+                convert_to_date(value) if could_be_date(value) else None
+            ) or value
+        return result
+
+    def _translate(
+        self, values: np.ndarray, todo: np.ndarray, result: np.ndarray
+    ) -> np.ndarray:
+        translated = todo & pd.Index(values).isin(list(translations))
+        result[translated] = _objects(
+            (translations[value] for value in values[translated]),
+            int(translated.sum()),
+        )
+        ignored = todo & ~translated & pd.Index(values).isin(self.ignored_values)
+        result[ignored] = np.nan
+        return translated | ignored
+
+    @staticmethod
+    def _convert(
+        values: np.ndarray,
+        todo: np.ndarray,
+        result: np.ndarray,
+        candidate: str,
+        check: Callable[[str], bool],
+        convert: Callable[[str], Any],
+    ) -> np.ndarray:
+        converted = todo & _str(values).fullmatch(candidate).to_numpy(dtype=bool)
+        candidates = np.flatnonzero(converted)
+        converted[candidates] = [check(values[index]) for index in candidates]
+        result[converted] = _objects(
+            (convert(value) for value in values[converted]), int(converted.sum())
+        )
+        return converted
+
+    @staticmethod
+    def _convert_iso_dates(
+        values: np.ndarray, todo: np.ndarray, result: np.ndarray
+    ) -> np.ndarray:
+        converted = todo & _str(values).fullmatch(_ISO_DATETIME).to_numpy(dtype=bool)
+        if not converted.any():
+            return converted
+        timestamps = pd.to_datetime(
+            pd.Series(values[converted], dtype=object),
+            format='ISO8601',
+            errors='coerce',
+        )
+        # whatever pandas can't parse (like out of range dates) is left to dateutil
+        parsed = timestamps.notna().to_numpy(dtype=bool)
+        converted[np.flatnonzero(converted)[~parsed]] = False
+        result[converted] = _objects(
+            (as_date(timestamp.to_pydatetime()) for timestamp in timestamps[parsed]),
+            int(parsed.sum()),
+        )
+        return converted
@@ -1,15 +1,20 @@
 import argparse
+import contextlib
 import os
+import sys
+import tempfile
+from collections.abc import Callable, Generator
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date, datetime
-from decimal import InvalidOperation
 from pathlib import Path
 from typing import Any, Optional, Tuple
 
 import numpy as np
+import openpyxl
 import pandas as pd
 import rdflib
 import stringcase
-from dateutil.parser import ParserError, parse
+from dateutil.parser import ParserError
 from pandas import isna
 from pandas._libs.lib import Decimal  # type: ignore[attr-defined]  # noqa
 from pandas._libs.tslibs.timestamps import Timestamp  # noqa
@@ -19,16 +24,20 @@ from six import string_types
 from ..data_source import set_cli_params as data_source_set_cli_params
 from ..kgiri import (
     EKG_NS,
+    identity_key_cache_info,
     kgiri_random,
     kgiri_with,
     parse_identity_key,
     parse_identity_key_with_prefix,
     set_kgiri_base,
+    set_kgiri_base_replace,
 )
+from ..kgiri import namespace as kgiri_namespace
 from ..kgiri import set_cli_params as kgiri_set_cli_params
 from ..log import error, log_item, log_list, warning
 from ..main import dump_as_ttl_to_stdout, load_env
 from ..namespace import DATAOPS, RAW
+from ..ntriples import NTriplesWriter, Triple
 from ..string import (
     argv_check_list,
     common_prefix,
@@ -36,6 +45,26 @@ from ..string import (
     remove_prefix,
     strip_end,
 )
+from .convert import (
+    DEFAULT_NA_VALUES,
+    ColumnConverter,
+    SheetCell,
+    convert_to_date,
+    is_decimal,
+    is_int,
+    map_strings,
+    mask_values,
+    remove_prefixes,
+    translations,
+)
+from .stream import (
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_PROFILE_MAX_DISTINCT,
+    DEFAULT_PROFILE_SAMPLE_SIZE,
+    SheetProfile,
+    TripleStream,
+    read_sheet_chunks,
+)
 
 pd.options.display.max_rows = 999  # type: ignore[attr-defined]
 
@@ -137,22 +166,34 @@ def strip_common_prefix_in_column(df: pd.DataFrame, column_name: str) -> pd.Data
 
 
 def strip_ignored_values(df: pd.DataFrame, ignored_values: list[str]) -> pd.DataFrame:
-    for ignored_value in ignored_values:
-        regex = rf'^{ignored_value}$'
-        # log_item('Removing ignored value', regex)
-        df = df.replace(regex, np.nan, regex=True)
+    """Replace the strings that match any of the ignored values (regexes) with NaN"""
+    if len(ignored_values) == 0:
+        return df
+    for column_number in range(len(df.columns)):
+        df.isetitem(
+            column_number,
+            map_strings(
+                df.iloc[:, column_number],
+                lambda strings: mask_values(strings, ignored_values),
+            ),
+        )
     return df
 
 
 def remove_ignored_prefixes(
     df: pd.DataFrame, ignored_prefixes: list[str]
 ) -> pd.DataFrame:
+    """Remove the ignored prefixes (regexes) from the start of all strings"""
     if len(ignored_prefixes) == 0:
         return df
-    for ignored_prefix in ignored_prefixes:
-        regex = rf'^{ignored_prefix}'
-        # log_item('Removing prefix', regex)
-        df = df.replace(regex, '', regex=True)
+    for column_number in range(len(df.columns)):
+        df.isetitem(
+            column_number,
+            map_strings(
+                df.iloc[:, column_number],
+                lambda strings: remove_prefixes(strings, ignored_prefixes),
+            ),
+        )
     return df
 
 
@@ -163,48 +204,6 @@ false_values = ['Nein', 'No', 'Non']
 
 key_column_suffix = '_legacy_id'
 
-# noinspection SpellCheckingInspection
-translations = {
-    'Ja': True,
-    'Yes': True,
-    'Oui': True,
-    'No': False,
-    'Nein': False,
-    'Non': False,
-    'None': np.nan,
-}
-
-
-def is_int(value: Any) -> bool:
-    try:
-        number = int(value)
-        return bool(value == str(number))
-    except ValueError, TypeError:
-        return False
-
-
-def is_decimal(value: Any) -> bool:
-    try:
-        number = Decimal(value)
-        return bool(value == str(number))
-    except InvalidOperation, TypeError:
-        return False
-
-
-def convert_to_date(value: Any) -> date | datetime | None:
-    try:
-        date_time: datetime = parse(value)
-        if (
-            date_time.hour == 0
-            and date_time.minute == 0
-            and date_time.second < 2
-            and date_time.microsecond < 32
-        ):
-            return date_time.date()
-        return date_time
-    except ParserError, OverflowError:
-        return None
-
 
 def convert_key_column(value: Any) -> str:
     """Add the content of key_column_suffix to every value in a key column
@@ -214,8 +213,39 @@ def convert_key_column(value: Any) -> str:
     return f'{value}{key_column_suffix}'
 
 
+def _init_worker(kgiri_base: str | None, kgiri_base_replace: str | None) -> None:
+    """Worker processes don't inherit the KGIRI settings of the parent, set them again"""
+    if kgiri_base:
+        set_kgiri_base(kgiri_base)
+    set_kgiri_base_replace(kgiri_base_replace)
+
+
+def _parse_sheet(
+    args: Any, xlsx_iri: URIRef, sheet_name: str, output: str | None
+) -> tuple[list[Triple], int, int, int]:
+    """
+    Parse one sheet in a worker process. Returns the triples (none in streaming mode,
+    where they are written to the given output file instead), the number of triples and
+    the row and cell counters.
+    """
+    parser = XlsxParser(argparse.Namespace(**{**vars(args), 'output': output}), False)
+    with parser.open_output():
+        parser.parse_sheet(pd.ExcelFile(parser.xlsx_file), xlsx_iri, sheet_name)
+    triples = [] if isinstance(parser.g, TripleStream) else list(parser.g)
+    return triples, len(parser.g), parser.counter_rows, parser.counter_cells
+
+
 class XlsxParser:
-    def __init__(self, args: Any) -> None:
+    """
+    Parses all sheets of an .xlsx file into "raw data" triples.
+
+    The sheets don't depend on each other so with `--max-workers` greater than 1 they are
+    parsed in a pool of worker processes. The triples of every sheet are merged in the
+    order of the sheets in the file, the same as a sequential run.
+    """
+
+    def __init__(self, args: Any, parse: bool = True) -> None:
+        self.args = args
         self.verbose = args.verbose
         self.ignored_values = (
             args.ignored_values if 'ignored_values' in args else list()
@@ -230,35 +260,129 @@ class XlsxParser:
             args.strip_any_prefix if 'strip_any_prefix' in args else False
         )
         self.skip_sheets = args.skip_sheets if 'skip_sheets' in args else list()
+        self.converter = ColumnConverter(self.ignored_values, self.ignored_prefixes)
         self.legacy_key_prefix = stringcase.spinalcase(args.kgiri_prefix)
         self.legacy_key_column_number = args.key_column_number
         self.column_names: list[str] = list()
         self.counter_rows = 0
         self.counter_cells = 0
-        self.g = rdflib.Graph()
+        #
+        # In streaming mode the rows are read in chunks and the triples are written to
+        # the output as N-Triples as we go, rather than collected in a graph first
+        #
+        self.stream = getattr(args, 'stream', False)
+        self.output = getattr(args, 'output', None)
+        self.chunk_size = getattr(args, 'chunk_size', None) or DEFAULT_CHUNK_SIZE
+        self.profile_sample_size = (
+            getattr(args, 'profile_sample_size', None) or DEFAULT_PROFILE_SAMPLE_SIZE
+        )
+        self.profile_max_distinct = (
+            getattr(args, 'profile_max_distinct', None) or DEFAULT_PROFILE_MAX_DISTINCT
+        )
+        if self.stream and self.strip_any_prefix:
+            warning('Ignoring --strip-any-prefix, it needs all rows of a sheet at once')
+            self.strip_any_prefix = False
+        self.max_workers = getattr(args, 'max_workers', None) or 1
+        # in streaming mode the graph is replaced by a TripleStream in open_output()
+        self.g: rdflib.Graph | TripleStream = rdflib.Graph()
         self.add_namespaces()
         self.xlsx_file = Path(args.input)
         if not self.xlsx_file.exists():
             error(f'{self.xlsx_file} does not exist')
+        if parse:
+            self.parse_file()
+
+    def parse_file(self) -> None:
         key = parse_identity_key_with_prefix('xlsx-file', self.xlsx_file.stem)
         if key is None:
             raise ValueError(f'Could not parse identity key for {self.xlsx_file.stem}')
-        xlsx_iri = EKG_NS['KGIRI'].term(key)
-        self.g.add((xlsx_iri, RDF.type, RAW.XlsxFile))
-        self.g.add((xlsx_iri, RDF.type, PROV.Entity))
-        self.g.add((xlsx_iri, RAW.fileName, Literal(self.xlsx_file)))
-        activity_iri = self._prov_activity_start(xlsx_iri)
-        log_item('Reading XSLX file', self.xlsx_file)
-        xlsx: Any = pd.ExcelFile(self.xlsx_file)  # type: ignore[attr-defined]
-        log_list('Sheet Names', xlsx.sheet_names)
-        log_list('Skipping Sheets', args.skip_sheets)
-        for sheet_name in xlsx.sheet_names:
-            self.parse_sheet(xlsx, xlsx_iri, sheet_name)
-        self._prov_activity_end(activity_iri)
+        with self.open_output():
+            xlsx_iri = EKG_NS['KGIRI'].term(key)
+            self.g.add((xlsx_iri, RDF.type, RAW.XlsxFile))
+            self.g.add((xlsx_iri, RDF.type, PROV.Entity))
+            self.g.add((xlsx_iri, RAW.fileName, Literal(self.xlsx_file)))
+            activity_iri = self._prov_activity_start(xlsx_iri)
+            log_item('Reading XSLX file', self.xlsx_file)
+            xlsx: Any = pd.ExcelFile(self.xlsx_file)  # type: ignore[attr-defined]
+            log_list('Sheet Names', xlsx.sheet_names)
+            log_list('Skipping Sheets', self.skip_sheets)
+            self.parse_sheets(xlsx, xlsx_iri)
+            self._prov_activity_end(activity_iri)
         log_item('Processed # sheets', len(xlsx.sheet_names))
         log_item('Processed # rows', self.counter_rows)
         log_item('Processed # cells', self.counter_cells)
         log_item('Generated # triples', len(self.g))
+        log_item('Identity key cache', identity_key_cache_info())
+
+    @contextlib.contextmanager
+    def open_output(self) -> Generator[None]:
+        """
+        In streaming mode, write the triples that are added in this context to the output
+        file (or stdout) and close the file at the end, also when parsing fails
+        """
+        if not self.stream:
+            yield
+            return
+        with (
+            open(self.output, 'wb')
+            if self.output
+            else contextlib.nullcontext(sys.stdout.buffer) as output_stream
+        ):
+            self.g = TripleStream(NTriplesWriter(output_stream))
+            try:
+                yield
+            finally:
+                self.g.flush()
+
+    def parse_sheets(self, xlsx: Any, xlsx_iri: URIRef) -> None:
+        sheet_names = [
+            sheet_name
+            for sheet_name in xlsx.sheet_names
+            if sheet_name not in self.skip_sheets
+        ]
+        max_workers = min(self.max_workers, len(sheet_names))
+        log_item('Max workers', max_workers)
+        if max_workers <= 1:
+            for sheet_name in xlsx.sheet_names:
+                self.parse_sheet(xlsx, xlsx_iri, sheet_name)
+            return
+        for sheet_name in self.skip_sheets:
+            if sheet_name in xlsx.sheet_names:
+                log_item('Skipping sheet', sheet_name)
+        with (
+            tempfile.TemporaryDirectory() as directory,
+            ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=_init_worker,
+                initargs=(
+                    kgiri_namespace.kgiri_base,
+                    kgiri_namespace.kgiri_base_replace,
+                ),
+            ) as pool,
+        ):
+            # in streaming mode every worker writes the N-Triples of its sheet to a file
+            # of its own, which are then appended to the output one after the other
+            outputs = [
+                str(Path(directory) / f'sheet-{number}.nt') if self.stream else None
+                for number in range(len(sheet_names))
+            ]
+            # map() returns the results in the order of the sheets, whatever the order in
+            # which the workers finish
+            results = pool.map(
+                _parse_sheet,
+                [self.args] * len(sheet_names),
+                [xlsx_iri] * len(sheet_names),
+                sheet_names,
+                outputs,
+            )
+            for output, (triples, triple_count, rows, cells) in zip(outputs, results):
+                self.counter_rows += rows
+                self.counter_cells += cells
+                if isinstance(self.g, TripleStream):
+                    assert output is not None
+                    self.g.append_file(output, triple_count)
+                else:
+                    self.g.addN((s, p, o, self.g) for s, p, o in triples)
 
     def _prov_activity_start(self, xlsx_iri: URIRef) -> URIRef:
         activity_iri = kgiri_random()
@@ -285,35 +409,93 @@ class XlsxParser:
         #
         df = xlsx.parse(sheet_name=sheet_name, index_col=None, nrows=0)
         number_of_columns = len(df.columns)
+        first_column = df.columns[0] if number_of_columns else None
         self.parse_column_names(sheet_iri, df)
         #
         # Now we know what the number of columns in this sheet is so we can adjust the legacy_key_column_number
         #
         log_item('Number of columns', number_of_columns)
         log_item('Key Column Number', self.key_column_number(number_of_columns))
-        converters = {
+        if self.stream:
+            self.parse_sheet_in_chunks(
+                xlsx, sheet_name, sheet_iri, sheet_name_escaped, list(df.columns)
+            )
+            return
+        converters: dict[int, Callable[[Any], Any]] = {
             self.key_column_number(number_of_columns): lambda value: convert_key_column(
                 value
             )
         }
+        #
+        # All other columns are read as they are and then converted column by column,
+        # which gives the same result as calling parse_value() on every cell but is a lot
+        # faster. Since the NaN values are detected after the conversion they are only
+        # passed for the first column.
+        #
         for i in range(1, number_of_columns):
-            converters[i] = lambda value, j=i: self.parse_value(value, j)  # type: ignore[misc]
+            converters[i] = SheetCell
         df = xlsx.parse(
             sheet_name=sheet_name,
             index_col=None,
-            keep_default_na=True,
+            keep_default_na=False,
             true_values=self.true_values,
             false_values=self.false_values,
             parse_dates=True,
-            na_values=self.ignored_values,
+            na_values={first_column: [*self.ignored_values, *DEFAULT_NA_VALUES]},
             converters=converters,
         )
+        for i in range(1, number_of_columns):
+            df.isetitem(i, self.converter.convert(df.iloc[:, i]))
         df = remove_ignored_prefixes(df, self.ignored_prefixes)
         df = self.strip_any_prefix_from_all_columns(df)
         df = strip_ignored_values(df, self.ignored_values)
         self.data_profile(sheet_iri, df)
         self.parse_rows(df, sheet_iri, sheet_name_escaped)
 
+    def parse_sheet_in_chunks(
+        self,
+        xlsx: Any,
+        sheet_name: str,
+        sheet_iri: URIRef,
+        sheet_name_escaped: str,
+        columns: list[str],
+    ) -> None:
+        """
+        Parse the rows of the sheet chunk_size rows at a time and write out the triples of
+        each chunk before reading the next one. The data profile is computed with online
+        aggregates, see SheetProfile.
+        """
+        key_column_number = self.key_column_number(len(columns))
+        profile = SheetProfile(
+            columns, self.profile_sample_size, self.profile_max_distinct
+        )
+        # the same read-only and values-only workbook that pandas.read_excel reads
+        workbook = openpyxl.load_workbook(
+            self.xlsx_file, read_only=True, data_only=True, keep_links=False
+        )
+        try:
+            sheet = workbook[sheet_name]
+            for chunk in read_sheet_chunks(sheet, columns, self.chunk_size):
+                for i in range(len(columns)):
+                    # like in parse_sheet, only a key column that is the first column
+                    # gets the key column converter, all other columns get converted
+                    # as values
+                    if i == 0 and key_column_number == 0:
+                        chunk.isetitem(i, chunk.iloc[:, i].map(convert_key_column))
+                    else:
+                        chunk.isetitem(
+                            i, self.converter.convert_cells(chunk.iloc[:, i])
+                        )
+                chunk = remove_ignored_prefixes(chunk, self.ignored_prefixes)
+                chunk = strip_ignored_values(chunk, self.ignored_values)
+                profile.update(chunk)
+                self.parse_rows(chunk, sheet_iri, sheet_name_escaped)
+                assert isinstance(self.g, TripleStream)
+                self.g.flush()
+        finally:
+            workbook.close()
+        self.data_profile_metrics(sheet_iri, profile.describe())
+
     def parse_value(self, value: Any, column_number: int) -> Any:  # noqa
         if not isinstance(value, string_types):
             return value
@@ -353,7 +535,12 @@ class XlsxParser:
         'count', 'unique', 'top', 'freq', 'mean', 'std', 'min', '25%', '50%', '75%', 'max'
         """
         # data_profile = df.describe(include='all', datetime_is_numeric=True)
-        data_profile = df.describe(include='all')  # type: ignore[operator]
+        self.data_profile_metrics(sheet_iri, df.describe(include='all'))  # type: ignore[operator]
+
+    def data_profile_metrics(
+        self, sheet_iri: URIRef, data_profile: pd.DataFrame
+    ) -> None:
+        """Add the metrics of the result of describe() or SheetProfile.describe()"""
         data_profile.columns = self.column_names  # type: ignore[assignment]
         # log_item('Data Profile', data_profile)
         data_profile_transposed = data_profile.transpose()
@@ -602,12 +789,16 @@ class XlsxParser:
         return cell in self.ignored_values
 
     def add_namespaces(self) -> None:
+        if isinstance(self.g, TripleStream):
+            return
         self.g.base = EKG_NS['KGIRI']
         self.g.namespace_manager.bind('prov', PROV)
         self.g.namespace_manager.bind('raw', RAW)
         self.g.namespace_manager.bind('dataops', DATAOPS)
 
     def dump_as_ttl_to_stdout(self) -> int:
+        if isinstance(self.g, TripleStream):
+            return 0  # already written to stdout as N-Triples
         dump_as_ttl_to_stdout(self.g)
         return 0
 
@@ -615,6 +806,16 @@ class XlsxParser:
         if not output_file:
             warning('You did not specify an output file, no output file created')
             return 1
+        if isinstance(self.g, TripleStream):
+            # the triples have been written while parsing, to the output given at the start
+            if self.output is None or Path(output_file) != Path(self.output):
+                warning(
+                    f'The triples were streamed to {self.output or "stdout"}, '
+                    f'{output_file} was not created'
+                )
+                return 1
+            log_item('Created', output_file)
+            return 0
         self.g.serialize(destination=output_file, encoding='UTF-8', format='ttl')
         log_item('Created', output_file)
         return 0
@@ -646,7 +847,8 @@ def main() -> int:
         '--input', help='The name of the input .xlsx file', required=True
     )
     parser.add_argument(
-        '--output', help='The name of the output RDF file (must be .ttl)'
+        '--output',
+        help='The name of the output RDF file (must be .ttl, or .nt with --stream)',
     )
     parser.add_argument(
         '--key-column-number',
@@ -681,6 +883,40 @@ def main() -> int:
     parser.add_argument(
         '--verbose', '-v', help='verbose output', default=False, action='store_true'
     )
+    parser.add_argument(
+        '--max-workers',
+        help='Maximum number of processes that parse sheets concurrently, '
+        'can also be set with env var EKG_XLSX_MAX_WORKERS',
+        type=int,
+        default=int(os.getenv('EKG_XLSX_MAX_WORKERS', '1')),
+    )
+    stream_group = parser.add_argument_group('Streaming')
+    stream_group.add_argument(
+        '--stream',
+        help='Read the rows in chunks and write N-Triples as we go, for sheets that do not fit in memory',
+        default=False,
+        action='store_true',
+    )
+    stream_group.add_argument(
+        '--chunk-size',
+        help=f'The number of rows to read at a time with --stream (default is {DEFAULT_CHUNK_SIZE})',
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+    )
+    stream_group.add_argument(
+        '--profile-sample-size',
+        help='The number of values per column that the quartiles of the data profile '
+        f'are computed from with --stream (default is {DEFAULT_PROFILE_SAMPLE_SIZE})',
+        type=int,
+        default=DEFAULT_PROFILE_SAMPLE_SIZE,
+    )
+    stream_group.add_argument(
+        '--profile-max-distinct',
+        help='The maximum number of distinct values per column that are counted for the '
+        f'data profile with --stream (default is {DEFAULT_PROFILE_MAX_DISTINCT})',
+        type=int,
+        default=DEFAULT_PROFILE_MAX_DISTINCT,
+    )
     kgiri_group = kgiri_set_cli_params(parser)
     kgiri_group.add_argument(
         '--kgiri-prefix',
@@ -690,6 +926,8 @@ def main() -> int:
     data_source_set_cli_params(parser)
 
     args = parser.parse_args()
+    if args.stream and args.output and Path(args.output).suffix != '.nt':
+        parser.error('--stream writes N-Triples, the --output file must end with .nt')
     set_kgiri_base(args.kgiri_base)
 
     #
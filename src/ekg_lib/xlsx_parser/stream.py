@@ -0,0 +1,268 @@
+import shutil
+from collections import Counter, OrderedDict
+from collections.abc import Iterator
+from datetime import datetime
+from itertools import islice
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+from ..log import warning
+from ..ntriples import NTriplesWriter, Triple
+
+DEFAULT_CHUNK_SIZE = 10000
+DEFAULT_PROFILE_SAMPLE_SIZE = 100000
+DEFAULT_PROFILE_MAX_DISTINCT = 100000
+DEFAULT_DEDUPLICATION_WINDOW = 100000
+
+_NUMERIC_TYPES = ('integer', 'floating', 'mixed-integer-float')
+
+
+class TripleStream:
+    """
+    Takes the place of the rdflib Graph of an XlsxParser in streaming mode: the triples
+    that are added are written to the given writer as N-Triples when `flush()` is called
+    rather than kept in memory.
+
+    The parser adds some triples over and over again, like the ones about a string value
+    that occurs in many rows. A triple that is one of the last `window` distinct triples
+    is skipped, so that these are mostly written only once. Any remaining duplicates are
+    harmless, a triple store only keeps one of them.
+    """
+
+    def __init__(
+        self, writer: NTriplesWriter, window: int = DEFAULT_DEDUPLICATION_WINDOW
+    ) -> None:
+        self.writer = writer
+        self.window = window
+        self.recent: OrderedDict[Triple, None] = OrderedDict()
+        self.pending: list[Triple] = []
+
+    def add(self, triple: Triple) -> None:
+        if triple in self.recent:
+            self.recent.move_to_end(triple)
+            return
+        self.recent[triple] = None
+        if len(self.recent) > self.window:
+            self.recent.popitem(last=False)
+        self.pending.append(triple)
+
+    def flush(self) -> None:
+        self.writer.write(self.pending)
+        self.pending = []
+        self.writer.flush()
+
+    def append_file(self, path: str, triple_count: int) -> None:
+        """Append a file with triple_count triples that were written as N-Triples elsewhere"""
+        self.flush()
+        with open(path, 'rb') as file:
+            shutil.copyfileobj(file, self.writer.stream)
+        self.writer.triples_written += triple_count
+        self.writer.flush()
+
+    def __len__(self) -> int:
+        return self.writer.triples_written + len(self.pending)
+
+
+def cell_value(cell: Any) -> Any:
+    """
+    The value of an openpyxl cell the way pandas.read_excel reads it, except that dates
+    are returned as a Timestamp, like they are in a column of dates read by read_excel
+    """
+    value = cell.value
+    if value is None:
+        return ''
+    if cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        number = int(value)
+        if number == value:
+            return number
+        return float(value)
+    if isinstance(value, datetime):
+        return pd.Timestamp(value)
+    return value
+
+
+def _sheet_rows(sheet: Any, number_of_columns: int) -> Iterator[list[Any]]:
+    empty_rows = 0
+    for row in sheet.rows:
+        values = [cell_value(cell) for cell in row[:number_of_columns]]
+        while values and values[-1] == '':
+            values.pop()
+        if not values:
+            # we only know whether empty rows count once we know they're not at the end
+            empty_rows += 1
+            continue
+        if number_of_columns > 1:
+            for _ in range(empty_rows):
+                yield [''] * number_of_columns
+        empty_rows = 0
+        yield values + [''] * (number_of_columns - len(values))
+
+
+def read_sheet_chunks(
+    sheet: Any, columns: list[str], chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[pd.DataFrame]:
+    """
+    Read the data rows of the given read-only openpyxl worksheet in DataFrames of at
+    most chunk_size rows, with the cell values as they are in the sheet and with the rows
+    numbered like in the DataFrame that pandas.read_excel returns for the sheet: the
+    first row is the header and empty rows count as rows, unless they're at the end of
+    the sheet or the sheet only has one column.
+    """
+    if hasattr(sheet, 'reset_dimensions'):
+        sheet.reset_dimensions()
+    rows = _sheet_rows(sheet, len(columns))
+    next(rows, None)
+    start = 0
+    while chunk := list(islice(rows, chunk_size)):
+        yield pd.DataFrame(
+            chunk,
+            columns=columns,
+            index=range(start, start + len(chunk)),
+            dtype=object,
+        )
+        start += len(chunk)
+
+
+class ColumnProfile:
+    """
+    Online version of the statistics that `DataFrame.describe()` gives for a column,
+    computed one chunk of rows at a time in bounded memory.
+
+    The count, mean, standard deviation, minimum and maximum are exact. The quartiles
+    are computed from a uniform random sample of at most `sample_size` values, so they're
+    exact as long as the column doesn't have more values than that. The number of unique
+    values and the most frequent one are only reported for columns with no more than
+    `max_distinct` distinct values.
+    """
+
+    def __init__(
+        self,
+        sample_size: int = DEFAULT_PROFILE_SAMPLE_SIZE,
+        max_distinct: int = DEFAULT_PROFILE_MAX_DISTINCT,
+        seed: int = 0,
+    ) -> None:
+        self.sample_size = sample_size
+        self.max_distinct = max_distinct
+        self.random = np.random.default_rng(seed)
+        self.count = 0
+        self.numeric = True
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of the squared differences from the mean
+        self.min = np.inf
+        self.max = -np.inf
+        self.sample = np.empty(0)
+        self.sample_keys = np.empty(0)
+        self.values: Counter[Any] | None = Counter()
+
+    def update(self, values: pd.Series) -> None:
+        values = values[values.notna()]
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        if self.values is not None:
+            self.values.update(values.tolist())
+            if len(self.values) > self.max_distinct:
+                self.values = None
+        if self.numeric and pd.api.types.infer_dtype(values) in _NUMERIC_TYPES:
+            self._update_numbers(values.to_numpy(dtype=np.float64))
+        else:
+            self.numeric = False
+
+    def _update_numbers(self, numbers: np.ndarray) -> None:
+        # combine the mean and the sum of squares with those of the chunk (Chan et al.)
+        count = len(numbers)
+        total = self.count
+        previous = total - count
+        mean = float(numbers.mean())
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += (
+            float(((numbers - mean) ** 2).sum()) + delta**2 * previous * count / total
+        )
+        self.min = min(self.min, float(numbers.min()))
+        self.max = max(self.max, float(numbers.max()))
+        # keep the values with the lowest random keys, which is a uniform sample
+        keys = self.random.random(count)
+        self.sample = np.concatenate([self.sample, numbers])
+        self.sample_keys = np.concatenate([self.sample_keys, keys])
+        if len(self.sample) > self.sample_size:
+            keep = np.argpartition(self.sample_keys, self.sample_size)[
+                : self.sample_size
+            ]
+            self.sample = self.sample[keep]
+            self.sample_keys = self.sample_keys[keep]
+
+    def describe(self) -> dict[str, Any]:
+        if self.numeric and self.count:
+            quartiles = np.percentile(self.sample, [25, 50, 75])
+            return {
+                'count': self.count,
+                'mean': self.mean,
+                'std': np.sqrt(self.m2 / (self.count - 1))
+                if self.count > 1
+                else np.nan,
+                'min': self.min,
+                '25%': quartiles[0],
+                '50%': quartiles[1],
+                '75%': quartiles[2],
+                'max': self.max,
+            }
+        profile: dict[str, Any] = {'count': self.count}
+        if self.values is not None:
+            profile['unique'] = len(self.values)
+            if self.values:
+                profile['top'], profile['freq'] = self.values.most_common(1)[0]
+        return profile
+
+
+class SheetProfile:
+    """The `ColumnProfile` of every column of a sheet"""
+
+    def __init__(
+        self,
+        columns: list[str],
+        sample_size: int = DEFAULT_PROFILE_SAMPLE_SIZE,
+        max_distinct: int = DEFAULT_PROFILE_MAX_DISTINCT,
+    ) -> None:
+        self.columns = columns
+        self.profiles = [
+            ColumnProfile(sample_size, max_distinct, seed)
+            for seed in range(len(columns))
+        ]
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        for column_number, profile in enumerate(self.profiles):
+            profile.update(chunk.iloc[:, column_number])
+
+    def describe(self) -> pd.DataFrame:
+        """The profile in the same form as the result of `DataFrame.describe()`"""
+        for column, profile in zip(self.columns, self.profiles):
+            if profile.values is None and not profile.numeric:
+                warning(
+                    f'Column {column} has more than {profile.max_distinct} distinct '
+                    'values, not profiling its unique and most frequent values'
+                )
+        return pd.DataFrame(
+            {
+                column_number: pd.Series(profile.describe(), dtype=object)
+                for column_number, profile in enumerate(self.profiles)
+            },
+            index=[
+                'count',
+                'unique',
+                'top',
+                'freq',
+                'mean',
+                'std',
+                'min',
+                '25%',
+                '50%',
+                '75%',
+                'max',
+            ],
+        )
@@ -1,8 +1,12 @@
+import argparse
 import sys
 
 import pytest
+from rdflib.compare import to_isomorphic
 
 import ekg_lib
+from ekg_lib.dataops_rules_capture import DataopsRulesCapture
+from ekg_lib.kgiri import set_kgiri_base
 
 
 class TestDataopsRulesCapture:
@@ -37,3 +41,26 @@ class TestDataopsRulesCapture:
         ]
         actual = ekg_lib.dataops_rules_capture.main()
         print(actual)
+
+
+class TestParallelCapture:
+    @staticmethod
+    def _capture(test_data_dir, max_workers):
+        args = argparse.Namespace(
+            verbose=False,
+            dataops_roots=f'{test_data_dir}/dataops,{test_data_dir}/another-dataops-root',
+            ontologies_root=f'{test_data_dir}/ontologies',
+            data_source_code='test-data-source',
+            git_branch='test-branch',
+            max_workers=max_workers,
+        )
+        capture = DataopsRulesCapture(args)
+        capture.capture()
+        return capture.g
+
+    def test_parallel_capture_matches_sequential(self, kgiri_base, test_data_dir):
+        set_kgiri_base(kgiri_base)
+        sequential = self._capture(test_data_dir, 1)
+        parallel = self._capture(test_data_dir, 2)
+        assert len(sequential) > 0
+        assert to_isomorphic(sequential) == to_isomorphic(parallel)
@@ -1,6 +1,16 @@
+import argparse
 import sys
+from pathlib import Path
+
+import pytest
+from rdflib.compare import to_isomorphic
 
 import ekg_lib
+from ekg_lib.dataops_rule_parser import DataopsRuleParser, closure, ontology_closure
+from ekg_lib.dataops_rule_parser.closure import owlrl_closure
+from ekg_lib.dataops_rule_parser.parse import ontology_file_names
+from ekg_lib.kgiri import set_kgiri_base
+from ekg_lib.main import load_rdf_file_into_graph
 
 
 class TestDataopsRuleParser:
@@ -44,3 +54,51 @@ class TestDataopsRuleParser:
         assert '<rule-set-generic> a' in actual
         assert ':RuleSet' in actual
         assert 'rdfs:label "generic"' in actual
+
+
+class TestOntologyClosure:
+    def test_same_result_as_full_closure(
+        self, kgiri_base, test_data_dir, tmp_path, monkeypatch
+    ):
+        set_kgiri_base(kgiri_base)
+        args = argparse.Namespace(
+            verbose=False,
+            data_source_code='abc',
+            ontologies_root=f'{test_data_dir}/ontologies',
+            ontology_cache_dir=str(tmp_path),
+        )
+        monkeypatch.setattr(closure, '_closures', {})
+        for rule_file in sorted(Path(test_data_dir).glob('dataops/*/*/rule.ttl')):
+            parser = DataopsRuleParser(args, input_file_name=str(rule_file))
+            assert parser.check() == 0
+            # what check() did before the ontology closure was cached
+            full = DataopsRuleParser(args, input_file_name=str(rule_file))
+            full.g = full.read_rule_file()
+            for rule_iri in list(full.get_rule_iris()):
+                full.check_rule(rule_iri)
+            for ontology_file_name in ontology_file_names:
+                load_rdf_file_into_graph(
+                    full.g, full.ontologies_root / ontology_file_name
+                )
+            owlrl_closure(full.g)
+            full.rdfs_remove_tbox_stuff()
+            assert to_isomorphic(parser.g) == to_isomorphic(full.g), rule_file
+        assert len(list(tmp_path.glob('*.pickle'))) == 1
+
+    def test_closure_is_loaded_from_cache(
+        self, kgiri_base, test_data_dir, tmp_path, monkeypatch
+    ):
+        set_kgiri_base(kgiri_base)
+        ontology_files = [Path(test_data_dir) / 'ontologies/ekgf-dataops-rule.ttl']
+        monkeypatch.setattr(closure, '_closures', {})
+        computed = ontology_closure(ontology_files, tmp_path)
+        assert ontology_closure(ontology_files, tmp_path) is computed
+        monkeypatch.setattr(closure, '_closures', {})
+        monkeypatch.setattr(
+            closure,
+            'owlrl_closure',
+            lambda graph: pytest.fail('closure should come from the cache'),
+        )
+        cached = ontology_closure(ontology_files, tmp_path)
+        assert cached is not computed
+        assert set(cached.triples) == set(computed.triples)
@@ -1,8 +1,16 @@
+import argparse
+import hashlib
 import sys
+import threading
+import time
 
 import pytest
+from rdflib import Literal, URIRef
 
 import ekg_lib
+from ekg_lib.dataops_rules_execute import RuleDag
+from ekg_lib.kgiri import set_kgiri_base
+from ekg_lib.namespace import RULE
 
 
 class TestDataopsRulesExecutor:
@@ -32,3 +40,312 @@ class TestDataopsRulesExecutor:
         assert (
             ekg_lib.dataops_rules_execute.main() == 0
         )  # TODO: make more meaningful assertions here
+
+
+class TestRuleDag:
+    def test_order_follows_sort_keys_and_dependencies(self):
+        dag = RuleDag()
+        a, b, c = URIRef('urn:a'), URIRef('urn:b'), URIRef('urn:c')
+        dag.add_rule(a, '01')
+        dag.add_rule(b, '02')
+        dag.add_rule(c, '03')
+        assert dag.order() == [a, b, c]
+        dag.add_dependency(a, c)
+        assert dag.order() == [b, c, a]
+
+    def test_cycle_is_rejected(self):
+        dag = RuleDag()
+        a, b = URIRef('urn:a'), URIRef('urn:b')
+        dag.add_rule(a, '01')
+        dag.add_rule(b, '02')
+        dag.add_dependency(a, b)
+        dag.add_dependency(b, a)
+        with pytest.raises(ValueError):
+            dag.order()
+
+    def test_concurrent_execution_respects_dependencies(self):
+        dag = RuleDag()
+        rules = [URIRef(f'urn:rule-{i}') for i in range(8)]
+        for i, rule in enumerate(rules):
+            dag.add_rule(rule, f'{i:02}')
+        dag.add_dependency(rules[7], rules[0])
+        finished = []
+        lock = threading.Lock()
+
+        def execute_rule(rule_iri, index):
+            time.sleep(0.01)
+            with lock:
+                finished.append(rule_iri)
+            return 1
+
+        assert dag.execute(execute_rule, max_workers=4) == 8
+        assert sorted(finished) == sorted(rules)
+        assert finished.index(rules[0]) < finished.index(rules[7])
+
+    def test_rules_without_dependencies_are_chained_per_rule_set(self, test_data_dir):
+        args = argparse.Namespace(
+            verbose=False,
+            data_source_code='test',
+            rules_file=f'{test_data_dir}/dataops/generic/00001-check-dataset-not-empty.ttl',
+            rule_type=str(RULE.ValidationRule),
+        )
+        dag = ekg_lib.dataops_rules_execute.DataopsRulesExecute(args).build_dag()
+        generic = URIRef('http://localhost/id/rule-00001-check-dataset-not-empty')
+        ask = URIRef('http://localhost/id/rule-00001-test-ask-rule')
+        assert len(dag) == 4
+        assert dag.depends_on[generic] == set()
+        assert dag.depends_on[ask] == {generic}
+
+    def test_rule_sets_are_executed_in_sort_key_order(self, tmp_path):
+        rules = {
+            'generic-1': ('01-generic-00001', 'generic', None),
+            'generic-2': ('01-generic-00002', 'generic', None),
+            'load-1': ('10-load-00001', 'load', None),
+            'load-2': ('10-load-00002', 'load', 'load-1'),
+            'load-3': ('10-load-00003', 'load', 'load-1'),
+            'obfuscate-1': ('99-obfuscate-00001', 'obfuscate', 'generic-1'),
+        }
+        rules_file = tmp_path / 'rules.ttl'
+        rules_file.write_text(
+            '@prefix rule: <https://ekgf.org/ontology/dataops-rule/> .\n'
+            + ''.join(
+                f'<urn:{name}> a rule:ValidationRule ; rule:sortKey "{key}" ; '
+                f'rule:inSet <urn:set-{rule_set}> '
+                + (f'; rule:dependsOn <urn:{depends_on}> ' if depends_on else '')
+                + '.\n'
+                for name, (key, rule_set, depends_on) in rules.items()
+            )
+        )
+        args = argparse.Namespace(
+            verbose=False,
+            data_source_code='test',
+            rules_file=str(rules_file),
+            rule_type=str(RULE.ValidationRule),
+        )
+        dag = ekg_lib.dataops_rules_execute.DataopsRulesExecute(args).build_dag()
+        rule = {name: URIRef(f'urn:{name}') for name in rules}
+        assert dag.depends_on[rule['load-1']] == {rule['generic-2']}
+        # both last rules of the load set
+        assert dag.depends_on[rule['obfuscate-1']] == {
+            rule['generic-1'],
+            rule['load-2'],
+            rule['load-3'],
+        }
+        finished = []
+        lock = threading.Lock()
+
+        def execute_rule(rule_iri, index):
+            time.sleep(0.01)
+            with lock:
+                finished.append(rule_iri)
+            return 0
+
+        assert dag.execute(execute_rule, max_workers=4) == 0
+        position = {rule_iri: index for index, rule_iri in enumerate(finished)}
+        for first, then in (
+            ('generic-2', 'load-1'),
+            ('load-2', 'obfuscate-1'),
+            ('load-3', 'obfuscate-1'),
+        ):
+            assert position[rule[first]] < position[rule[then]]
+
+
+class _RowsResponse:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+
+    def iter_rows(self, as_terms=False):
+        return iter(self.rows)
+
+    def read(self):
+        return b''
+
+
+def _checksum(triple):
+    digits = ''.join(
+        c for c in hashlib.md5(' '.join(triple).encode()).hexdigest() if c.isdigit()
+    )
+    return int(f'0{digits[:9]}')
+
+
+class _RecordingEndpoint:
+    """Fake endpoint that records the updates and answers the graph fingerprint queries"""
+
+    def __init__(self):
+        self.statements = []
+        self.failing_inserts = False
+        self.fingerprint_queries = 0
+        self.graphs = {
+            'urn:test': {(URIRef('urn:s'), URIRef('urn:p'), Literal('o'))},
+            'urn:test-source-raw': {(URIRef('urn:r'), URIRef('urn:p'), Literal('1'))},
+        }
+
+    def execute_sparql_select_query(self, statement, mime_type=None):
+        if 'GROUP BY ?graph' not in statement:
+            return _RowsResponse()
+        self.fingerprint_queries += 1
+        return _RowsResponse(
+            (
+                URIRef(graph),
+                Literal(len(triples)),
+                Literal(sum(_checksum(triple) for triple in triples)),
+            )
+            for graph, triples in self.graphs.items()
+        )
+
+    def execute_construct(self, statement):
+        return None
+
+    def execute_sparql_statement(self, statement):
+        if not statement.startswith('INSERT DATA'):
+            self.statements.append(statement)
+            return None
+        if self.failing_inserts:
+            return None
+        self.statements.append(statement)
+        return _RowsResponse()
+
+    def log_pool_stats(self):
+        pass
+
+
+class TestProvenance:
+    def test_provenance_is_written_in_batches(self, kgiri_base, test_data_dir):
+        set_kgiri_base(kgiri_base)
+        endpoint = _RecordingEndpoint()
+        args = argparse.Namespace(
+            verbose=False,
+            data_source_code='test',
+            rules_file=f'{test_data_dir}/dataops/generic/00001-check-dataset-not-empty.ttl',
+            rule_type=str(RULE.ValidationRule),
+            provenance_flush_size=3,
+        )
+        executor = ekg_lib.dataops_rules_execute.DataopsRulesExecute(
+            args, sparql_endpoint=endpoint
+        )
+        assert executor.execute() == 0
+        inserts = [s for s in endpoint.statements if s.startswith('INSERT DATA')]
+        # the provenance of 4 rules, flushed in batches of 3 and 1
+        assert len(inserts) == 2
+        assert executor.provenance_updates == 2
+        assert sum(s.count('/executedRule>') for s in inserts) == 2
+
+    def _executor(self, test_data_dir, endpoint):
+        args = argparse.Namespace(
+            verbose=False,
+            data_source_code='test',
+            rules_file=f'{test_data_dir}/dataops/generic/00001-check-dataset-not-empty.ttl',
+            rule_type=str(RULE.ValidationRule),
+        )
+        return ekg_lib.dataops_rules_execute.DataopsRulesExecute(
+            args, sparql_endpoint=endpoint
+        )
+
+    def test_failed_provenance_update_is_an_error(self, kgiri_base, test_data_dir):
+        set_kgiri_base(kgiri_base)
+        endpoint = _RecordingEndpoint()
+        endpoint.failing_inserts = True
+        executor = self._executor(test_data_dir, endpoint)
+        with pytest.raises(ValueError, match='provenance of 4 executed rules'):
+            executor.execute()
+        assert executor.provenance_updates == 0
+
+    def test_provenance_flush_does_not_hide_error(
+        self, kgiri_base, test_data_dir, monkeypatch
+    ):
+        set_kgiri_base(kgiri_base)
+        endpoint = _RecordingEndpoint()
+        endpoint.failing_inserts = True
+        executor = self._executor(test_data_dir, endpoint)
+
+        def execute_rule(rule_iri, index, max_, key):
+            executor.record_provenance(rule_iri)
+            raise RuntimeError('rule failed')
+
+        monkeypatch.setattr(executor, 'execute_rule', execute_rule)
+        with pytest.raises(RuntimeError, match='rule failed'):
+            executor.execute()
+
+
+class TestRuleCache:
+    def _executor(self, test_data_dir, endpoint, cache_file, force=False):
+        args = argparse.Namespace(
+            verbose=False,
+            data_source_code='test',
+            rules_file=f'{test_data_dir}/dataops/generic/00001-check-dataset-not-empty.ttl',
+            rule_type=str(RULE.ValidationRule),
+            rule_cache_file=str(cache_file),
+            force=force,
+        )
+        return ekg_lib.dataops_rules_execute.DataopsRulesExecute(
+            args, sparql_endpoint=endpoint
+        )
+
+    def _run(self, test_data_dir, endpoint, cache_file, force=False):
+        executor = self._executor(test_data_dir, endpoint, cache_file, force)
+        assert executor.execute() == 0
+        return executor.rule_cache
+
+    def test_unchanged_rules_are_skipped(self, kgiri_base, test_data_dir, tmp_path):
+        set_kgiri_base(kgiri_base)
+        endpoint = _RecordingEndpoint()
+        cache_file = tmp_path / 'rule-cache.json'
+        first = self._run(test_data_dir, endpoint, cache_file)
+        assert (len(first.executed), len(first.skipped)) == (4, 0)
+        endpoint.fingerprint_queries = 0
+        second = self._run(test_data_dir, endpoint, cache_file)
+        assert (len(second.executed), len(second.skipped)) == (0, 4)
+        # nothing was executed, so the fingerprint of the start of the run is saved
+        assert endpoint.fingerprint_queries == 1
+        endpoint.fingerprint_queries = 0
+        forced = self._run(test_data_dir, endpoint, cache_file, force=True)
+        assert (len(forced.executed), len(forced.skipped)) == (4, 0)
+        assert endpoint.fingerprint_queries == 1
+
+    def test_changed_graph_executes_all_rules(
+        self, kgiri_base, test_data_dir, tmp_path
+    ):
+        set_kgiri_base(kgiri_base)
+        endpoint = _RecordingEndpoint()
+        cache_file = tmp_path / 'rule-cache.json'
+        self._run(test_data_dir, endpoint, cache_file)
+        endpoint.graphs['urn:test'].add((
+            URIRef('urn:s'),
+            URIRef('urn:p'),
+            URIRef('urn:o'),
+        ))
+        again = self._run(test_data_dir, endpoint, cache_file)
+        assert (len(again.executed), len(again.skipped)) == (4, 0)
+
+    def test_changed_raw_graph_executes_all_rules(
+        self, kgiri_base, test_data_dir, tmp_path
+    ):
+        set_kgiri_base(kgiri_base)
+        endpoint = _RecordingEndpoint()
+        cache_file = tmp_path / 'rule-cache.json'
+        self._run(test_data_dir, endpoint, cache_file)
+        # same number of triples, different content
+        endpoint.graphs['urn:test-source-raw'] = {
+            (URIRef('urn:r'), URIRef('urn:p'), Literal('2'))
+        }
+        again = self._run(test_data_dir, endpoint, cache_file)
+        assert (len(again.executed), len(again.skipped)) == (4, 0)
+
+    def test_failed_run_does_not_update_the_fingerprint(
+        self, kgiri_base, test_data_dir, tmp_path
+    ):
+        set_kgiri_base(kgiri_base)
+        endpoint = _RecordingEndpoint()
+        cache_file = tmp_path / 'rule-cache.json'
+        self._run(test_data_dir, endpoint, cache_file)
+        endpoint.graphs['urn:test'].add((
+            URIRef('urn:s'),
+            URIRef('urn:p'),
+            URIRef('urn:o'),
+        ))
+        endpoint.failing_inserts = True
+        with pytest.raises(ValueError):
+            self._executor(test_data_dir, endpoint, cache_file).execute()
+        endpoint.failing_inserts = False
+        again = self._run(test_data_dir, endpoint, cache_file)
+        assert (len(again.executed), len(again.skipped)) == (4, 0)
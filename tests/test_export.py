@@ -1,8 +1,29 @@
+import argparse
+import gzip
+import os
 import sys
+import threading
+import time
+from types import SimpleNamespace
 
 import pytest
+import requests
+from botocore.exceptions import ClientError
+from rdflib import RDF, RDFS, Graph, Literal, URIRef
 
 import ekg_lib
+from ekg_lib.dataset import (
+    COMPRESSION_ZSTD,
+    DEFAULT_TURTLE_MAX_TRIPLES,
+    datasets_produced_by_pipeline,
+    export_dataset,
+    export_format,
+)
+from ekg_lib.dataset.various import export_graph
+from ekg_lib.kgiri import set_kgiri_base
+from ekg_lib.mime import MIME_NTRIPLES, MIME_TURTLE
+from ekg_lib.s3 import MIN_PART_SIZE, S3UploadStream
+from ekg_lib.step_export import export as step_export
 
 
 class TestExport:
@@ -39,3 +60,249 @@ class TestExport:
             '--verbose',
         ]
         assert 0 == ekg_lib.step_export.main()
+
+
+class _Uploader:
+    """Collects the parts of a multipart upload in memory"""
+
+    def __init__(self):
+        self.parts = []
+        self.completed = False
+        self.failed = False
+
+    def part(self, chunk):
+        self.parts.append(chunk)
+
+    def complete(self):
+        self.completed = True
+        return True
+
+    def fail(self):
+        self.failed = True
+
+
+class _ObjectStore:
+    def __init__(self):
+        self.uploader = _Uploader()
+
+    def uploader_for(self, key, mime, content_encoding=None, dataset_code=None):
+        self.key = key
+        self.mime = mime
+        self.content_encoding = content_encoding
+        return self.uploader
+
+
+class _SPARQLEndpoint:
+    """Serves the given content for any graph and the given rows for any SELECT query"""
+
+    def __init__(self, content=b'', rows=(), failing_chunk=None):
+        self.content = content
+        self.rows = rows
+        # the chunk of the content at which the download breaks off, None for never
+        self.failing_chunk = failing_chunk
+        self.closed = False
+
+    def endpoint_url(self):
+        return 'http://localhost/sparql'
+
+    def request(self, method, url, params, headers, stream):
+        self.headers = headers
+
+        def iter_content(chunk_size):
+            for number, start in enumerate(range(0, len(self.content), chunk_size)):
+                if number == self.failing_chunk:
+                    raise requests.exceptions.ChunkedEncodingError('Connection broken')
+                yield self.content[start : start + chunk_size]
+
+        def close():
+            self.closed = True
+
+        return SimpleNamespace(iter_content=iter_content, close=close)
+
+    def handle_error(self, r):
+        return True
+
+    def execute_sparql_select_query(self, statement):
+        self.statement = statement
+        return SimpleNamespace(iter_rows=lambda: iter(self.rows))
+
+
+class TestExportGraph:
+    def test_upload_stream_parts(self):
+        uploader = _Uploader()
+        stream = S3UploadStream(uploader)
+        data = os.urandom(2 * MIN_PART_SIZE + 1000)
+        for start in range(0, len(data), 100000):
+            stream.write(data[start : start + 100000])
+        stream.close()
+        assert [MIN_PART_SIZE, MIN_PART_SIZE, 1000] == [len(p) for p in uploader.parts]
+        assert data == b''.join(uploader.parts)
+
+    @pytest.mark.parametrize(
+        'file_name, rdf_format, mime',
+        [('test.ttl.gz', 'turtle', MIME_TURTLE), ('test.nt.gz', 'nt', MIME_NTRIPLES)],
+    )
+    def test_export_graph(self, file_name, rdf_format, mime):
+        g = Graph()
+        for number in range(1000):
+            subject = URIRef(f'https://kg.example/id/thing-{number}')
+            g.add((subject, RDF.type, URIRef('https://kg.example/Thing')))
+            g.add((subject, RDFS.label, Literal(f'Thing "{number}"\n', lang='en')))
+        s3_endpoint = _ObjectStore()
+        assert export_graph(g, file_name, s3_endpoint, 'test')  # type: ignore[arg-type]
+        assert mime == s3_endpoint.mime
+        # no timestamp in the gzip header, so the same graph gives the same parts
+        assert bytes(4) == s3_endpoint.uploader.parts[0][4:8]
+        content = gzip.decompress(b''.join(s3_endpoint.uploader.parts))
+        assert set(g) == set(Graph().parse(data=content, format=rdf_format))
+
+    def test_export_graph_uncompressed(self):
+        g = Graph()
+        g.add((
+            URIRef('https://kg.example/id/a'),
+            RDF.type,
+            URIRef('https://kg.example/A'),
+        ))
+        s3_endpoint = _ObjectStore()
+        assert export_graph(g, 'test.nt', s3_endpoint, 'test')  # type: ignore[arg-type]
+        assert MIME_NTRIPLES == s3_endpoint.mime
+        assert s3_endpoint.content_encoding is None
+        content = b''.join(s3_endpoint.uploader.parts)
+        assert set(g) == set(Graph().parse(data=content, format='nt'))
+
+
+class TestExportDataset:
+    def test_export_format(self):
+        assert (MIME_TURTLE, 9) == export_format(10)
+        assert (MIME_TURTLE, 9) == export_format(DEFAULT_TURTLE_MAX_TRIPLES)
+        assert (MIME_NTRIPLES, 4) == export_format(DEFAULT_TURTLE_MAX_TRIPLES + 1)
+        assert (MIME_NTRIPLES, 4) == export_format(None)
+        assert (MIME_NTRIPLES, 3) == export_format(10, 5, COMPRESSION_ZSTD)
+
+    @pytest.mark.parametrize(
+        'triple_count, file_name, mime',
+        [
+            (2, 'ekg-dataset-test.ttl.gz', MIME_TURTLE),
+            (None, 'ekg-dataset-test.nt.gz', MIME_NTRIPLES),
+        ],
+    )
+    def test_export_dataset(self, triple_count, file_name, mime):
+        content = os.urandom(3 * 1024 * 1024)
+        sparql_endpoint = _SPARQLEndpoint(content)
+        s3_endpoint = _ObjectStore()
+        assert export_dataset(
+            sparql_endpoint=sparql_endpoint,  # type: ignore[arg-type]
+            s3_endpoint=s3_endpoint,  # type: ignore[arg-type]
+            data_source_code='test',
+            graph_iri=URIRef('https://kg.example/graph/test'),
+            triple_count=triple_count,
+        )
+        assert mime == sparql_endpoint.headers['Accept']
+        assert 'identity' == sparql_endpoint.headers['Accept-Encoding']
+        assert file_name == s3_endpoint.key
+        assert mime == s3_endpoint.mime
+        assert 'gzip' == s3_endpoint.content_encoding
+        assert content == gzip.decompress(b''.join(s3_endpoint.uploader.parts))
+        assert sparql_endpoint.closed
+
+    def test_export_dataset_failed_download(self):
+        sparql_endpoint = _SPARQLEndpoint(os.urandom(3 * 1024 * 1024), failing_chunk=2)
+        s3_endpoint = _ObjectStore()
+        with pytest.raises(requests.exceptions.ChunkedEncodingError):
+            export_dataset(
+                sparql_endpoint=sparql_endpoint,  # type: ignore[arg-type]
+                s3_endpoint=s3_endpoint,  # type: ignore[arg-type]
+                data_source_code='test',
+                graph_iri=URIRef('https://kg.example/graph/test'),
+            )
+        assert s3_endpoint.uploader.failed
+        assert not s3_endpoint.uploader.completed
+        assert sparql_endpoint.closed
+
+    def test_export_dataset_zstd(self):
+        zstd = pytest.importorskip('compression.zstd')
+        content = b'<https://kg.example/id/a> <https://kg.example/b> "c" .\n' * 1000
+        s3_endpoint = _ObjectStore()
+        assert export_dataset(
+            sparql_endpoint=_SPARQLEndpoint(content),  # type: ignore[arg-type]
+            s3_endpoint=s3_endpoint,  # type: ignore[arg-type]
+            data_source_code='test',
+            graph_iri=URIRef('https://kg.example/graph/test'),
+            triple_count=1000000,
+            compression=COMPRESSION_ZSTD,
+        )
+        assert 'ekg-dataset-test.nt.zst' == s3_endpoint.key
+        assert 'zstd' == s3_endpoint.content_encoding
+        assert content == zstd.decompress(b''.join(s3_endpoint.uploader.parts))
+
+    def test_datasets_produced_by_pipeline(self, kgiri_base):
+        set_kgiri_base(kgiri_base)
+        sparql_endpoint = _SPARQLEndpoint(
+            rows=[
+                ('https://kg.example/graph/a', 'a', '12'),
+                ('https://kg.example/graph/b', 'b', '0'),
+            ]
+        )
+        assert [
+            (URIRef('https://kg.example/graph/a'), Literal('a'), 12),
+            (URIRef('https://kg.example/graph/b'), Literal('b'), 0),
+        ] == list(datasets_produced_by_pipeline(sparql_endpoint, 'test'))  # type: ignore[arg-type]
+        assert 'GROUP BY ?graphIRI ?datasetCode' in sparql_endpoint.statement
+        assert 'BIND("test" as ?dataSourceCode)' in sparql_endpoint.statement
+
+
+class TestExporter:
+    @pytest.mark.parametrize('max_workers', [1, 2])
+    def test_export_datasets(self, monkeypatch, max_workers):
+        sizes = {
+            'small': 10,
+            'large': 1000,
+            'medium': 100,
+            'broken': 500,
+            'unwritable': 1,
+        }
+        calls = []
+        lock = threading.Lock()
+
+        def export_dataset(
+            sparql_endpoint, s3_endpoint, graph_iri, data_source_code, **kwargs
+        ):
+            with lock:
+                calls.append(data_source_code)
+                attempt = calls.count(data_source_code)
+            time.sleep(0.01)
+            assert sizes[data_source_code] == kwargs['triple_count']
+            if data_source_code == 'broken':
+                return False
+            if data_source_code == 'unwritable':
+                raise OSError('No space left on device')
+            if data_source_code == 'medium' and attempt == 1:
+                raise ClientError({'Error': {'Code': '500'}}, 'UploadPart')
+            return True
+
+        monkeypatch.setattr(step_export, 'SPARQLEndpoint', lambda args: None)
+        monkeypatch.setattr(step_export, 'S3ObjectStore', lambda args: None)
+        monkeypatch.setattr(
+            step_export,
+            'datasets_produced_by_pipeline',
+            lambda sparql, code: iter(
+                (f'graph-{code}', code, size) for code, size in sizes.items()
+            ),
+        )
+        monkeypatch.setattr(step_export, 'export_dataset', export_dataset)
+        args = argparse.Namespace(
+            verbose=False,
+            data_source_code='test',
+            max_workers=max_workers,
+            retries=1,
+            retry_delay=0,
+        )
+        assert 1 == step_export.Exporter(args).export()
+        assert 2 == calls.count('broken')
+        assert 2 == calls.count('medium')
+        assert 1 == calls.count('large')
+        assert 1 == calls.count('small')
+        # an unexpected error is not retried but doesn't stop the other exports either
+        assert 1 == calls.count('unwritable')
+        if max_workers > 1:
+            assert ['large', 'broken'] == sorted(calls[:2], key=sizes.get, reverse=True)
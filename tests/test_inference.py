@@ -0,0 +1,54 @@
+from rdflib import OWL, RDF, RDFS, Graph, Literal, Namespace
+
+from ekg_lib.main.inference import (
+    DEFAULT_RULES,
+    RULE_DOMAIN,
+    RULE_THING,
+    RuleInference,
+    owlrl_closure,
+)
+
+EX = Namespace('https://example.com/')
+
+
+def _graph():
+    g = Graph()
+    g.add((EX.Capability, RDFS.subClassOf, EX.Thing))
+    g.add((EX.Thing, RDFS.subClassOf, EX.Concept))
+    g.add((EX.inArea, RDFS.subPropertyOf, EX.partOf))
+    g.add((EX.inArea, RDFS.domain, EX.Capability))
+    g.add((EX.inArea, RDFS.range, EX.Area))
+    g.add((EX.hasCapability, OWL.inverseOf, EX.inArea))
+    g.add((EX.area, EX.hasCapability, EX.capability))
+    g.add((EX.capability, RDFS.label, Literal('Capability')))
+    return g
+
+
+class TestRuleInference:
+    def test_rules(self):
+        g = _graph()
+        added = RuleInference(g).expand(g)
+        assert {
+            (EX.capability, EX.inArea, EX.area),
+            (EX.capability, EX.partOf, EX.area),
+            (EX.capability, RDF.type, EX.Capability),
+            (EX.capability, RDF.type, EX.Thing),
+            (EX.capability, RDF.type, EX.Concept),
+            (EX.area, RDF.type, EX.Area),
+        } <= set(g)
+        assert len(_graph()) + added == len(g)
+        assert 0 == RuleInference(g).expand(g)
+
+    def test_subset_of_owlrl_closure(self):
+        g = _graph()
+        RuleInference(g, (*DEFAULT_RULES, RULE_THING)).expand(g)
+        full = _graph()
+        owlrl_closure(full)
+        assert set(g) <= set(full)
+
+    def test_declared_rules_only(self):
+        g = _graph()
+        RuleInference(g, [RULE_DOMAIN]).expand(g)
+        assert (EX.capability, EX.inArea, EX.area) not in g
+        # the domain of inArea only applies once the inverse is inferred
+        assert (EX.capability, RDF.type, EX.Capability) not in g
@@ -1,7 +1,8 @@
-from rdflib import URIRef
+from rdflib import RDFS, Graph, Literal, URIRef
 
 import ekg_lib
-from ekg_lib.kgiri import EKG_NS, set_kgiri_base
+from ekg_lib.kgiri import EKG_NS, kgiri_replace_iri_in_graph, set_kgiri_base
+from ekg_lib.kgiri import namespace as kgiri_namespace
 
 
 class TestKGIRI:
@@ -37,3 +38,39 @@ class TestParseIdentityKey:
     def test_5(self):
         actual = ekg_lib.parse_identity_key('theFATCA&someOtherDoddFrank')
         assert 'the-fatca-and-some-other-dodd-frank' == actual
+
+
+class TestKgiriReplace:
+    def test_kgiri_replace_iri_in_graph(self, monkeypatch):
+        monkeypatch.setattr(kgiri_namespace, 'kgiri_base', 'https://kg.example/')
+        monkeypatch.setattr(
+            kgiri_namespace, 'kgiri_base_replace', URIRef('https://placeholder.kg/')
+        )
+        monkeypatch.setattr(kgiri_namespace, 'kgiri_replace_enabled', True)
+        g = Graph()
+        g.add((
+            URIRef('https://placeholder.kg/id/a'),
+            RDFS.seeAlso,
+            URIRef('https://placeholder.kg/id/b'),
+        ))
+        g.add((
+            URIRef('https://placeholder.kg/id/a'),
+            RDFS.label,
+            Literal('https://placeholder.kg/id/a'),
+        ))
+        g.add((URIRef('https://other.example/c'), RDFS.label, Literal('c')))
+        assert 3 == kgiri_replace_iri_in_graph(g)
+        assert set(g) == {
+            (
+                URIRef('https://kg.example/id/a'),
+                RDFS.seeAlso,
+                URIRef('https://kg.example/id/b'),
+            ),
+            (
+                URIRef('https://kg.example/id/a'),
+                RDFS.label,
+                Literal('https://placeholder.kg/id/a'),
+            ),
+            (URIRef('https://other.example/c'), RDFS.label, Literal('c')),
+        }
+        assert 0 == kgiri_replace_iri_in_graph(g)
@@ -1,4 +1,11 @@
-from ekg_lib.kgiri.various import parse_identity_key
+from rdflib import URIRef
+
+from ekg_lib.kgiri.various import (
+    DEFAULT_IDENTITY_KEY_CACHE_SIZE,
+    identity_key_cache_info,
+    parse_identity_key,
+    set_identity_key_cache_size,
+)
 
 
 class TestKgiriVarious:
@@ -10,3 +17,22 @@ class TestKgiriVarious:
 
     def test_parse_identity_key_all_uppercase_becomes_lowercase(self):
         assert 'foobar' == parse_identity_key('FOOBAR')
+
+    def test_parse_identity_key_normalized_key_no_change(self):
+        assert 'foo-bar-42' == parse_identity_key('foo-bar-42')
+
+    def test_parse_identity_key_cache(self):
+        set_identity_key_cache_size(2)
+        try:
+            assert 'fred-and-wilma' == parse_identity_key('Fred & Wilma')
+            assert 'fred-and-wilma' == parse_identity_key('Fred & Wilma')
+            assert 'fred-and-wilma' == parse_identity_key(URIRef('Fred & Wilma'))
+            assert 'foobar' == parse_identity_key('FOOBAR')
+            assert 'foo-bar' == parse_identity_key('fooBar')
+            info = identity_key_cache_info()
+            assert (2, 3, 2, 2) == (info.hits, info.misses, info.maxsize, info.currsize)
+            set_identity_key_cache_size(0)
+            assert 'fred-and-wilma' == parse_identity_key('Fred & Wilma')
+            assert 0 == identity_key_cache_info().hits
+        finally:
+            set_identity_key_cache_size(DEFAULT_IDENTITY_KEY_CACHE_SIZE)
@@ -1,14 +1,178 @@
 import argparse
 import unittest
+from datetime import datetime
+from io import BytesIO
 from tempfile import TemporaryDirectory
 from unittest import mock
 
+import ldap3
 import pytest
+from rdflib import Graph
 
+from ekg_lib.kgiri import set_kgiri_base
+from ekg_lib.ntriples import NTriplesWriter
+from ekg_lib.ldap_parser.parser import LdapEntry, LdapParser
 from ekg_lib.ldap_parser_to_file import main as ldap_parser_to_file
 from ekg_lib.log import log_item
 
 
+def test_ldap_entry_ntriples(kgiri_base):
+    """The N-Triples of an entry are the same as the rdflib serializer would produce"""
+    set_kgiri_base(kgiri_base)
+    entry = {
+        'dn': 'uid=gauss,dc=example,dc=com',
+        'attributes': {
+            'objectClass': ['inetOrgPerson', 'organizationalPerson', 'top'],
+            'cn': ['Carl Friedrich Gauss'],
+            'creatorsName': ['cn=admin,dc=example,dc=com'],
+            'modifiersName': ['cn=admin,dc=example,dc=com'],
+            'entryUUID': ['e0c3a4b2-1a7e-4c8f-9a3c-5f1d2b3c4d5e'],
+            'description': ['say "hi"\nback\\slash\r', 'Zürich ✓', 'say "hi"'],
+            'uidNumber': 1777,
+            'modifyTimestamp': [datetime(2021, 3, 4, 5, 6, 7)],
+            'jpegPhoto': [''.join(map(chr, range(256)))],
+        },
+    }
+    stream = BytesIO()
+    writer = NTriplesWriter(stream, buffer_size=16)
+    ldap_entry = LdapEntry(argparse.Namespace(verbose=False), entry, writer)
+    LdapEntry(argparse.Namespace(verbose=False), entry, writer)
+    writer.flush()
+    graph = Graph()
+    for triple in ldap_entry.triples:
+        graph.add(triple)
+    expected = graph.serialize(format='nt', encoding='utf-8').splitlines()
+    actual = stream.getvalue().splitlines()
+    assert writer.triples_written == 2 * len(graph)
+    assert actual[: len(graph)] == actual[len(graph) :]
+    assert sorted(actual[: len(graph)]) == sorted(expected)
+    assert any(
+        line.endswith(b'"^^<http://www.w3.org/2001/XMLSchema#base64Binary> .')
+        for line in actual
+    )
+
+
+class _MockLdapParser(LdapParser):
+    mock_server: ldap3.Server
+
+    def _create_connection(self, server):
+        return ldap3.Connection(self.mock_server, client_strategy=ldap3.MOCK_SYNC)
+
+
+def _mock_ldap_server():
+    server = ldap3.Server('mock')
+    setup = ldap3.Connection(server, client_strategy=ldap3.MOCK_SYNC)
+    setup.strategy.add_entry(
+        'dc=example,dc=com', {'objectClass': ['domain'], 'dc': 'example'}
+    )
+    for ou in ('people', 'groups'):
+        setup.strategy.add_entry(
+            f'ou={ou},dc=example,dc=com',
+            {'objectClass': ['organizationalUnit'], 'ou': ou},
+        )
+        for i in range(20):
+            setup.strategy.add_entry(
+                f'cn={ou}{i},ou={ou},dc=example,dc=com',
+                {'objectClass': ['person'], 'cn': f'{ou}{i}', 'sn': 'x'},
+            )
+    return server
+
+
+def _harvest_mock_ldap_server(server, **kwargs):
+    stream = BytesIO()
+    args = argparse.Namespace(
+        verbose=False,
+        ldap_log=False,
+        ldap_naming_context='dc=example,dc=com',
+        ldap_search_filter='(objectClass=*)',
+        ldap_host='mock',
+        ldap_port=389,
+        ldap_bind_dn=None,
+        ldap_bind_auth=None,
+        ldap_timeout=10,
+        ldap_page_size=7,
+        data_source_code='ldap',
+        **kwargs,
+    )
+    parser = _MockLdapParser(args, stream=stream)
+    parser.mock_server = server
+    assert 0 == parser.process()
+    return parser.returned_entries, sorted(stream.getvalue().splitlines())
+
+
+def test_ldap_parallel_harvest(kgiri_base):
+    """Harvesting sub-trees concurrently produces the same triples as one paged search"""
+    set_kgiri_base(kgiri_base)
+    server = _mock_ldap_server()
+    entries, lines = _harvest_mock_ldap_server(server)
+    assert entries == 43
+    assert (entries, lines) == _harvest_mock_ldap_server(
+        server,
+        ldap_max_connections=3,
+        ldap_split_subtrees=True,
+        ldap_convert_workers=2,
+    )
+
+
+def test_ldap_incremental_harvest(kgiri_base, tmp_path):
+    """With a checkpoint only changed entries are harvested, plus tombstones for deletions"""
+    set_kgiri_base(kgiri_base)
+    server = ldap3.Server('mock')
+    setup = ldap3.Connection(server, client_strategy=ldap3.MOCK_SYNC)
+
+    def add_person(name, timestamp):
+        setup.strategy.add_entry(
+            f'cn={name},dc=example,dc=com',
+            {
+                'objectClass': ['person'],
+                'cn': name,
+                'sn': 'x',
+                'entryUUID': f'uuid-{name}',
+                'modifyTimestamp': timestamp,
+            },
+        )
+
+    setup.strategy.add_entry(
+        'dc=example,dc=com',
+        {
+            'objectClass': ['domain'],
+            'dc': 'example',
+            'entryUUID': 'uuid-example',
+            'modifyTimestamp': '20200101000000Z',
+        },
+    )
+    add_person('gauss', '20200101000000Z')
+    add_person('euler', '20210101000000Z')
+    add_person('riemann', '20200101000000Z')
+    checkpoint = tmp_path / 'ldap-checkpoint.json'
+
+    entries, lines = _harvest_mock_ldap_server(server, ldap_checkpoint=checkpoint)
+    assert entries == 4
+    assert checkpoint.exists()
+
+    setup.strategy.remove_entry('cn=euler,dc=example,dc=com')
+    setup.strategy.remove_entry('cn=riemann,dc=example,dc=com')
+    add_person('riemann', '20220202000000Z')
+    add_person('noether', '20220202000000Z')
+    entries, lines = _harvest_mock_ldap_server(server, ldap_checkpoint=checkpoint)
+    assert entries == 2
+    deleted = [line for line in lines if b'"Deleted"' in line]
+    assert len(deleted) == 1
+    assert b'euler' in deleted[0]
+    assert any(b'noether' in line for line in lines)
+    assert not any(b'gauss' in line for line in lines)
+
+    # entries changed in the same second as the high-water mark are harvested again
+    entries, lines = _harvest_mock_ldap_server(server, ldap_checkpoint=checkpoint)
+    assert entries == 2
+    assert not any(b'"Deleted"' in line for line in lines)
+
+    entries, lines = _harvest_mock_ldap_server(
+        server, ldap_checkpoint=checkpoint, ldap_full_harvest=True
+    )
+    assert entries == 4
+
+
 @pytest.mark.ldap
 def test_export_from_ldapclient_dot_com(test_data_dir, kgiri_base, tmpdir):
     """Generic test that should always work since ldapclient.com is always up and running"""
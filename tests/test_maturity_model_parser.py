@@ -1,8 +1,11 @@
+import os
+import shutil
 import sys
 from os import getcwd
 from os.path import relpath
 
 import option
+import pytest
 from pathlib import Path
 from rdflib import URIRef, Graph, RDFS
 from rdflib.term import Literal
@@ -10,9 +13,19 @@ from rdflib.term import Literal
 import ekg_lib
 from ekg_lib import log_item, log
 from ekg_lib.namespace import BASE_IRI_MATURITY_MODEL
-from ekg_lib.maturity_model_parser import MaturityModelLoader, Config
+from ekg_lib.maturity_model_parser import (
+    MaturityModelLoader,
+    Config,
+    run_with_config,
+)
+from ekg_lib.maturity_model_parser.config import REASONER_OWLRL, REASONER_RULES
 from ekg_lib.maturity_model_parser.File import makedirs
 from ekg_lib.maturity_model_parser.graph import get_text_in_language
+from ekg_lib.maturity_model_parser.manifest import (
+    BuildManifest,
+    input_files,
+    settings_for,
+)
 from ekg_lib.maturity_model_parser.pages_yaml import PagesYaml
 
 
@@ -172,3 +185,209 @@ class TestMaturityModelParser:
             'pillar-dev',
         ]
         assert 0 == ekg_lib.maturity_model_parser.main()
+
+    def test_maturity_model_parser_cache(self, test_data_dir, tmp_path, monkeypatch):
+        model_root = tmp_path / 'maturity-model'
+        shutil.copytree(Path(test_data_dir) / 'maturity-model', model_root)
+        config = Config(
+            model_name='EKG Maturity',
+            verbose=False,
+            mkdocs=False,
+            model_root=model_root,
+            docs_root=model_root / 'docs',
+            fragments_root=model_root,
+            output_root=tmp_path / 'output',
+            pillar_dir_name=option.NONE,
+            cache_dir=tmp_path / 'cache',
+        )
+        inferred = MaturityModelLoader(config=config).load()
+        assert 1 == len(list(config.cache_dir.glob('inferred-*.pickle')))
+
+        def rdfs_infer(self):
+            raise AssertionError('inferred again')
+
+        with monkeypatch.context() as patch:
+            patch.setattr(MaturityModelLoader, 'rdfs_infer', rdfs_infer)
+            cached = MaturityModelLoader(config=config).load()
+        assert set(inferred.g) == set(cached.g)
+        assert BASE_IRI_MATURITY_MODEL == cached.g.base
+        assert 4 == len(cached.model_with_name('EKG Maturity').pillars())
+
+        vision_ttl = model_root / 'bp_strategy_actuation' / 'capability002.ttl'
+        vision_ttl.write_text(
+            vision_ttl.read_text().replace('"Business Vision"', '"Business Vision 2"')
+        )
+        with monkeypatch.context() as patch:
+            patch.setattr(MaturityModelLoader, 'rdfs_infer', rdfs_infer)
+            with pytest.raises(AssertionError, match='inferred again'):
+                MaturityModelLoader(config=config).load()
+        MaturityModelLoader(config=config).load()
+        # only the most recent cache file is kept
+        assert 1 == len(list(config.cache_dir.glob('inferred-*.pickle')))
+
+    def test_maturity_model_graph_index(self, test_data_dir, tmp_path):
+        config = Config(
+            model_name='EKG Maturity',
+            verbose=False,
+            mkdocs=False,
+            model_root=Path(test_data_dir) / 'maturity-model',
+            docs_root=Path(test_data_dir) / 'maturity-model' / 'docs',
+            fragments_root=Path(test_data_dir) / 'maturity-model',
+            output_root=tmp_path / 'output',
+            pillar_dir_name=option.NONE,
+        )
+        graph = MaturityModelLoader(config=config).load()
+        g = graph.g
+        for predicate in graph.index.structure_predicates:
+            for objekt in set(g.objects(None, predicate)):
+                assert list(g.subjects(predicate, objekt)) == graph.subjects(
+                    predicate, objekt
+                )
+        for predicate in graph.index.value_predicates:
+            for subject in set(g.subjects(predicate, None)):
+                assert list(g.objects(subject, predicate)) == graph.objects(
+                    subject, predicate
+                )
+        # the index only reflects the graph as it was when it was created
+        capability = next(g.subjects(RDFS.label, Literal('Business Vision')))
+        g.add((capability, RDFS.label, Literal('Vision')))
+        assert Literal('Vision') not in graph.objects(capability, RDFS.label)
+        graph.create_index()
+        assert Literal('Vision') in graph.objects(capability, RDFS.label)
+
+    def test_maturity_model_parser_reasoners(self, test_data_dir, tmp_path):
+        model_root = tmp_path / 'maturity-model'
+        shutil.copytree(Path(test_data_dir) / 'maturity-model', model_root)
+        output_root = tmp_path / 'output'
+
+        def build(reasoner):
+            config = Config(
+                model_name='EKG Maturity',
+                verbose=False,
+                mkdocs=False,
+                model_root=model_root,
+                docs_root=model_root / 'docs',
+                fragments_root=model_root,
+                output_root=output_root,
+                pillar_dir_name=option.NONE,
+                reasoner=reasoner,
+            )
+            assert 0 == run_with_config(config)
+            return {
+                path: path.read_bytes()
+                for root in (output_root, model_root / 'docs')
+                for path in sorted(root.rglob('*'))
+                if path.is_file()
+            }
+
+        full_closure = build(REASONER_OWLRL)
+        assert full_closure == build(REASONER_RULES)
+
+    def test_maturity_model_parser_max_workers(self, test_data_dir, tmp_path):
+        model_root = tmp_path / 'maturity-model'
+        shutil.copytree(Path(test_data_dir) / 'maturity-model', model_root)
+        output_root = tmp_path / 'output'
+
+        def build(max_workers):
+            shutil.rmtree(output_root, ignore_errors=True)
+            config = Config(
+                model_name='EKG Maturity',
+                verbose=False,
+                mkdocs=False,
+                model_root=model_root,
+                docs_root=model_root / 'docs',
+                fragments_root=model_root,
+                output_root=output_root,
+                pillar_dir_name=option.NONE,
+                manifest_path=output_root / '.build-manifest.json',
+                force=True,
+                max_workers=max_workers,
+            )
+            assert 0 == run_with_config(config)
+            return {
+                path: path.read_bytes()
+                for root in (output_root, model_root / 'docs')
+                for path in sorted(root.rglob('*'))
+                if path.is_file()
+            }
+
+        sequential = build(1)
+        assert sequential == build(8)
+        with pytest.raises(ValueError, match='not a valid number of workers'):
+            build(0)
+
+    def test_maturity_model_parser_incremental(self, test_data_dir, tmp_path):
+        model_root = tmp_path / 'maturity-model'
+        shutil.copytree(Path(test_data_dir) / 'maturity-model', model_root)
+        output_root = tmp_path / 'output'
+        manifest_path = output_root / '.build-manifest.json'
+
+        def build(force=False):
+            config = Config(
+                model_name='EKG Maturity',
+                verbose=False,
+                mkdocs=False,
+                model_root=model_root,
+                docs_root=model_root / 'docs',
+                fragments_root=model_root,
+                output_root=output_root,
+                pillar_dir_name=option.NONE,
+                manifest_path=manifest_path,
+                force=force,
+            )
+            assert 0 == run_with_config(config)
+            return config
+
+        def generated_files():
+            for root in (output_root, model_root / 'docs'):
+                for path in root.rglob('*'):
+                    if path.is_file() and path != manifest_path:
+                        yield path
+
+        def rebuild():
+            """Rebuild, returning the files that were written and all their content"""
+            for path in generated_files():
+                os.utime(path, ns=(0, 0))
+            build()
+            return (
+                {path for path in generated_files() if path.stat().st_mtime_ns != 0},
+                {path: path.read_bytes() for path in generated_files()},
+            )
+
+        # a missing fragment is copied from the template into the fragments root
+        goals_value_md = next(model_root.glob('pillar/**/goals/value.md'))
+        goals_value_md.unlink()
+        config = build()
+        assert goals_value_md.exists()
+        # so the copied template is one of the inputs of the next build
+        assert BuildManifest.load(
+            manifest_path, settings_for(config), input_files(config)
+        ).is_up_to_date()
+        content = {path: path.read_bytes() for path in generated_files()}
+        assert manifest_path.exists()
+
+        written, rebuilt = rebuild()
+        assert set() == written
+        assert content == rebuilt
+
+        vision_ttl = model_root / 'bp_strategy_actuation' / 'capability002.ttl'
+        vision_ttl.write_text(
+            vision_ttl.read_text().replace('"Business Vision"', '"Business Vision 2"')
+        )
+        written, rebuilt = rebuild()
+        changed = {path for path in rebuilt if rebuilt[path] != content.get(path)}
+        assert written == changed
+        assert any(path.match('vision/index.md') for path in written)
+        assert not any(path.match('goals/*') for path in written)
+        content = rebuilt
+
+        value_md = next(model_root.glob('pillar/**/tactics/value.md'))
+        value_md.write_text(value_md.read_text() + '\nChanged value.\n')
+        written, rebuilt = rebuild()
+        assert 1 == len(written)
+        assert next(iter(written)).match('tactics/value.md')
+        content = rebuilt
+
+        # a full build gives exactly the same result
+        build(force=True)
+        assert content == {path: path.read_bytes() for path in generated_files()}
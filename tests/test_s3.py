@@ -0,0 +1,202 @@
+import argparse
+import hashlib
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from botocore.exceptions import ClientError
+
+from ekg_lib.s3 import S3Uploader, UploadCheckpoint
+
+
+class _Client:
+    """Stands in for the boto3 S3 client, keeps the uploaded parts in memory"""
+
+    def __init__(self, failing_part=None, failures=None, md5_etags=False):
+        self.failing_part = failing_part
+        # the number of times that failing_part fails, None for always
+        self.failures = failures
+        self.md5_etags = md5_etags
+        self.uploaded = {}
+        self.e_tags = {}
+        self.calls = 0
+        self.completed = None
+        self.aborted = 0
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def upload_part(self, Body, Bucket, Key, PartNumber, UploadId):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        # later parts finish first
+        time.sleep(0.05 / PartNumber)
+        with self.lock:
+            self.active -= 1
+            self.calls += 1
+            if PartNumber == self.failing_part and self.failures != 0:
+                if self.failures is not None:
+                    self.failures -= 1
+                raise ClientError({'Error': {'Code': '500'}}, 'UploadPart')
+        self.uploaded[PartNumber] = Body
+        if self.md5_etags:
+            self.e_tags[PartNumber] = f'"{hashlib.md5(Body).hexdigest()}"'
+        else:
+            self.e_tags[PartNumber] = f'"etag-{PartNumber}"'
+        return {'ETag': self.e_tags[PartNumber], 'ResponseMetadata': {}}
+
+    def list_parts(self, Bucket, Key, UploadId, PartNumberMarker=0):
+        # two parts per page to exercise the pagination
+        numbers = [
+            number for number in sorted(self.e_tags) if number > PartNumberMarker
+        ]
+        return {
+            'Parts': [
+                {'PartNumber': number, 'ETag': self.e_tags[number]}
+                for number in numbers[:2]
+            ],
+            'IsTruncated': len(numbers) > 2,
+            'NextPartNumberMarker': numbers[1] if len(numbers) > 2 else None,
+        }
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.completed = MultipartUpload
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted += 1
+
+
+class _Object:
+    initiated = 0
+    content_type = None
+
+    def initiate_multipart_upload(self, **kwargs):
+        _Object.initiated += 1
+        _Object.content_type = kwargs['ContentType']
+        return SimpleNamespace(id=f'upload-id-{_Object.initiated}')
+
+
+class _ObjectStore:
+    def __init__(self, client, upload_concurrency, part_retries=0, checkpoint_dir=None):
+        self.args = argparse.Namespace(verbose=False)
+        self.s3_client = client
+        self.s3_bucket_name = 'test-bucket'
+        self.upload_concurrency = upload_concurrency
+        self.part_retries = part_retries
+        self.part_backoff = 0
+        self.checkpoint_dir = checkpoint_dir
+
+    def object(self, key):
+        return _Object()
+
+
+class TestS3Uploader:
+    @pytest.mark.parametrize(
+        'content_encoding, content_type',
+        [
+            (None, 'application/n-triples'),
+            ('gzip', 'application/gzip'),
+            ('zstd', 'application/zstd'),
+        ],
+    )
+    def test_content_type(self, content_encoding, content_type):
+        S3Uploader(
+            _ObjectStore(_Client(), 1),
+            'test.nt',
+            content_encoding=content_encoding,
+            dataset_code='test',
+        )
+        assert content_type == _Object.content_type
+
+    @pytest.mark.parametrize('concurrency', [1, 3])
+    def test_parts_in_order(self, concurrency):
+        client = _Client()
+        uploader = S3Uploader(_ObjectStore(client, concurrency), 'test.nt.gz')
+        for number in range(1, 11):
+            uploader.part(f'part {number}'.encode())
+        assert uploader.complete()
+        assert client.max_active <= concurrency
+        assert {
+            'Parts': [
+                {'ETag': f'"etag-{number}"', 'PartNumber': number}
+                for number in range(1, 11)
+            ]
+        } == client.completed
+        assert b'part 7' == client.uploaded[7]
+        assert not client.aborted
+
+    @pytest.mark.parametrize('concurrency', [1, 3])
+    def test_abort_on_failure(self, concurrency):
+        client = _Client(failing_part=2)
+        uploader = S3Uploader(_ObjectStore(client, concurrency), 'test.nt.gz')
+
+        def upload():
+            for number in range(1, 11):
+                uploader.part(f'part {number}'.encode())
+            uploader.complete()
+
+        with pytest.raises(ClientError):
+            upload()
+        # the caller failing the upload as well doesn't abort it again
+        uploader.fail()
+        assert 1 == client.aborted
+        assert client.completed is None
+
+    def test_part_retries(self):
+        client = _Client(failing_part=2, failures=2)
+        uploader = S3Uploader(_ObjectStore(client, 1, part_retries=2), 'test.nt.gz')
+        for number in range(1, 4):
+            uploader.part(f'part {number}'.encode())
+        assert uploader.complete()
+        assert 5 == client.calls
+        assert b'part 2' == client.uploaded[2]
+
+    @pytest.mark.parametrize('concurrency', [1, 3])
+    def test_resume(self, tmp_path, concurrency):
+        client = _Client(failing_part=4, failures=1, md5_etags=True)
+        chunks = [f'part {number}'.encode() for number in range(1, 8)]
+
+        def upload(chunks):
+            object_store = _ObjectStore(client, concurrency, checkpoint_dir=tmp_path)
+            uploader = S3Uploader(object_store, 'test.nt.gz')
+            for chunk in chunks:
+                uploader.part(chunk)
+            return uploader, uploader.complete()
+
+        with pytest.raises(ClientError):
+            upload(chunks)
+        assert not client.aborted
+        checkpoint = UploadCheckpoint(tmp_path, 'test-bucket', 'test.nt.gz')
+        upload_id, e_tags = checkpoint.load()
+        assert client.e_tags == e_tags
+        uploaded = set(client.uploaded)
+        assert 4 not in uploaded
+
+        client.calls = 0
+        chunks[5] = b'part 6 changed'
+        uploader, completed = upload(chunks)
+        assert completed
+        assert upload_id == uploader.id
+        # only the failed, never uploaded and changed parts are uploaded again
+        assert 7 - len(uploaded - {6}) == client.calls
+        assert chunks == [client.uploaded[number] for number in range(1, 8)]
+        assert not checkpoint.path.exists()
+
+    def test_resume_unknown_upload(self, tmp_path):
+        checkpoint = UploadCheckpoint(tmp_path, 'test-bucket', 'test.nt.gz')
+        checkpoint.start('gone')
+
+        class _GoneClient(_Client):
+            def list_parts(self, **kwargs):
+                raise ClientError({'Error': {'Code': 'NoSuchUpload'}}, 'ListParts')
+
+        client = _GoneClient()
+        object_store = _ObjectStore(client, 1, checkpoint_dir=tmp_path)
+        uploader = S3Uploader(object_store, 'test.nt.gz')
+        assert 'gone' != uploader.id
+        uploader.part(b'part 1')
+        assert uploader.complete()
+        assert not checkpoint.path.exists()
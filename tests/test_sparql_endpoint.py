@@ -0,0 +1,167 @@
+import argparse
+import io
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from rdflib import BNode, Literal, URIRef
+
+from ekg_lib.mime import MIME_SPARQLRESULTS_JSON
+from ekg_lib.sparql import SPARQLEndpoint, SPARQLResultsDecoder
+
+
+class _CsvHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    body = b'a,b\r\n1,2\r\n'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/csv')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def local_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _CsvHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+def _endpoint(server, **kwargs):
+    args = argparse.Namespace(
+        verbose=False,
+        data_source_code='test',
+        sparql_endpoint=f'http://127.0.0.1:{server.server_port}',
+        sparql_endpoint_database='test',
+        sparql_endpoint_userid='admin',
+        sparql_endpoint_passwd='admin',
+        **kwargs,
+    )
+    return SPARQLEndpoint(args)
+
+
+@pytest.fixture
+def local_endpoint(local_server):
+    endpoint = _endpoint(local_server)
+    yield endpoint
+    endpoint.close()
+
+
+class TestSPARQLEndpoint:
+    def test_connections_are_reused(self, local_endpoint):
+        for _ in range(3):
+            response = local_endpoint.execute_sparql_query2('SELECT * { ?s ?p ?o }')
+            assert response is not None
+            assert response.read() == _CsvHandler.body
+        stats = local_endpoint.pool_stats()
+        assert stats['requests'] == 3
+        assert stats['connections_opened'] == 1
+        assert stats['connections_reused'] == 2
+        assert stats['in_flight'] == 0
+
+    def test_max_connections_are_not_exceeded(self, local_server):
+        endpoint = _endpoint(local_server, sparql_endpoint_max_connections=1)
+
+        def query():
+            response = endpoint.execute_sparql_query2('SELECT * { ?s ?p ?o }')
+            assert response is not None
+            assert response.read() == _CsvHandler.body
+
+        threads = [threading.Thread(target=query) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = endpoint.pool_stats()
+        endpoint.close()
+        assert stats['requests'] == 4
+        # the requests waited for the one connection rather than opening more
+        assert stats['connections_opened'] == 1
+
+
+_JSON_RESULTS = """{
+  "head": { "vars": [ "s", "label", "n" ] },
+  "results": { "bindings": [
+    { "s": { "type": "uri", "value": "https://ekgf.org/a" },
+      "label": { "type": "literal", "value": "A", "xml:lang": "en" },
+      "n": { "type": "literal", "value": "12345",
+             "datatype": "http://www.w3.org/2001/XMLSchema#integer" } },
+    { "s": { "type": "bnode", "value": "b0" } }
+  ] }
+}"""
+
+
+class TestSPARQLResultsDecoder:
+    def test_json_rows(self, monkeypatch):
+        monkeypatch.setattr('ekg_lib.sparql.results._READ_SIZE', 7)
+        decoder = SPARQLResultsDecoder(
+            io.StringIO(_JSON_RESULTS), 'application/sparql-results+json'
+        )
+        rows = list(decoder)
+        assert decoder.variables == ['s', 'label', 'n']
+        assert rows == [
+            ('https://ekgf.org/a', 'A', '12345'),
+            ('_:b0', None, None),
+        ]
+
+    def test_json_terms(self):
+        decoder = SPARQLResultsDecoder(
+            io.StringIO(_JSON_RESULTS), MIME_SPARQLRESULTS_JSON, as_terms=True
+        )
+        rows = list(decoder)
+        assert rows[0] == (
+            URIRef('https://ekgf.org/a'),
+            Literal('A', lang='en'),
+            Literal(12345),
+        )
+        assert rows[1] == (BNode('b0'), None, None)
+
+    def test_json_boolean(self):
+        decoder = SPARQLResultsDecoder(
+            io.StringIO('{"head": {}, "boolean": true}'), MIME_SPARQLRESULTS_JSON
+        )
+        assert list(decoder) == []
+        assert decoder.boolean is True
+
+    def test_csv_rows(self):
+        body = 's,label\r\nhttps://ekgf.org/a,"multi\nline"\r\n_:b0,\r\n'
+        decoder = SPARQLResultsDecoder(io.StringIO(body, newline=''), 'text/csv')
+        assert list(decoder) == [
+            ('https://ekgf.org/a', 'multi\nline'),
+            ('_:b0', None),
+        ]
+        decoder = SPARQLResultsDecoder(
+            io.StringIO(body, newline=''), 'text/csv', as_terms=True
+        )
+        assert list(decoder) == [
+            (URIRef('https://ekgf.org/a'), Literal('multi\nline')),
+            (BNode('b0'), None),
+        ]
+
+    def test_tsv_rows(self):
+        body = '?s\t?label\t?n\n<https://ekgf.org/a>\t"A\\tB"@en\t42\n'
+        decoder = SPARQLResultsDecoder(io.StringIO(body), 'text/tab-separated-values')
+        assert list(decoder) == [('https://ekgf.org/a', 'A\tB', '42')]
+        assert decoder.variables == ['s', 'label', 'n']
+        decoder = SPARQLResultsDecoder(io.StringIO(body), 'text/tsv', as_terms=True)
+        assert list(decoder) == [
+            (URIRef('https://ekgf.org/a'), Literal('A\tB', lang='en'), Literal(42))
+        ]
+
+    def test_streamed_response(self, local_endpoint):
+        response = local_endpoint.execute_sparql_query2('SELECT * { ?s ?p ?o }')
+        assert list(response.iter_rows()) == [('1', '2')]
+        assert response.variables == ['a', 'b']
+
+    def test_rows_of_read_response(self, local_endpoint):
+        response = local_endpoint.execute_sparql_query2('SELECT * { ?s ?p ?o }')
+        assert response.read() == _CsvHandler.body
+        assert list(response.iter_rows()) == [('1', '2')]
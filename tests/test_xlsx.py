@@ -1,14 +1,19 @@
 import argparse
 import os
 import sys
-from datetime import date
+from datetime import date, datetime
+from decimal import Decimal
 
+import openpyxl
+import numpy as np
+import pandas as pd
 import pytest
-from rdflib import RDF, term, Literal, XSD
+from rdflib import PROV, RDF, Graph, term, Literal, XSD
 
 import ekg_lib
 from ekg_lib.kgiri import set_kgiri_base
 from ekg_lib.string import argv_list
+from ekg_lib.xlsx_parser.convert import ColumnConverter, SheetCell, na_values
 from ekg_lib.xlsx_parser.parser import convert_to_date, main, parse_literal
 
 
@@ -26,6 +31,185 @@ class TestXlsxProcessor:
         assert expected2 == actual2
         assert expected2.datatype == actual2.datatype
 
+    def test_column_converter(self):
+        converter = ColumnConverter(['TBD'], ['x-'])
+        cells = {
+            'Ja': True,
+            'x-No': False,
+            '': None,
+            'TBD': None,
+            'x-TBD': None,
+            'N/A': None,
+            'x-42': 42,
+            '-7': -7,
+            '1.50': Decimal('1.50'),
+            '2019-01-10': date(2019, 1, 10),
+            '10 Jan 2019 12:30': datetime(2019, 1, 10, 12, 30),
+            'hello': 'hello',
+            'x-hello': 'hello',
+            3: 3,
+            2.5: 2.5,
+        }
+        actual = converter.convert(pd.Series([SheetCell(cell) for cell in cells]))
+        for value, expected in zip(actual, cells.values()):
+            if expected is None:
+                assert pd.isna(value)
+            else:
+                assert expected == value
+                assert type(expected) is type(value)
+
+    def test_na_values(self):
+        values = na_values(['999', 'TBD'])
+        assert {'999', '999.0', 999, 'TBD', 'N/A', ''} <= values
+        assert 999.0 in values
+        converter = ColumnConverter(['TBD'], [])
+        actual = converter.convert(pd.Series([SheetCell('TBD'), SheetCell('')]))
+        assert actual.dtype == np.float64
+        assert actual.isna().all()
+
+    def test_xlsx_stream(self, kgiri_base, tmp_path):
+        xlsx_file = tmp_path / 'stream-test.xlsx'
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.title = 'Things'
+        sheet.append(['ID', 'Name', 'Size', 'Since', 'Active'])
+        for number in range(1, 12):
+            if number == 5:
+                sheet.append([])
+                continue
+            sheet.append([
+                f'T{number}',
+                ['alpha', 'beta', 'x-gamma', 'TBD'][number % 4],
+                number * 10,
+                f'2020-01-{number:02}',
+                'Yes' if number % 2 else 'No',
+            ])
+        workbook.save(xlsx_file)
+
+        def parse(output=None):
+            args = argparse.Namespace(
+                input=str(xlsx_file),
+                verbose=False,
+                ignored_values=['TBD'],
+                ignored_prefixes=['x-'],
+                skip_sheets=list(),
+                kgiri_base=kgiri_base,
+                kgiri_prefix='abc',
+                data_source_code='def',
+                key_column_number=1,
+                strip_any_prefix=False,
+                output=output,
+                stream=output is not None,
+                chunk_size=3,
+            )
+            set_kgiri_base(kgiri_base)
+            parser = ekg_lib.XlsxParser(args)
+            if output is None:
+                return parser.g
+            return Graph().parse(output, format='nt')
+
+        def comparable(g):
+            # read_excel turns the sizes into floats because of the empty row
+            activities = set(g.subjects(PROV.used, None))
+            return {
+                (s, p, o)
+                for s, p, o in g
+                if s not in activities
+                and p != ekg_lib.RAW.size
+                and not str(s).endswith(('-size', '-since'))
+            }
+
+        expected = parse()
+        actual = parse(str(tmp_path / 'stream-test.nt'))
+        assert comparable(expected) == comparable(actual)
+        t8 = term.URIRef(f'{kgiri_base}/id/xlsx-file-sheet-things-t8')
+        assert Literal(80.0) == expected.value(t8, ekg_lib.RAW.size)
+        assert Literal(80) == actual.value(t8, ekg_lib.RAW.size)
+        size = term.URIRef(f'{kgiri_base}/id/xlsx-file-sheet-things-column-size')
+        assert Literal(10) == actual.value(size, ekg_lib.RAW.term('count'))
+        assert Literal(61.0) == actual.value(size, ekg_lib.RAW.term('mean'))
+        assert Literal(110.0) == actual.value(size, ekg_lib.RAW.term('max'))
+
+    def test_xlsx_stream_output(self, kgiri_base, tmp_path, capsys, monkeypatch):
+        # the arguments are all given, there is no need for a .env file
+        monkeypatch.setattr(ekg_lib.xlsx_parser.parser, 'load_env', lambda: None)
+        xlsx_file = tmp_path / 'stream-output.xlsx'
+        workbook = openpyxl.Workbook()
+        workbook.active.append(['ID', 'Name'])
+        workbook.active.append(['T1', 'alpha'])
+        workbook.save(xlsx_file)
+        sys.argv = [
+            'pytest',
+            '--input',
+            str(xlsx_file),
+            '--kgiri-base',
+            kgiri_base,
+            '--data-source-code',
+            'def',
+            '--stream',
+            '--output',
+            str(tmp_path / 'stream-output.ttl'),
+        ]
+        with pytest.raises(SystemExit):
+            main()
+        assert 'must end with .nt' in capsys.readouterr().err
+        output = tmp_path / 'stream-output.nt'
+        sys.argv[-1] = str(output)
+        assert main() == 0
+        assert len(Graph().parse(output, format='nt')) > 0
+        # the triples went to the output given at the start, not to another file
+        parser = ekg_lib.XlsxParser(
+            argparse.Namespace(
+                input=str(xlsx_file),
+                verbose=False,
+                kgiri_prefix='abc',
+                key_column_number=1,
+                output=str(output),
+                stream=True,
+            )
+        )
+        assert parser.dump(tmp_path / 'other.nt') == 1
+        assert not (tmp_path / 'other.nt').exists()
+
+    @pytest.mark.parametrize('stream', [False, True])
+    def test_xlsx_max_workers(self, kgiri_base, tmp_path, stream):
+        xlsx_file = tmp_path / 'workers-test.xlsx'
+        workbook = openpyxl.Workbook()
+        workbook.remove(workbook.active)
+        for sheet_number in range(1, 5):
+            sheet = workbook.create_sheet(f'Sheet {sheet_number}')
+            sheet.append(['ID', 'Name', 'Size'])
+            for number in range(1, 6):
+                sheet.append([f'S{sheet_number}-{number}', f'name {number}', number])
+        workbook.save(xlsx_file)
+
+        def parse(max_workers):
+            output = tmp_path / f'workers-test-{max_workers}.nt'
+            args = argparse.Namespace(
+                input=str(xlsx_file),
+                verbose=False,
+                ignored_values=list(),
+                ignored_prefixes=list(),
+                skip_sheets=['Sheet 3'],
+                kgiri_base=kgiri_base,
+                kgiri_prefix='abc',
+                data_source_code='def',
+                key_column_number=1,
+                strip_any_prefix=False,
+                output=str(output) if stream else None,
+                stream=stream,
+                max_workers=max_workers,
+            )
+            set_kgiri_base(kgiri_base)
+            parser = ekg_lib.XlsxParser(args)
+            assert 15 == parser.counter_rows
+            assert 45 == parser.counter_cells
+            g = Graph().parse(output, format='nt') if stream else parser.g
+            activities = set(g.subjects(PROV.used, None))
+            return {(s, p, o) for s, p, o in g if s not in activities}
+
+        assert parse(1) == parse(3)
+
     def test_parse_column_name(self):
         actual = ekg_lib.parse_column_name('Reference ID')
         assert actual is not None